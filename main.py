@@ -6,7 +6,7 @@ from src.avails import const
 from src.configurations import bootup, configure
 from src.core import Dock, acceptor, connectivity, requests
 from src.core.async_runner import AnotherRunner
-from src.managers import profilemanager
+from src.managers import filemanager, profilemanager
 from src.managers.statemanager import State, StateManager
 from src.webpage_handlers import pagehandle
 
@@ -22,6 +22,7 @@ def initial_states():
     s8 = State("initiating comms", acceptor.initiate_acceptor, is_blocking=True)
     s9 = State("initiating requests", requests.initiate, is_blocking=True)
     s10 = State("connectivity checker", connectivity.initiate)
+    s11 = State("restoring transfers", filemanager.initiate_transfer_journal)
 
     return tuple(locals().values())
 
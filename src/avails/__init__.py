@@ -7,3 +7,4 @@ from src.avails import connect as connect
 from src.avails import useables as use
 from src.avails.dialogs import get_dialog_handler
 from src.avails.bases import *
+from src.avails.journal import TransferJournal
@@ -11,6 +11,8 @@ from src.avails import const, useables
 
 _logger = logging.getLogger(__name__)
 
+_HAS_SENDMSG = hasattr(_socket.socket, 'sendmsg')  # not on windows
+
 
 class IPAddress(NamedTuple):
     ip: str
@@ -100,6 +102,67 @@ class Socket(_socket.socket):
     async def arecvfrom(self, buffsize):
         return await self.__loop.sock_recvfrom(self, buffsize)
 
+    def sendmsgall(self, buffers):
+        """Scatter/gather :meth:`sendall`, writes ``buffers`` one after the other without joining them"""
+        if not _HAS_SENDMSG:
+            return self.sendall(b''.join(buffers))
+        views = _byte_views(buffers)
+        while views:
+            views = _advance(views, self.sendmsg(views))
+
+    async def asendmsgall(self, buffers):
+        """Async version of :meth:`sendmsgall`, socket has to be non-blocking"""
+        if not _HAS_SENDMSG:
+            return await self.asendall(b''.join(buffers))
+        views = _byte_views(buffers)
+        while views:
+            try:
+                sent = self.sendmsg(views)
+            except (BlockingIOError, InterruptedError):
+                await self._writable()
+            else:
+                views = _advance(views, sent)
+
+    def sendmsgto(self, buffers, address):
+        """Sends ``buffers`` as a single datagram to ``address`` without joining them"""
+        if not _HAS_SENDMSG:
+            return self.sendto(b''.join(buffers), address)
+        return self.sendmsg(buffers, (), 0, address)
+
+    async def asendmsgto(self, buffers, address):
+        while True:
+            try:
+                return self.sendmsgto(buffers, address)
+            except (BlockingIOError, InterruptedError):
+                await self._writable()
+
+    async def _writable(self):
+        fut = self.__loop.create_future()
+        fd = self.fileno()
+        self.__loop.add_writer(fd, _set_result_unless_done, fut)
+        try:
+            await fut
+        finally:
+            self.__loop.remove_writer(fd)
+
+
+def _set_result_unless_done(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+def _byte_views(buffers):
+    return [view for buf in buffers if (view := memoryview(buf).cast('B'))]
+
+
+def _advance(views, sent):
+    """Drops ``sent`` bytes from the front of ``views``"""
+    for index, view in enumerate(views):
+        if sent < len(view):
+            return [view[sent:], *views[index + 1:]]
+        sent -= len(view)
+    return []
+
 
 class NetworkProtocol(ABC):
     __slots__ = ()
@@ -344,29 +407,82 @@ class ThroughputMixin:
 
 
 class Sender(_PauseMixIn, _ResumeMixIn, ThroughputMixin):
-    __slots__ = ('sock', 'send_func', '_limiter',
+    """
+    Args:
+        sock: socket to send through
+        shaper: optional async callable, awaited with number of bytes before sending them
+            (see :mod:`src.core.bandwidth`)
+    """
+    __slots__ = ('sock', 'send_func', '_limiter', 'shaper',
                  '_bytes_total', '_window_start', 'rate')
 
-    def __init__(self, sock, *args, **kwargs):
+    def __init__(self, sock, *args, shaper=None, **kwargs):
         self.sock = sock
         loop = _asyncio.get_event_loop()
         self.send_func = loop.sock_sendall
         self._limiter = _asyncio.Event()
         self._limiter.set()
+        self.shaper = shaper
         super().__init__(*args, **kwargs)
 
-    async def __call__(self, buf: bytes):
+    async def shape(self, nbytes):
+        """Waits while paused and till bandwidth limits let ``nbytes`` through
+
+        Lets callers keep these waits out of a timeout put on the write itself,
+        write that follows is passed ``shaped=True`` so that it does not wait again
+        """
         await self._limiter.wait()
+        if self.shaper is not None:
+            await self.shaper(nbytes)
+
+    async def __call__(self, buf: bytes, *, shaped=False):
+        if not shaped:
+            await self.shape(len(buf))
         await self.send_func(self.sock, buf)
         return self._update_throughput(len(buf), time.perf_counter())
 
+    async def sendmsg(self, buffers, *, shaped=False):
+        """Sends ``buffers`` one after the other, without joining them if socket can do scatter/gather writes"""
+        nbytes = sum(len(buf) for buf in buffers)
+        if not shaped:
+            await self.shape(nbytes)
+        if isinstance(self.sock, Socket):
+            await self.sock.asendmsgall(buffers)
+        else:
+            await self.send_func(self.sock, b''.join(buffers))
+        return self._update_throughput(nbytes, time.perf_counter())
+
+    async def sendfile(self, file, offset, count, *, shaped=False):
+        """Sends ``count`` bytes of ``file`` starting at ``offset`` using os level zero copy sendfile
+
+        Raises:
+            asyncio.SendfileNotAvailableError: if underlying socket or platform can't do zero copy
+
+        Returns:
+            number of bytes sent
+        """
+        if not isinstance(self.sock, Socket):
+            raise _asyncio.SendfileNotAvailableError(f"not an async socket {self.sock}")
+        if not shaped:
+            await self.shape(count)
+        sent = await self.sock.asendfile(file, offset, count, fallback=False)
+        self._update_throughput(sent, time.perf_counter())
+        return sent
+
 
 class Receiver(_PauseMixIn, _ResumeMixIn, ThroughputMixin):
-    __slots__ = ('sock', 'recv_func', '_limiter',
+    """
+    Args:
+        sock: socket to receive from
+        reader: optional :class:`BufferedReader` of ``sock``, reads go through it (so that bytes it already
+            read ahead are not lost)
+    """
+    __slots__ = ('sock', 'recv_func', '_limiter', 'reader',
                  '_bytes_total', '_window_start', 'rate')
 
-    def __init__(self, sock, *args, **kwargs):
+    def __init__(self, sock, *args, reader=None, **kwargs):
         self.sock = sock
+        self.reader = reader
         loop = _asyncio.get_event_loop()
         self.recv_func = loop.sock_recv
         self._limiter = _asyncio.Event()
@@ -375,10 +491,405 @@ class Receiver(_PauseMixIn, _ResumeMixIn, ThroughputMixin):
 
     async def __call__(self, nbytes: int):
         await self._limiter.wait()
-        data = await self.recv_func(self.sock, nbytes)
+        if self.reader is not None:
+            data = await self.reader.read(nbytes)
+        else:
+            data = await self.recv_func(self.sock, nbytes)
+        self._update_throughput(nbytes, time.perf_counter())
+        return data
+
+    async def recv_into(self, buffer):
+        """Receives directly into ``buffer`` using :meth:`Socket.arecv_into`, may fill it partially
+
+        Returns:
+            number of bytes received, 0 if connection is closed
+        """
+        await self._limiter.wait()
+        if self.reader is not None:
+            nbytes = await self.reader.read_into(buffer)
+        else:
+            nbytes = await self.sock.arecv_into(buffer)
         self._update_throughput(nbytes, time.perf_counter())
+        return nbytes
+
+    async def readexactly(self, nbytes):
+        """Receives exactly ``nbytes``
+
+        Raises:
+            asyncio.IncompleteReadError: if connection got closed before that
+        """
+        if self.reader is not None:
+            await self._limiter.wait()
+            data = await self.reader.readexactly(nbytes)
+            self._update_throughput(nbytes, time.perf_counter())
+            return data
+
+        data = bytearray()
+        while len(data) < nbytes:
+            chunk = await self(nbytes - len(data))
+            if not chunk:
+                raise _asyncio.IncompleteReadError(bytes(data), nbytes)
+            data += chunk
+        return data
+
+
+class BufferedReader:
+    """Reads a stream socket in large blocks into a reusable buffer and hands out exactly what is asked for
+
+    Length prefixes, headers and small messages are served from the buffer instead of a syscall each,
+    reads larger than the buffer go straight to the socket once buffered bytes are drained
+
+    Note:
+        bytes read ahead belong to this reader, anyone reading ``sock`` directly later on loses them,
+        read with ``read_ahead=False`` while the socket can still be handed over to such a reader
+    """
+
+    __slots__ = 'sock', '_buffer', '_view', '_start', '_end', '_loop'
+
+    def __init__(self, sock, buffer_size=const.STREAM_READ_BUFFER_SIZE):
+        self.sock = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._loop = _asyncio.get_event_loop()
+
+    @property
+    def buffered(self):
+        return self._end - self._start
+
+    async def readexactly(self, nbytes, *, read_ahead=True):
+        """Same as ``asyncio.StreamReader.readexactly``
+
+        Args:
+            nbytes(int): number of bytes to read
+            read_ahead(bool): receive more than ``nbytes`` if socket has them
+
+        Raises:
+            asyncio.IncompleteReadError: if connection got closed before ``nbytes`` are read
+        """
+        if self.buffered >= nbytes:
+            return self._take(nbytes)
+
+        if nbytes > len(self._buffer):
+            data = bytearray(nbytes)
+            view = memoryview(data)
+            received = self.buffered
+            view[:received] = self._view[self._start:self._end]
+            self._start = self._end = 0
+            while received < nbytes:
+                got = await self._loop.sock_recv_into(self.sock, view[received:])
+                if not got:
+                    raise _asyncio.IncompleteReadError(bytes(view[:received]), nbytes)
+                received += got
+            return data
+
+        await self._fill(nbytes, read_ahead)
+        return self._take(nbytes)
+
+    async def read(self, nbytes):
+        """Reads at most ``nbytes``, returns b'' if connection is closed"""
+        if not self.buffered:
+            if nbytes >= len(self._buffer):
+                return await self._loop.sock_recv(self.sock, nbytes)
+            try:
+                await self._fill(1, read_ahead=True)
+            except _asyncio.IncompleteReadError:
+                return b''
+        return self._take(min(nbytes, self.buffered))
+
+    async def read_into(self, buffer):
+        """Reads into ``buffer``, may fill it partially
+
+        Returns:
+            number of bytes read, 0 if connection is closed
+        """
+        if not self.buffered:
+            if len(buffer) >= len(self._buffer):
+                return await self._loop.sock_recv_into(self.sock, buffer)
+            try:
+                await self._fill(1, read_ahead=True)
+            except _asyncio.IncompleteReadError:
+                return 0
+        nbytes = min(len(buffer), self.buffered)
+        memoryview(buffer)[:nbytes] = self._view[self._start:self._start + nbytes]
+        self._consume(nbytes)
+        return nbytes
+
+    def _take(self, nbytes):
+        data = bytes(self._view[self._start:self._start + nbytes])
+        self._consume(nbytes)
         return data
 
+    def _consume(self, nbytes):
+        self._start += nbytes
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    async def _fill(self, minimum, read_ahead):
+        """Receives till at least ``minimum`` bytes are buffered, ``minimum`` is at most size of the buffer"""
+        if len(self._buffer) - self._start < minimum:
+            buffered = self.buffered
+            self._view[:buffered] = self._view[self._start:self._end]
+            self._start, self._end = 0, buffered
+
+        while self.buffered < minimum:
+            till = len(self._buffer) if read_ahead else self._start + minimum
+            got = await self._loop.sock_recv_into(self.sock, self._view[self._end:till])
+            if not got:
+                raise _asyncio.IncompleteReadError(bytes(self._view[self._start:self._end]), minimum)
+            self._end += got
+
+    def __repr__(self):
+        return f"<BufferedReader buffered={self.buffered} of {len(self._buffer)} sock={self.sock}>"
+
+
+_STRIPE_HEADER = struct.Struct("!QI")
+_END_OF_STRIPE = 0xFFFF_FFFF_FFFF_FFFF
+
+
+class SocketMultiplexer:
+    """
+    Stripes a single ordered byte stream across several sockets connected to the same peer
+
+    Every send becomes a frame written to whichever socket is free, the other end reads frames
+    concurrently from all of its sockets and hands them out in sequence order::
+
+        ---------------------------------------------------
+        |  SEQ (8 bytes)  |  LEN (4 bytes)  |  PAYLOAD     |
+        ---------------------------------------------------
+
+    Backpressure:
+        * every socket carries at most one in-flight frame, :meth:`send` waits while all of them are busy
+        * a socket's reader stops pulling frames once ``window`` frames are waiting to be consumed,
+          so a slow consumer stalls the tcp windows instead of growing memory
+
+    Closing:
+        :meth:`aclose` writes an end of stripe marker on every socket and waits for the marker from the other end,
+        so no frame is left half read on any socket
+
+    Attributes:
+        sockets(list[Socket]): sockets currently carrying frames, the first one is the one used for handshake
+        window(int): number of out of order frames buffered before readers are paused
+    """
+
+    def __init__(self, sockets=(), *, window=const.MAX_STRIPE_BUFFERING):
+        self.sockets = []
+        self.window = window
+        self._loop = _asyncio.get_event_loop()
+        self._idle = _asyncio.Queue()
+        self._in_flight = set()
+        self._send_seq = 0
+        self._recv_seq = 0
+        self._frames = {}
+        self._frames_changed = _asyncio.Condition()
+        self._readers = {}
+        self._error = None
+        self._left_over = memoryview(b'')
+        for sock in sockets:
+            self.add_socket(sock)
+
+    def add_socket(self, sock):
+        """Starts carrying frames over ``sock`` too, can be called while transfer is in progress"""
+        self.sockets.append(sock)
+        self._idle.put_nowait(sock)
+        self._readers[sock] = self._loop.create_task(self._read_frames(sock))
+
+    async def send(self, buf):
+        if not buf:
+            return
+        sock = await self._idle.get()
+        if sock is None:
+            self._idle.put_nowait(None)  # wake up others waiting
+            raise self._error
+
+        seq = self._send_seq
+        self._send_seq += 1
+        task = self._loop.create_task(self._send_frame(sock, seq, buf))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send_frame(self, sock, seq, buf):
+        try:
+            header = _STRIPE_HEADER.pack(seq, len(buf))
+            if isinstance(sock, Socket):
+                await sock.asendmsgall((header, buf))
+            else:
+                await self._loop.sock_sendall(sock, header)
+                await self._loop.sock_sendall(sock, buf)
+        except OSError as oe:
+            _logger.debug(f"stripe failed {sock}", exc_info=oe)
+            self._error = oe
+            self._idle.put_nowait(None)
+        else:
+            self._idle.put_nowait(sock)
+
+    async def drain(self):
+        """Waits until every frame handed to :meth:`send` is written"""
+        while self._in_flight:
+            await _asyncio.gather(*self._in_flight)
+        if self._error:
+            raise self._error
+
+    async def recv(self, nbytes):
+        if not self._left_over:
+            frame = await self._next_frame()
+            if frame is None:
+                return b''
+            self._left_over = memoryview(frame)
+
+        data = self._left_over[:nbytes]
+        self._left_over = self._left_over[nbytes:]
+        return bytes(data)
+
+    async def recv_into(self, buffer):
+        if not self._left_over:
+            frame = await self._next_frame()
+            if frame is None:
+                return 0
+            self._left_over = memoryview(frame)
+
+        nbytes = min(len(buffer), len(self._left_over))
+        memoryview(buffer)[:nbytes] = self._left_over[:nbytes]
+        self._left_over = self._left_over[nbytes:]
+        return nbytes
+
+    async def _next_frame(self):
+        async with self._frames_changed:
+            await self._frames_changed.wait_for(
+                lambda: self._recv_seq in self._frames or not self._readers
+            )
+            frame = self._frames.pop(self._recv_seq, None)
+            if frame is None:
+                if self._error:
+                    raise self._error
+                return None
+            self._recv_seq += 1
+            self._frames_changed.notify_all()
+            return frame
+
+    async def _read_frames(self, sock):
+        try:
+            while True:
+                seq, length = _STRIPE_HEADER.unpack(await self._recv_exactly(sock, _STRIPE_HEADER.size))
+                if seq == _END_OF_STRIPE:
+                    return
+                payload = await self._recv_exactly(sock, length)
+                async with self._frames_changed:
+                    await self._frames_changed.wait_for(lambda: seq - self._recv_seq < self.window)
+                    self._frames[seq] = payload
+                    self._frames_changed.notify_all()
+        except (OSError, EOFError) as e:
+            self._error = self._error or ConnectionResetError(f"stripe closed: {e}")
+        finally:
+            async with self._frames_changed:
+                del self._readers[sock]
+                self._frames_changed.notify_all()
+
+    async def _recv_exactly(self, sock, nbytes):
+        buffer = bytearray(nbytes)
+        view = memoryview(buffer)
+        received = 0
+        while received < nbytes:
+            got = await self._loop.sock_recv_into(sock, view[received:])
+            if not got:
+                raise _asyncio.IncompleteReadError(bytes(view[:received]), nbytes)
+            received += got
+        return buffer
+
+    async def aclose(self, timeout=const.DEFAULT_TRANSFER_TIMEOUT, *, keep_open=False):
+        """Flushes pending frames, marks end of stripe on every socket and waits for the other end to do the same
+
+        Args:
+            timeout: seconds to wait for end of stripe markers from the other end
+            keep_open(bool): leave sockets open if every one of them ended cleanly, so that they can be reused
+
+        Returns:
+            list of sockets left open
+        """
+        left_open = []
+        try:
+            await self.drain()
+            end_marker = _STRIPE_HEADER.pack(_END_OF_STRIPE, 0)
+            for sock in self.sockets:
+                await self._loop.sock_sendall(sock, end_marker)
+            if self._readers:
+                await _asyncio.wait_for(
+                    _asyncio.gather(*self._readers.values(), return_exceptions=True), timeout
+                )
+            if keep_open and self._error is None:
+                left_open, self.sockets = self.sockets, []
+        finally:
+            self.close()
+        return left_open
+
+    def close(self):
+        for task in (*self._readers.values(), *self._in_flight):
+            task.cancel()
+        for sock in self.sockets:
+            sock.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.aclose()
+        else:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f"<SocketMultiplexer stripes={len(self.sockets)} sent={self._send_seq} received={self._recv_seq}>"
+
+
+class MultiplexedSender(Sender):
+    """Drop in for :class:`Sender` that writes through a :class:`SocketMultiplexer`"""
+    __slots__ = ()
+
+    def __init__(self, multiplexer, *args, **kwargs):
+        super().__init__(multiplexer, *args, **kwargs)
+        self.send_func = multiplexer.send
+
+    async def __call__(self, buf: bytes, *, shaped=False):
+        if not shaped:
+            await self.shape(len(buf))
+        await self.send_func(buf)
+        return self._update_throughput(len(buf), time.perf_counter())
+
+    async def sendmsg(self, buffers, *, shaped=False):
+        # every send is a frame, joined here, header and payload of frames are written without joining
+        return await self(b''.join(buffers), shaped=shaped)
+
+    async def sendfile(self, file, offset, count, *, shaped=False):
+        raise _asyncio.SendfileNotAvailableError("zero copy is not possible over striped connections")
+
+
+class MultiplexedReceiver(Receiver):
+    """Drop in for :class:`Receiver` that reads through a :class:`SocketMultiplexer`"""
+    __slots__ = ()
+
+    def __init__(self, multiplexer, *args, **kwargs):
+        super().__init__(multiplexer, *args, **kwargs)
+        self.recv_func = multiplexer.recv
+
+    async def __call__(self, nbytes: int):
+        await self._limiter.wait()
+        data = await self.recv_func(nbytes)
+        self._update_throughput(len(data), time.perf_counter())
+        return data
+
+    async def recv_into(self, buffer):
+        await self._limiter.wait()
+        nbytes = await self.sock.recv_into(buffer)
+        self._update_throughput(nbytes, time.perf_counter())
+        return nbytes
+
 
 class Connection(NamedTuple):
     """
@@ -403,8 +914,17 @@ class Connection(NamedTuple):
         peer: Any
 
     @staticmethod
-    def create_from(socket, peer):
-        return Connection(socket, Sender(socket), Receiver(socket), peer)
+    def create_from(socket, peer, reader=None):
+        return Connection(socket, Sender(socket), Receiver(socket, reader=reader), peer)
+
+    @staticmethod
+    def create_multiplexed(multiplexer, peer):
+        return Connection(
+            multiplexer.sockets[0],
+            MultiplexedSender(multiplexer),
+            MultiplexedReceiver(multiplexer),
+            peer,
+        )
 
     def __enter__(self):
         return self.socket
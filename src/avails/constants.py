@@ -44,6 +44,7 @@ PATH_PAGE = "../webpage"
 PATH_DOWNLOAD = path.join(path.expanduser("~"), "Downloads")
 PATH_CONFIG = f"..\\configurations\\{DEFAULT_CONFIG_FILE}"
 PATH_LOG_CONFIG = "..\\configurations\\log_config.json"
+PATH_TRANSFER_JOURNAL = "../../transfers.journal"
 
 IP_VERSION = socket.AF_INET6
 USING_IP_V4 = True
@@ -67,19 +68,50 @@ MAX_RETIRES = 7
 MAX_DATAGRAM_RECV_SIZE = 1024 * 256  # 256 KB
 MAX_DATAGRAM_SEND_SIZE = 1024 * 63  # 63 KB
 MAX_OTM_BUFFERING = 20  # 20 chunks
+MAX_FILE_RECV_BUFFERING = 4  # 4 chunks
+MAX_FILE_READ_AHEAD = 4  # 4 chunks
 MAX_CONNECTIONS_BETWEEN_PEERS = 6
+MAX_STRIPES_PER_FILE_TRANSFER = 4  # clamped to MAX_CONNECTIONS_BETWEEN_PEERS
+MAX_STRIPE_BUFFERING = 16  # 16 frames
+MAX_SCHEDULED_FRAME_SIZE = 64 * 1024  # 64 KB, larger frames are fragmented so that others can go in between
+MAX_FRAGMENTED_FRAMES = 3  # frames put back together at once per connection, one per frame priority
+MAX_FRAGMENT_BUFFERING = 16 * 1024 * 1024  # 16 MB, of fragments buffered per connection
+MAX_CONCURRENT_FILE_STREAMS = 3
+FILE_RESUME_BLOCK_SIZE = 1024 * 1024  # 1 MB
+MIN_CHUNK_SIZE = 16 * 1024  # 16 KB
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MB
+CHUNK_SEND_LATENCY_TARGET = 0.1  # seconds
 MAX_TOTAL_CONNECTIONS = 40
 MAX_FRONTEND_MESSAGE_BUFFER_LEN = 1000
 MAX_CONCURRENT_MSG_PROCESSING = 6
+MAX_REQUESTS_QUEUED = 1024  # datagrams waiting to be dispatched, later ones are dropped
+REQUESTS_WORKERS = 4
+REQUESTS_BATCH_SIZE = 64
+STREAM_READ_BUFFER_SIZE = 64 * 1024  # 64 KB, see connect.BufferedReader
 
 GLOBAL_TTL_FOR_GOSSIP = 6
 NODE_POV_GOSSIP_TTL = 3
 DEFAULT_GOSSIP_FANOUT = 5
 TRANSFER_STATUS_UPDATE_FREQ = 10
+TRANSFER_JOURNAL_FLUSH_INTERVAL = 2  # seconds
+TRANSFER_JOURNAL_COMPACT_AFTER = 1000  # lines
+BANDWIDTH_LIMIT_GLOBAL = 0  # KB/s, 0 is unlimited
+BANDWIDTH_LIMIT_PER_PEER = 0  # KB/s, 0 is unlimited
+BANDWIDTH_BURST_TIME = 0.25  # seconds worth of limit that can be sent at once after being idle
 
 PERIODIC_TIMEOUT_TO_ADD_THIS_REMOTE_PEER_TO_LISTS = 7
+PEER_LIST_TTL = 60  # seconds, peers not added to a list again within this are evicted
+PEER_LIST_CACHE_TTL = 300  # seconds, lists read are kept this long (evictions are remembered as long by holders)
+PEER_LIST_PAGE_SIZE = 256  # peers, ~60 bytes each, ~15 KB reply (replies are not capped at 8K like rpc calls)
+MAX_CONCURRENT_SEARCH_CRAWLS = 6  # network lookups in flight for a search
+MAX_SEARCH_RESULTS = 100
+MAX_PEER_LIST_HANDOFFS_QUEUED = 64  # newcomers waiting for lists to be handed over, later ones are left out
+LOOKUP_CACHE_TTL = 30  # seconds, peers found closest to an id are reused this long unless routing table changes
 DEFAULT_TRANSFER_TIMEOUT = 4
 PING_TIMEOUT = 4
+CONNECTION_IDLE_TIMEOUT = 300
+TRANSFER_CONNECTION_IDLE_TIMEOUT = 60  # kept below CONNECTION_IDLE_TIMEOUT, so that the other end is still waiting
+CONNECTION_HEALTH_CHECK_INTERVAL = 15
 PALM_TREE_LINK_TIMEOUT = 3
 DISCOVER_TIMEOUT = 3
 TIMEOUT_TO_WAIT_FOR_MSG_PROCESSING_TASK = 4
@@ -88,9 +120,9 @@ TIMEOUT_TO_WAIT_FOR_MSG_PROCESSING_TASK = 4
 VERSIONS = {
     "GLOBAL": 1.1,
     "RP": 1.0,
-    "FO": 1.0,
-    "DO": 1.0,
-    "WIRE": 1.0,
+    "FO": 1.2,
+    "DO": 1.3,
+    "WIRE": 1.2,
 }
 
 DISCOVER_RETRIES = 2
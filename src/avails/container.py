@@ -1,14 +1,19 @@
 import asyncio
 import contextlib
+import logging
 import socket
+import time
 from collections import OrderedDict, defaultdict
 from itertools import count
 from typing import Iterable, TYPE_CHECKING, Union, ValuesView
 from weakref import WeakSet
 
 import src.avails.connect as connect
+from src.avails import constants as const
 from src.avails.bases import HasID, HasIdProperty, HasPeerId
 
+_logger = logging.getLogger(__name__)
+
 """
 This module contains simple storages used across the peer connect
 1. 
@@ -16,17 +21,35 @@ This module contains simple storages used across the peer connect
 3. SafeSet
 4. FileDict
 5. SocketStore
-6. SocketCache
+6. ConnectionPool
 """
 
 
+_SEARCH_GRAM_SIZE = 3
+
+
+def _grams(text, size=_SEARCH_GRAM_SIZE):
+    """Every substring of ``text`` that is 1 to ``size`` characters long"""
+    return {text[i:i + n] for n in range(1, size + 1) for i in range(len(text) - n + 1)}
+
+
 class PeerDict(dict):
-    __slots__ = '__lock',
+    """Peers keyed with peer id, indexed for searching
+
+    Every 1 to 3 character long substring (n-gram) of username is indexed with peer ids (see :meth:`search`),
+    index is updated incrementally whenever a peer is added or removed
+
+    Note:
+        peers are indexed with username they had while being added, add them again if username changes
+    """
+    __slots__ = '__lock', '_grams', '_indexed'
 
     def __init__(self):
         super().__init__()
         # self.__lock = threading.Lock()
         self.__lock = asyncio.Lock()
+        self._grams = defaultdict(set)
+        self._indexed = {}  # peer id: username as it was indexed
 
     if TYPE_CHECKING:
         from src.avails import RemotePeer
@@ -51,9 +74,61 @@ class PeerDict(dict):
     def peers(self) -> ValuesView[RemotePeer]:
         return self.values()
 
+    def search(self, search_string) -> list[RemotePeer]:
+        """Peers whose username contains ``search_string`` (same as ``RemotePeer.is_relevant``), using n-gram index
+
+        Strings up to 3 characters are looked up directly, longer ones intersect peers of every trigram in them
+        (starting from the rarest) and only those candidates are checked
+        """
+        if not search_string:
+            return list(self.values())
+
+        if len(search_string) <= _SEARCH_GRAM_SIZE:
+            return [self[peer_id] for peer_id in self._grams.get(search_string, ())]
+
+        trigrams = {
+            search_string[i:i + _SEARCH_GRAM_SIZE]
+            for i in range(len(search_string) - _SEARCH_GRAM_SIZE + 1)
+        }
+        posting_sets = sorted((self._grams.get(trigram, set()) for trigram in trigrams), key=len)
+        candidates = posting_sets[0].intersection(*posting_sets[1:])
+        return [
+            self[peer_id] for peer_id in candidates
+            if search_string in self._indexed[peer_id]
+        ]
+
+    def _index(self, peer_id, peer_obj):
+        username = getattr(peer_obj, 'username', None) or ''
+        self._indexed[peer_id] = username
+        for gram in _grams(username):
+            self._grams[gram].add(peer_id)
+
+    def _unindex(self, peer_id):
+        for gram in _grams(self._indexed.pop(peer_id)):
+            peer_ids = self._grams[gram]
+            peer_ids.discard(peer_id)
+            if not peer_ids:
+                del self._grams[gram]
+
+    def __setitem__(self, peer_id, peer_obj):
+        if peer_id in self._indexed:
+            self._unindex(peer_id)
+        super().__setitem__(peer_id, peer_obj)
+        self._index(peer_id, peer_obj)
+
+    def __delitem__(self, peer_id):
+        super().__delitem__(peer_id)
+        self._unindex(peer_id)
+
+    def pop(self, peer_id, *default):
+        if peer_id in self._indexed:
+            self._unindex(peer_id)
+        return super().pop(peer_id, *default)
+
     def clear(self):
-        with self.__lock:
-            self.clear()
+        super().clear()
+        self._grams.clear()
+        self._indexed.clear()
 
     def __str__(self):
         return ', '.join(x.__repr__() for x in self.values())
@@ -149,10 +224,25 @@ class TransfersBookKeeper:
     def current(self):
         return self.__current.values()
 
+    @property
+    def continued_items(self):
+        return self.__continued.items()
+
+    @property
+    def current_items(self):
+        return self.__current.items()
+
     @classmethod
     def get_new_id(cls):
         return str(next(cls._id_counter))
 
+    @classmethod
+    def skip_ids(cls, used_ids):
+        """Makes sure ``get_new_id`` never hands out any of ``used_ids`` (ids of transfers restored from disk)"""
+        used = [int(transfer_id) for transfer_id in used_ids if str(transfer_id).isdigit()]
+        if used:
+            cls._id_counter = count(max(max(used) + 1, next(cls._id_counter)))
+
     def check_running(self, peer_id):
         if running := self._get_running_transfers(peer_id):
             return running[0]
@@ -188,60 +278,155 @@ class SocketStore:
                 sock.close()
 
 
-class SocketCache:
+class _PooledConnection:
+    __slots__ = 'peer_id', 'sock', 'last_used'
+
+    def __init__(self, peer_id, sock, last_used):
+        self.peer_id = peer_id
+        self.sock = sock
+        self.last_used = last_used
+
+
+class ConnectionPool:
     """
-    Maintains a pool of active sockets between peers
+    Pool of connections kept open to peers, shared by everyone talking to that peer
+
+    :meth:`get` is a couple of dict lookups and does not touch the sockets,
+    dead and idle sockets are found by a background task that runs while the pool is entered
+    (``async with pool``), so a socket handed out can still turn out to be broken,
+    users are expected to :meth:`discard` it when that happens
+
+    Limits are kept per peer and in total, least recently used connection is closed to make room for a new one
 
+    Args:
+        per_peer_limit(int): maximum connections kept to a single peer
+        total_limit(int): maximum connections kept
+        idle_timeout(float): seconds after which an unused connection is closed
+        check_interval(float): seconds in between health checks
     """
 
-    def __init__(self, max_limit=4):
-        self.socket_cache: dict[str: connect.Socket] = OrderedDict()
-        self.max_limit = max_limit
+    __slots__ = 'per_peer_limit', 'total_limit', 'idle_timeout', 'check_interval', '_connections', '_peers', '_checker'
+
+    def __init__(
+            self,
+            per_peer_limit=const.MAX_CONNECTIONS_BETWEEN_PEERS,
+            total_limit=const.MAX_TOTAL_CONNECTIONS,
+            idle_timeout=const.CONNECTION_IDLE_TIMEOUT,
+            check_interval=const.CONNECTION_HEALTH_CHECK_INTERVAL,
+    ):
+        self.per_peer_limit = per_peer_limit
+        self.total_limit = total_limit
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._connections: OrderedDict[connect.Socket, _PooledConnection] = OrderedDict()  # least recently used first
+        self._peers: dict[str, OrderedDict[connect.Socket, _PooledConnection]] = {}
+        self._checker = None
+
+    def get(self, peer_id) -> Union[connect.Socket, None]:
+        """Most recently used connection to ``peer_id`` if there is one"""
+        try:
+            connections = self._peers[peer_id]
+        except KeyError:
+            return None
 
-    def add_peer_sock(self, peer_id: str, peer_socket):
-        if len(self.socket_cache) >= self.max_limit:
-            self.socket_cache.popitem(last=False)
-        self.socket_cache[peer_id] = peer_socket
-        return peer_socket
+        sock = next(reversed(connections))
+        if sock.fileno() == -1:  # closed by someone else, no syscall involved
+            self.discard(sock)
+            return self.get(peer_id)
 
-    def get_socket(self, peer_id) -> Union[connect.Socket, None]:
-        sock = self.socket_cache.pop(peer_id, None)
-        if sock:
-            self.socket_cache[peer_id] = sock
+        connections.move_to_end(sock)
+        self._connections.move_to_end(sock)
+        connections[sock].last_used = time.monotonic()
         return sock
 
-    def is_connected(self, peer_id) -> Union[connect.Socket, bool]:
-        try:
-            sock = self.socket_cache[peer_id]
-            if connect.is_socket_connected(sock):
+    def pop(self, peer_id) -> Union[connect.Socket, None]:
+        """Takes most recently used connection to ``peer_id`` out of the pool, for exclusive use"""
+        while connections := self._peers.get(peer_id):
+            sock = next(reversed(connections))
+            self._forget(sock)
+            if sock.fileno() != -1:
                 return sock
-            return False
-        except KeyError:
-            return False
+        return None
 
-    def remove_and_close(self, peer_id):
-        try:
-            sock = self.socket_cache[peer_id]
-            del self.socket_cache[peer_id]
+    def count(self, peer_id):
+        """Number of connections kept to ``peer_id``"""
+        return len(self._peers.get(peer_id, ()))
+
+    def add(self, peer_id, sock):
+        """Adds ``sock`` to the pool, closes least recently used connections if limits are hit"""
+        if sock in self._connections:
+            return sock
+
+        peer_connections = self._peers.get(peer_id, ())
+        while len(peer_connections) >= self.per_peer_limit:
+            self.discard(next(iter(peer_connections)))
+        while len(self._connections) >= self.total_limit:
+            self.discard(next(iter(self._connections)))
+
+        pooled = _PooledConnection(peer_id, sock, time.monotonic())
+        self._peers.setdefault(peer_id, OrderedDict())[sock] = self._connections[sock] = pooled
+        return sock
+
+    def discard(self, sock):
+        """Removes ``sock`` from the pool and closes it"""
+        self._forget(sock)
+        with contextlib.suppress(OSError, socket.error):
             sock.close()
-        except KeyError:
-            return
-        except (OSError, socket.error):
-            del self.socket_cache[peer_id]
+
+    def _forget(self, sock):
+        pooled = self._connections.pop(sock, None)
+        if pooled is not None:
+            connections = self._peers[pooled.peer_id]
+            del connections[sock]
+            if not connections:
+                del self._peers[pooled.peer_id]
+
+    def remove_and_close(self, peer_id):
+        """Closes every connection to ``peer_id``"""
+        for sock in list(self._peers.get(peer_id, ())):
+            self.discard(sock)
+
+    def check(self):
+        """Closes connections that are idle for too long or are not connected anymore
+
+        Returns:
+            number of connections closed
+        """
+        now = time.monotonic()
+        stale = [
+            pooled.sock for pooled in self._connections.values()
+            if now - pooled.last_used > self.idle_timeout or not connect.is_socket_connected(pooled.sock)
+        ]
+        for sock in stale:
+            self.discard(sock)
+        return len(stale)
+
+    async def _check_periodically(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if closed := self.check():
+                _logger.debug(f"closed {closed} idle or broken connection(s), {self}")
 
     def clear(self):
-        self.__close_all_socks()
-        self.socket_cache.clear()
+        for sock in list(self._connections):
+            self.discard(sock)
 
-    def __close_all_socks(self):
-        for sock in list(self.socket_cache.values()):
-            try:
-                sock.close()
-            except Exception:  # noqa
-                pass
+    async def __aenter__(self):
+        self._checker = asyncio.create_task(self._check_periodically(), name="connection pool health checks")
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._checker is not None:
+            self._checker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._checker
+        self.clear()
+
+    def __contains__(self, peer_id: str):
+        return peer_id in self._peers
 
-    def __contains__(self, item: str):
-        return item in self.socket_cache
+    def __len__(self):
+        return len(self._connections)
 
-    def __del__(self):
-        self.__close_all_socks()
+    def __repr__(self):
+        return f"<ConnectionPool connections={len(self._connections)} peers={len(self._peers)}>"
@@ -22,6 +22,10 @@ class TransferRejected(Exception):
     """Data Transfer request was rejected"""
 
 
+class ConnectionQuotaExceeded(ConnectionError):
+    """No more connections can be made to the peer"""
+
+
 class CancelTransfer(Exception):
     """Request to Cancel the transfer"""
 
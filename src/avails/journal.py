@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from src.avails import constants as const
+
+_logger = logging.getLogger(__name__)
+
+
+class TransferJournal:
+    """Append only on-disk journal of transfers, so that unfinished transfers outlive the application
+
+    Every line is a json object, either a snapshot of a transfer::
+
+        {"peer_id": ..., "transfer_id": ..., <whatever the transfer handle wants to persist>}
+
+    or a tombstone ``{"peer_id": ..., "transfer_id": ..., "done": true}`` once that transfer is over,
+    latest line of a transfer wins while replaying
+
+    :meth:`record` and :meth:`forget` only buffer, lines hit the disk in batches when :meth:`flush` is called,
+    repeated snapshots of the same transfer in between flushes are coalesced and unchanged ones are not written again
+    once more than ``compact_after`` lines are written, journal is rewritten with the live transfers only
+
+    Note:
+        :meth:`flush` can be called from another thread (it blocks on disk), only one flusher at a time
+    """
+
+    __slots__ = 'path', 'compact_after', '_pending', '_written', '_lines', '_lock'
+
+    def __init__(self, path, compact_after=const.TRANSFER_JOURNAL_COMPACT_AFTER):
+        self.path = Path(path)
+        self.compact_after = compact_after
+        self._pending = {}  # (peer_id, transfer_id): line waiting to be written
+        self._written = {}  # (peer_id, transfer_id): snapshot of live transfers as they are on disk
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def replay(self):
+        """Reads the journal back
+
+        Lines that fail to parse (application crashed in between of a write) are skipped
+
+        Returns:
+            dict[tuple[str, str], dict]: latest snapshot of every transfer that is not done, keyed with (peer_id, transfer_id)
+        """
+        written = {}
+        lines = 0
+        try:
+            with open(self.path, encoding=const.FORMAT) as journal:
+                for line in journal:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        key = record['peer_id'], record['transfer_id']
+                    except (ValueError, KeyError, TypeError):
+                        _logger.warning(f"skipping a corrupted line in transfer journal: {line[:40]!r}")
+                        continue
+                    if record.get('done'):
+                        written.pop(key, None)
+                    else:
+                        written[key] = record
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self._written = written
+            self._lines = lines
+        return dict(written)
+
+    def record(self, peer_id, transfer_id, snapshot):
+        """Buffers a snapshot of transfer, written on next :meth:`flush`
+
+        Args:
+            peer_id(str): id of the peer transfer is with
+            transfer_id(str): id of the transfer
+            snapshot(dict): json serializable state of the transfer
+        """
+        key = peer_id, transfer_id
+        record = {'peer_id': peer_id, 'transfer_id': transfer_id, **snapshot}
+        with self._lock:
+            if self._written.get(key) == record:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = record
+
+    def forget(self, peer_id, transfer_id):
+        """Marks transfer as done, it is not replayed anymore"""
+        key = peer_id, transfer_id
+        with self._lock:
+            self._pending.pop(key, None)
+            if key in self._written:
+                self._pending[key] = {'peer_id': peer_id, 'transfer_id': transfer_id, 'done': True}
+
+    def flush(self):
+        """Writes buffered lines using a single write, compacts the journal if it grew too long
+
+        Raises:
+            OSError: if writing failed, buffered lines are kept for next flush
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            written = dict(self._written)
+            for key, record in pending.items():
+                if record.get('done'):
+                    written.pop(key, None)
+                else:
+                    written[key] = record
+            compact = self._lines + len(pending) > self.compact_after
+
+        try:
+            if compact:
+                self._rewrite(written.values())
+            else:
+                self._append(pending.values())
+        except OSError:
+            with self._lock:
+                self._pending = pending | self._pending
+            raise
+
+        with self._lock:
+            self._written = written
+            self._lines = len(written) if compact else self._lines + len(pending)
+
+    def _append(self, records):
+        with open(self.path, 'a', encoding=const.FORMAT) as journal:
+            journal.write(''.join(json.dumps(record) + '\n' for record in records))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _rewrite(self, records):
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding=const.FORMAT) as journal:
+            journal.write(''.join(json.dumps(record) + '\n' for record in records))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.path)
+
+    def __repr__(self):
+        return f"<TransferJournal path={self.path} live={len(self._written)} pending={len(self._pending)}>"
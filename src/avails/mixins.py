@@ -1,10 +1,14 @@
 import asyncio
+import inspect
 import itertools
+import logging
 from asyncio import TaskGroup
 from functools import wraps
 from typing import Dict, Type, TypeVar
 
-from src.avails import HasID, use
+from src.avails import HasID, const, use
+
+_logger = logging.getLogger(__name__)
 
 
 class ReplyRegistryMixIn:
@@ -78,6 +82,82 @@ class QueueMixIn:
         return await self._task_group.__aexit__(exc_type, exc_val, exc_tb)
 
 
+class BatchQueueMixIn:
+    """
+        Requires submit method to exist, which can be sync or return an awaitable
+
+        Overrides `__call__` method to put the item into a bounded queue (instead of a task per item like
+        :class:`QueueMixIn`), a few worker coroutines drain that queue in batches and call submit for every item,
+        an item is dropped if the queue is full (meant for datagrams, which can be lost anyway)
+
+        Provides context manager that runs the workers
+
+        Attributes:
+            dropped(int): number of items dropped because queue was full
+    """
+
+    def __init__(
+            self,
+            *args,
+            max_queued=const.MAX_REQUESTS_QUEUED,
+            workers=const.REQUESTS_WORKERS,
+            batch_size=const.REQUESTS_BATCH_SIZE,
+            **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self._queue = asyncio.Queue(max_queued)
+        self._worker_count = workers
+        self._batch_size = batch_size
+        self._task_group = TaskGroup()
+        self._workers = []
+        self.dropped = 0
+
+        if not hasattr(self, 'submit'):
+            raise ValueError("submit method not found")
+
+    def __call__(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped & (self.dropped - 1) == 0:  # powers of two, does not flood the log in a storm
+                _logger.warning(f"{self} queue full, dropped {self.dropped} items so far")
+            return False
+        return True
+
+    async def _work(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            for item in batch:
+                try:
+                    r = self.submit(item)  # noqa
+                    if inspect.isawaitable(r):
+                        await r
+                except Exception as e:
+                    # a worker can't die because of an item
+                    _logger.warning(f"{self}: submit({item}) failed with \n", exc_info=e)
+
+            await asyncio.sleep(0)  # get does not yield while queue has items
+
+    async def __aenter__(self):
+        await self._task_group.__aenter__()
+        self._workers = [self._task_group.create_task(self._work()) for _ in range(self._worker_count)]
+        return self
+
+    def start(self):
+        """A handy way to enter task group context synchronously, Useful in constructors """
+        use.sync(self.__aenter__())
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for worker in self._workers:
+            worker.cancel()
+        return await self._task_group.__aexit__(exc_type, exc_val, exc_tb)
+
+
 T = TypeVar('T')
 
 
@@ -1,6 +1,4 @@
-import umsgpack
-
-from src.avails import const
+from src.avails import const, serializer
 
 
 class RemotePeer:
@@ -84,7 +82,7 @@ class RemotePeer:
 
     @classmethod
     def load_from(cls, data: bytes):
-        list_of_attrs = umsgpack.loads(data)
+        list_of_attrs = serializer.loads(data)
         return cls(*list_of_attrs)
 
     def is_relevant(self, match_string):
@@ -95,7 +93,7 @@ class RemotePeer:
 
     def __bytes__(self):
         list_of_attributes = list(self)
-        return umsgpack.dumps(list_of_attributes)
+        return serializer.dumps(list_of_attributes)
 
     @property
     def peer_id(self):
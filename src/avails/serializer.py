@@ -0,0 +1,38 @@
+"""msgpack serialization used all over the wire formats
+
+Uses C accelerated ``msgpack`` when it is installed and falls back to pure python ``umsgpack`` otherwise,
+both produce the same bytes (strings as str, bytes as bin, floats as double, arrays for lists and tuples),
+so that peers running either backend understand each other
+
+Errors raised while loading are always ``umsgpack.UnpackException``, whatever the backend is
+"""
+
+import umsgpack
+
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+UnpackException = umsgpack.UnpackException
+
+if _msgpack is not None:
+    BACKEND = "msgpack"
+
+    def dumps(obj) -> bytes:
+        # a Packer per call, these are called from disk io threads too
+        return _msgpack.packb(obj, use_bin_type=True, use_single_float=False)
+
+    def loads(data):
+        try:
+            # umsgpack allows any map key
+            return _msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except _msgpack.ExtraData as extra:  # umsgpack ignores trailing bytes
+            return extra.unpacked
+        except (ValueError, _msgpack.UnpackException) as exp:
+            raise UnpackException(str(exp)) from exp
+else:
+    BACKEND = "umsgpack"
+
+    dumps = umsgpack.dumps
+    loads = umsgpack.loads
@@ -8,7 +8,6 @@ import socket
 import struct
 import subprocess
 import sys
-import threading
 import traceback
 import typing
 from pathlib import Path
@@ -65,7 +64,7 @@ async def recv_int(get_bytes: typing.Callable[[int], Awaitable[bytes]], type=SHO
         ValueError : on ConnectionResetError or struct.error
     """
     try:
-        byted_int = await get_bytes(type)
+        byted_int = await recv_exactly(get_bytes, type)
         integer = struct.unpack('!I' if type == SHORT_INT else '!Q', byted_int)[0]
         return integer
     except struct.error as se:
@@ -74,6 +73,30 @@ async def recv_int(get_bytes: typing.Callable[[int], Awaitable[bytes]], type=SHO
         raise ValueError(f"unable to receive integer") from ce
 
 
+async def recv_exactly(get_bytes: typing.Callable[[int], Awaitable[bytes]], length):
+    """Keeps awaiting on ``get_bytes`` until exactly ``length`` bytes are received
+
+    Args:
+        get_bytes (Callable[[int], Awaitable[bytes]]): function to receive bytes from
+        length(int): number of bytes to receive
+
+    Raises:
+        ConnectionResetError: if connection got closed before receiving ``length`` bytes
+    """
+    data = await get_bytes(length)
+    if len(data) == length:  # mostly all of it arrives at once
+        return data
+    if not data:
+        raise ConnectionResetError("connection closed before receiving expected bytes")
+    data = bytearray(data)
+    while len(data) < length:
+        chunk = await get_bytes(length - len(data))
+        if not chunk:
+            raise ConnectionResetError("connection closed before receiving expected bytes")
+        data += chunk
+    return data
+
+
 def get_timeouts(initial=0.001, factor=2, max_retries=const.MAX_RETIRES, max_value=5.0):
     """
     Generate exponential backoff timeout values.
@@ -319,11 +342,7 @@ def spawn_task(func, *args, bookeep=None, done_callback=None, **kwargs):
 
 def search_relevant_peers(peer_list, search_string):
     """
-    Searches for relevant peers based on the search string,
-
-    Uses a copy of the current peer IDs to avoid modification errors.
-    Provides an option to use a lock for safety if the GIL is not guaranteed
-    (e.g., Jython).
+    Searches for relevant peers based on the search string, through username index of ``peer_list``
 
     Args:
         search_string (str): The string to search for relevance.
@@ -331,18 +350,7 @@ def search_relevant_peers(peer_list, search_string):
     Yields:
         list: peers
     """
-    if not hasattr(peer_list, '_gil_safe'):  # Check if GIL safety has been determined
-        peer_list._gil_safe = hasattr(threading, 'get_ident')  # Check for GIL
-
-    peer_ids = list(peer_list.keys())
-
-    for peer_id in peer_ids:
-        try:
-            peer = peer_list[peer_id]  # May raise KeyError if removed concurrently
-        except KeyError:
-            continue  # Skip removed peer
-        if peer.is_relevant(search_string):
-            yield peer
+    yield from peer_list.search(search_string)
 
 
 _AddressFamily = Annotated[AddressFamily, 'v4 or v6 family']
@@ -27,6 +27,12 @@ def set_constants(config_map: configparser.ConfigParser) -> bool:
     const.IP_VERSION = socket.AF_INET6 if config_map['NERD_OPTIONS']['ip_version'] == '6' else socket.AF_INET
 
     const.VERSIONS = {k.upper(): float(v) for k, v in config_map['VERSIONS'].items()}
+    const.BANDWIDTH_LIMIT_GLOBAL = config_map.getfloat(
+        'BANDWIDTH', 'global_limit', fallback=const.BANDWIDTH_LIMIT_GLOBAL
+    )
+    const.BANDWIDTH_LIMIT_PER_PEER = config_map.getfloat(
+        'BANDWIDTH', 'per_peer_limit', fallback=const.BANDWIDTH_LIMIT_PER_PEER
+    )
 
     if const.IP_VERSION == socket.AF_INET6 and not socket.has_ipv6:
         const.IP_VERSION = socket.AF_INET
@@ -72,6 +78,7 @@ def set_paths():
     const.PATH_PAGE = Path(const.PATH_CURRENT, 'src', 'webpage')
     const.PATH_CONFIG = Path(const.PATH_CURRENT, 'src', 'configurations', const.DEFAULT_CONFIG_FILE)
     const.PATH_LOG_CONFIG = Path(const.PATH_CURRENT, 'src', 'configurations', 'log_config.json')
+    const.PATH_TRANSFER_JOURNAL = Path(const.PATH_CURRENT, 'transfers.journal')
     downloads_path = Path(os.path.expanduser('~'), 'Downloads')
     # check if the directory exists
     if not os.path.exists(downloads_path):
@@ -3,6 +3,7 @@ All the stuff related to kademlia goes here
 """
 
 import asyncio
+import time
 from asyncio import CancelledError
 from typing import override
 
@@ -12,8 +13,9 @@ from kademlia.crawling import NodeSpiderCrawl
 from kademlia.protocol import log
 from rpcudp.protocol import RPCProtocol
 
-from src.avails import RemotePeer, const, use
+from src.avails import RemotePeer, const, serializer, use
 from src.avails.bases import BaseDispatcher
+from src.avails.mixins import BatchQueueMixIn
 from src.avails.events import RequestEvent
 from src.core import Dock, get_this_remote_peer, peers
 from src.core.peers import Storage
@@ -64,8 +66,24 @@ class RPCCaller(RPCProtocol):
         result = await self.store_peers_in_list(address, self.source_node.serialized, list_key, peer_list)
         return self.handle_call_response(result, peer_to_ask)
 
-    async def call_find_peer_list(self, peer_to_ask, node_to_find):
+    async def call_find_peer_list(self, peer_to_ask, node_to_find, cursor=None):
+        """``cursor`` is sent only to peers not known to be running previous versions,
+        those have no parameters for it and never reply, they are asked again without it (and remembered)
+        """
         address = peer_to_ask.req_uri
+        if cursor is not None and peer_to_ask.id not in self.cursorless_peers:
+            holder, epoch, version = cursor
+            result = await self.find_list_of_peers(address, self.source_node.serialized, node_to_find.id,
+                                                   holder, epoch, version, const.PEER_LIST_PAGE_SIZE)
+            if result[0]:
+                return self.handle_call_response(result, peer_to_ask)
+
+            result = await self.find_list_of_peers(address, self.source_node.serialized, node_to_find.id)
+            if result[0]:
+                log.debug("%s does not take a cursor, reading whole lists from it", peer_to_ask)
+                self.cursorless_peers.add(peer_to_ask.id)
+            return self.handle_call_response(result, peer_to_ask)
+
         result = await self.find_list_of_peers(address, self.source_node.serialized, node_to_find.id)
         return self.handle_call_response(result, peer_to_ask)
 
@@ -73,6 +91,8 @@ class RPCCaller(RPCProtocol):
         # address = peer_to_ask.network_uri
         result = await self.search_peers(peer_to_ask.req_uri, self.source_node.serialized, search_string)
         self.handle_call_response(result, peer_to_ask)
+        if not result[0]:
+            return []
         return list(map(RemotePeer.load_from, result[1]))
 
 
@@ -106,10 +126,22 @@ class RPCReceiver(RPCProtocol):
             return self.rpc_find_node(sender, sender_peer, key)
         return {'value': value}
 
-    def rpc_find_list_of_peers(self, sender, sender_peer, list_key):
+    def rpc_find_list_of_peers(self, sender, sender_peer, list_key, *cursor):
+        """``cursor`` is (holder id, epoch, version, page size) of a previous read, sent by paginating readers
+        (``peers.PeerListGetter``), they get changes after that version if this node is that holder,
+        whole list is replied to callers that do not send it
+        """
         # caller_peer = self._check_in(sender_peer)
         self._check_in(sender_peer)
-        value = self.storage.get_list_of_peers(list_key)
+        if not cursor:
+            value = self.storage.get_list_of_peers(list_key)
+        else:
+            holder, epoch, version, limit = cursor
+            if holder != self.source_node.id:
+                version = 0
+            value = self.storage.peer_list_changes(list_key, epoch, version, limit)
+            if value is not None:
+                value['holder'] = self.source_node.id
         if value is None:
             return self.rpc_find_node(sender, sender_peer, list_key)
         return {'value': value}
@@ -125,11 +157,73 @@ class RPCReceiver(RPCProtocol):
         return list(map(bytes, relevant_peers))
 
 
+# rpcudp refuses to send a call whose packed [name, args] is larger than this
+_RPC_CALL_LIMIT = 8192
+
+
+def _packed_bin_size(data):
+    size = len(data)
+    return size + (2 if size < 2 ** 8 else 3 if size < 2 ** 16 else 5)  # msgpack bin header
+
+
+def pack_peer_list(peer_list, budget):
+    """Splits serialized peers into batches, packed size of each batch (as msgpack array items) stays within ``budget``
+    """
+    batch, size = [], 0
+    for serialized_peer in peer_list:
+        cost = _packed_bin_size(serialized_peer)
+        if batch and size + cost > budget:
+            yield batch
+            batch, size = [], 0
+        batch.append(serialized_peer)
+        size += cost
+
+    if batch:
+        yield batch
+
+
+class PeerListHandOff(BatchQueueMixIn):
+    """Hands lists held by this node over to peers that joined closer to them
+
+    A single worker sends lists of one newcomer at a time, packed into as few ``store_peers_in_list`` calls as rpcudp
+    allows (see :meth:`KadProtocol.store_call_batches`), every call waits for reply of the previous one, and the rest are given up if newcomer does not reply,
+    newcomers that do not fit in queue are left out (they read lists anyway, and peers add themselves periodically)
+    """
+
+    def __init__(self, kad_protocol):
+        super().__init__(max_queued=const.MAX_PEER_LIST_HANDOFFS_QUEUED, workers=1, batch_size=1)
+        self.kad_protocol = kad_protocol
+
+    async def submit(self, hand_off):
+        peer, lists = hand_off
+        for list_key, peer_list in lists:
+            for batch in self.kad_protocol.store_call_batches(list_key, peer_list):
+                result = await self.kad_protocol.call_store_peers_in_list(peer, list_key, batch)
+                if not result[0]:
+                    log.debug("no response from %s, giving up handing over lists", peer)
+                    return
+
+    def __repr__(self):
+        return f"<PeerListHandOff queued={self._queue.qsize()}>"
+
+
 class KadProtocol(RPCCaller, RPCReceiver, protocol.KademliaProtocol):
     def __init__(self, source_node, storage, ksize):
         super().__init__(source_node, storage, ksize)
         self.router = AnotherRoutingTable(self, ksize, source_node)
         self.storage = storage
+        self.peer_list_handoff = PeerListHandOff(self)
+        self.cursorless_peers = set()  # ids of peers that reply to find_list_of_peers only without a cursor
+        # distances of this node to list ids never change
+        self.list_distances = {
+            list_id: source_node.long_id ^ long_id for list_id, long_id in peers.node_list_long_ids.items()
+        }
+
+    def store_call_batches(self, list_key, peer_list):
+        """``peer_list`` split into batches that fit in a ``store_peers_in_list`` call each"""
+        overhead = len(serializer.dumps(['store_peers_in_list', [self.source_node.serialized, list_key, []]]))
+        # +2, array of peers takes a 3 byte header once it has more than 15 items
+        return pack_peer_list(peer_list, _RPC_CALL_LIMIT - overhead - 2)
 
     def _check_in(self, peer):
         s = RemotePeer.load_from(peer)
@@ -137,18 +231,20 @@ class KadProtocol(RPCCaller, RPCReceiver, protocol.KademliaProtocol):
         return s
 
     def _send_peer_lists(self, peer):
+        lists_to_hand_off = []
         for list_key, peer_list in self.storage.all_peers_in_lists():
-            peer_list = list(peer_list)
             key_node = RemotePeer(list_key)
             neighbors = self.router.find_neighbors(key_node)
             if neighbors:
                 last = neighbors[-1].distance_to(key_node)
                 new_node_close = peer.distance_to(key_node) < last
                 first = neighbors[0].distance_to(key_node)
-                this_closest = self.source_node.distance_to(key_node) < first
+                this_closest = self.list_distances[list_key] < first
             if not neighbors or (new_node_close and this_closest):  # noqa
-                for i in peer_list:
-                    asyncio.create_task(self.call_store_peers_in_list(peer, list_key, [i, ]))
+                lists_to_hand_off.append((list_key, peer_list))
+
+        if lists_to_hand_off:
+            self.peer_list_handoff((peer, lists_to_hand_off))
 
     @override
     def welcome_if_new(self, peer):
@@ -156,16 +252,75 @@ class KadProtocol(RPCCaller, RPCReceiver, protocol.KademliaProtocol):
             self._send_peer_lists(peer)
         super().welcome_if_new(peer)
 
+    @override
+    def datagram_received(self, data, addr):
+        """Same as rpcudp's, except that responses are accepted right away instead of in a task of their own,
+        a task is spawned only for requests (they call rpc_* methods)
+        """
+        if len(data) < 22:
+            log.warning("received datagram too small from %s, ignoring", addr)
+            return
+
+        msg_id = data[1:21]
+        if data[:1] == b"\x00":
+            asyncio.ensure_future(self._accept_request(msg_id, serializer.loads(data[21:]), addr))
+        elif data[:1] == b"\x01":
+            self._accept_response(msg_id, serializer.loads(data[21:]), addr)
+        else:
+            log.debug("Received unknown message from %s, ignoring", addr)
+
+
+class LookupCache:
+    """Peers found closest to an id by crawling the network, kept for ``const.LOOKUP_CACHE_TTL``
+
+    Cleared whenever routing table changes, lookups made after that can end up with different peers
+    """
+    __slots__ = 'entries', 'generation'
+
+    def __init__(self):
+        self.entries = {}  # target id: (found at, peers)
+        self.generation = 0
+
+    def get(self, target_id):
+        entry = self.entries.get(target_id)
+        if entry is None:
+            return None
+        found_at, found_peers = entry
+        if time.monotonic() - found_at > const.LOOKUP_CACHE_TTL:
+            del self.entries[target_id]
+            return None
+        return found_peers
+
+    def put(self, target_id, found_peers, generation):
+        """Remembers ``found_peers`` unless cache got cleared after ``generation`` (when lookup started)"""
+        if generation == self.generation and found_peers:
+            self.entries[target_id] = time.monotonic(), found_peers
+
+    def clear(self):
+        self.entries.clear()
+        self.generation += 1
+
 
 class AnotherRoutingTable(routing.RoutingTable):
+    def __init__(self, protocol, ksize, node):
+        self.lookup_cache = LookupCache()
+        super().__init__(protocol, ksize, node)
+
+    @override
+    def flush(self):
+        super().flush()
+        self.lookup_cache.clear()
+
     @override
     def add_contact(self, peer: RemotePeer):
         super().add_contact(peer)
+        self.lookup_cache.clear()
         peers.new_peer(peer)
 
     @override
     def remove_contact(self, peer: RemotePeer):
         super().remove_contact(peer)
+        self.lookup_cache.clear()
         peers.remove_peer(peer)
 
 
@@ -185,32 +340,46 @@ class PeerServer(network.Server):
 
     def start(self):
         self.protocol = self._create_protocol()
+        self.protocol.peer_list_handoff.start()
         self.refresh_table()
 
-    async def get_list_of_nodes(self, list_key):
+    async def get_peer_list_page(self, list_key, cursor=(None, None, 0)):
+        """Reads a page of changes made to list after ``cursor``, see ``peers.PeerListGetter``
+
+        Returns:
+            dict, see ``peers.PeerListStore.changes_since`` (along with ``holder``), None if no one holds that list
+        """
         peer = RemotePeer(list_key)
-        nearest = self.protocol.router.find_neighbors(peer)
+        # holders found recently are a closer start
+        nearest = self.protocol.router.lookup_cache.get(list_key) or self.protocol.router.find_neighbors(peer)
         if not nearest:
             log.warning("There are no known neighbors to get key %s", list_key)
             return None
-        peer_list_getter = peers.PeerListGetter(self.protocol, node, nearest,
-                                                self.ksize, self.alpha)
-        results = await peer_list_getter.find()
-
-        return [
-            RemotePeer.load_from(peer)
-            for peer_list in results for peer in peer_list
-        ] if results is not None else results
-
-    def _get_closest_list_id(self, node_list_ids: list[bytes]):
-        nearest_list_id = 0
-        prev_closest_xor = 2 ** 160
-        for i in node_list_ids:
-            current_xor = self.node.long_id ^ int(i.hex(), 16)
-            if current_xor < prev_closest_xor:
-                nearest_list_id = i
-                prev_closest_xor = current_xor
-        return nearest_list_id
+        peer_list_getter = peers.PeerListGetter(self.protocol, peer, nearest,
+                                                self.ksize, self.alpha, cursor)
+        return await peer_list_getter.find()
+
+    def _get_closest_list_id(self):
+        return min(self.protocol.list_distances, key=self.protocol.list_distances.get)
+
+    async def lookup(self, target):
+        """Peers closest to ``target`` found by crawling the network, remembered in ``router.lookup_cache``
+
+        Args:
+            target(RemotePeer): node with the id to look for
+        """
+        router = self.protocol.router
+        if (found_peers := router.lookup_cache.get(target.id)) is not None:
+            return found_peers
+
+        nearest = router.find_neighbors(target)
+        if not nearest:
+            return []
+        generation = router.lookup_cache.generation
+        spider = NodeSpiderCrawl(self.protocol, target, nearest, self.ksize, self.alpha)
+        found_peers = await spider.find()
+        router.lookup_cache.put(target.id, found_peers, generation)
+        return found_peers
 
     async def add_this_peer_to_lists(self):
         if self.add_this_peer_task:
@@ -220,7 +389,7 @@ class PeerServer(network.Server):
 
         self.add_this_peer_task = asyncio.current_task()
 
-        closest_list_id = self._get_closest_list_id(peers.node_list_ids)
+        closest_list_id = self._get_closest_list_id()
         await asyncio.sleep(const.DISCOVER_TIMEOUT)
 
         async for _ in use.async_timeouts():
@@ -242,21 +411,14 @@ class PeerServer(network.Server):
         list_key = RemotePeer(list_key_id)
         peer_objs = [bytes(x) for x in peer_objs]
 
-        nearest = self.protocol.router.find_neighbors(list_key)
-        if not nearest:
-            # log.info("There are no known neighbors to set key %s",
-            #          list_key_id.hex())
-            return False
-        spider = crawling.NodeSpiderCrawl(self.protocol, list_key, nearest,
-                                          self.ksize, self.alpha)
-        relevant_peers = await spider.find()
+        relevant_peers = await self.lookup(list_key)
 
         # log.info("setting '%s' on %s", dkey.hex(), list(map(str, relevant_peers)))
         distances = [n.distance_to(list_key) for n in relevant_peers]
         if not distances:
             return False
         biggest = max(distances)
-        if self.node.distance_to(list_key) < biggest:
+        if self.protocol.list_distances[list_key_id] < biggest:
             self.storage.store_peers_in_list(list_key.id, peer_objs)
         results = [self.protocol.call_store_peers_in_list(n, list_key, peer_objs) for n in relevant_peers]
         return any(await asyncio.gather(*results))
@@ -267,16 +429,13 @@ class PeerServer(network.Server):
         Every call to this function not only gathers remote_peer object corresponding to peer_id
         but also updates `Dock.peer_list` cache, by reassigning all the peer objects that go through this network
         crawling process which helps in keeping cache upto date to some extent
+        (lookups made within ``const.LOOKUP_CACHE_TTL`` reuse previous crawl, see :meth:`lookup`)
 
         Args:
             byte_id(bytes): peer id in bytes to perform search
         """
         peer = RemotePeer(byte_id=byte_id)
-        nodes = self.protocol.router.find_neighbors(peer)
-
-        spider = NodeSpiderCrawl(self.protocol, peer, nodes,
-                                 self.ksize, self.alpha)
-        found_peers = await spider.find()
+        found_peers = await self.lookup(peer)
         for peer in found_peers:
             if peer.id == byte_id:
                 return peer
@@ -311,6 +470,7 @@ class PeerServer(network.Server):
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         self.stopping = True
+        await self.protocol.peer_list_handoff.__aexit__(exc_type, exc_val, exc_tb)
         if self.add_this_peer_task:
             self.add_this_peer_task.cancel()
             try:
@@ -6,6 +6,7 @@ lazy loading is used to avoid circular import through initiate_acceptor function
 
 import asyncio
 import logging
+import struct
 import threading
 from asyncio import TaskGroup
 from collections import defaultdict
@@ -14,7 +15,7 @@ from inspect import isawaitable
 from types import ModuleType
 from typing import Callable, Optional, TYPE_CHECKING
 
-from src.avails import (BaseDispatcher, InvalidPacket, Wire, WireData, connect,
+from src.avails import (BaseDispatcher, InvalidPacket, WireData, connect,
                         const, use)
 from src.avails.connect import Connection
 from src.avails.constants import MAX_CONCURRENT_MSG_PROCESSING
@@ -22,7 +23,7 @@ from src.avails.events import ConnectionEvent, StreamDataEvent
 from src.avails.mixins import QueueMixIn, singleton_mixin
 from src.core import DISPATCHS, Dock, peers
 from src.managers.directorymanager import DirConnectionHandler
-from src.managers.filemanager import FileConnectionHandler, OTMConnectionHandler
+from src.managers.filemanager import FileConnectionHandler, FileStripeConnectionHandler, OTMConnectionHandler
 from src.transfers import HEADERS
 from src.webpage_handlers import pagehandle
 
@@ -45,6 +46,7 @@ async def initiate_acceptor():
 
     c_reg_handler = connection_dispatcher.register_handler
     c_reg_handler(HEADERS.CMD_FILE_CONN, FileConnectionHandler())
+    c_reg_handler(HEADERS.CMD_FILE_STRIPE_CONN, FileStripeConnectionHandler())
     c_reg_handler(HEADERS.CMD_RECV_DIR, DirConnectionHandler())
     c_reg_handler(HEADERS.OTM_UPDATE_STREAM_LINK, OTMConnectionHandler())
     c_reg_handler(HEADERS.CMD_BASIC_CONN, data_handler)
@@ -55,6 +57,8 @@ async def initiate_acceptor():
     global connector
     import src.core.connector
     connector = src.core.connector
+    await Dock.exit_stack.enter_async_context(connector.Connector.connections)
+    await Dock.exit_stack.enter_async_context(connector.Connector1().transfer_connections)
     acceptor = Acceptor(connection_disp=connection_dispatcher, finalizer=Dock.finalizing.is_set)
 
     # warning, careful with order
@@ -109,26 +113,80 @@ def ProcessDataHandler(data_dispatcher, finalizer: Callable[[], bool]):
     """
     limiter = asyncio.Semaphore(MAX_CONCURRENT_MSG_PROCESSING)
 
-    async def process_once(event):
+    async def process_once(event, fragments):
         async with limiter:
-            raw_data_len = await use.recv_int(event.connection.recv)
+            # connection's receiver reads through the buffered reader handshake was read with
+            raw_data_len = await use.recv_int(event.connection.recv.readexactly)
             if raw_data_len <= 0:
                 return
 
-            raw_data = await event.connection.recv(raw_data_len)
+            raw_data = await event.connection.recv.readexactly(raw_data_len)
             data = WireData.load_from(raw_data)
+            if data.match_header(HEADERS.CMD_FRAME_FRAGMENT):
+                # see core.connector.FrameScheduler
+                if (frame := fragments.add(data['frame'], data['chunk'], data['last'])) is None:
+                    return
+                data = WireData.load_from(frame)
             print(f"[STREAM DATA] new data {data}")  # debug
             data_event = StreamDataEvent(data, event.connection)
             await asyncio.wait_for(data_dispatcher(data_event), const.TIMEOUT_TO_WAIT_FOR_MSG_PROCESSING_TASK)
 
     async def handler(event: ConnectionEvent):
+        fragments = _Fragments()
         with event.connection:
+            if event.handshake.body.get('fragments'):
+                # other end fragments large frames only once told that we put them back together
+                await event.connection.send(connector.FRAGMENTS_ACK)
             while finalizer():
-                await process_once(event)
+                await process_once(event, fragments)
 
     return handler
 
 
+class _Fragments:
+    """Puts frames fragmented by :class:`core.connector.FrameScheduler` back together
+
+    Bounded with ``const.MAX_FRAGMENTED_FRAMES`` and ``const.MAX_FRAGMENT_BUFFERING``,
+    so that a peer can not make us buffer fragments of frames that never end
+    """
+    __slots__ = 'chunks', 'size'
+
+    def __init__(self):
+        self.chunks = {}  # frame id: chunks received so far
+        self.size = 0
+
+    def add(self, frame, chunk, last):
+        """Buffers ``chunk`` of ``frame``
+
+        Returns:
+            whole frame if ``chunk`` is the ``last`` one, None otherwise
+        Raises:
+            InvalidPacket: if limits are crossed
+        """
+        if frame not in self.chunks and len(self.chunks) >= const.MAX_FRAGMENTED_FRAMES:
+            raise InvalidPacket(f"more than {const.MAX_FRAGMENTED_FRAMES} fragmented frames at once")
+        self.size += len(chunk)
+        if self.size > const.MAX_FRAGMENT_BUFFERING:
+            raise InvalidPacket(f"more than {const.MAX_FRAGMENT_BUFFERING} bytes of fragments buffered")
+        self.chunks.setdefault(frame, []).append(chunk)
+        if not last:
+            return None
+        chunks = self.chunks.pop(frame)
+        whole = b''.join(chunks)
+        self.size -= len(whole)
+        return whole
+
+
+async def _read_frame(reader):
+    size = struct.unpack("!I", await reader.readexactly(4, read_ahead=False))[0]
+    return await reader.readexactly(size, read_ahead=False)
+
+
+def recycle_connection(sock, reader=None):
+    """Hands a connection that is done with its transfer back to the acceptor, see :meth:`Acceptor.recycle_connection`"""
+    Acceptor().recycle_connection(sock, reader)
+
+
 def ConnectionCloseHandler():
     async def handler(event: StreamDataEvent):
         event.connection.socket.close()
@@ -158,6 +216,7 @@ class Acceptor:
         self.back_log = 4
         self.currently_in_connection = defaultdict(int)
         self.max_timeout = 90
+        self._recycled = set()
         _logger.info(f"Initiating Acceptor {self.address}")
         self.connection_dispatcher = connection_disp
 
@@ -220,28 +279,52 @@ class Acceptor:
         )
         return sock
 
-    async def __accept_connection(self, initial_conn):
-        handshake = await self._perform_handshake(initial_conn)
+    def recycle_connection(self, sock, reader=None):
+        """Waits for another handshake on ``sock``, so that the peer can reuse it for its next transfer
+
+        Peer keeps such connections idle for ``const.TRANSFER_CONNECTION_IDLE_TIMEOUT`` (see core.connector.Connector1),
+        they are closed if nothing arrives within ``const.CONNECTION_IDLE_TIMEOUT``
+
+        Args:
+            sock: connection to recycle
+            reader(connect.BufferedReader): reader ``sock`` was read through, bytes it read ahead are not lost
+        """
+        task = asyncio.create_task(
+            self.__accept_connection(sock, recycled=True, reader=reader),
+            name=f"acceptor task for recycled socket: {sock}"
+        )
+        self._recycled.add(task)
+        task.add_done_callback(self._recycled.discard)
+
+    async def __accept_connection(self, initial_conn, recycled=False, reader=None):
+        handshake_timeout = const.CONNECTION_IDLE_TIMEOUT if recycled else const.SERVER_TIMEOUT
+        reader = reader or connect.BufferedReader(initial_conn)
+        handshake = await self._perform_handshake(initial_conn, handshake_timeout, reader)
         if not handshake:
             return
         peer = await peers.get_remote_peer_at_every_cost(handshake.peer_id)
-        conn = Connection.create_from(initial_conn, peer)
-        self._exit_stack.enter_context(initial_conn)
+        conn = Connection.create_from(initial_conn, peer, reader)
+        if not recycled:  # already entered when it first arrived
+            self._exit_stack.enter_context(initial_conn)
         con_event = ConnectionEvent(conn, handshake)
         self.connection_dispatcher(con_event)
 
     @classmethod
-    async def _perform_handshake(cls, initial_conn):
+    async def _perform_handshake(cls, initial_conn, timeout=const.SERVER_TIMEOUT, reader=None):
+        """Reads handshake, through ``reader`` without reading ahead of it
+
+        Handlers of file, stripe and otm connections go on reading the bare socket
+        """
+        reader = reader or connect.BufferedReader(initial_conn)
+        raw_hand_shake = None
         try:
-            raw_hand_shake = await asyncio.wait_for(
-                Wire.receive_async(initial_conn), const.SERVER_TIMEOUT
-            )
+            raw_hand_shake = await asyncio.wait_for(_read_frame(reader), timeout)
             if raw_hand_shake:
                 return WireData.load_from(raw_hand_shake)
         except TimeoutError:
-            _logger.error(f"new connection inactive for {const.SERVER_TIMEOUT}s, closing")
+            _logger.error(f"new connection inactive for {timeout}s, closing")
             initial_conn.close()
-        except OSError:
+        except (OSError, EOFError):
             _logger.error(f"Socket error", exc_info=True)
             initial_conn.close()
         except InvalidPacket:
@@ -1,6 +1,147 @@
+"""
+Bandwidth shaping of bulk transfers
+
+Every bulk sender (file and directory transfers) waits on two token buckets before writing,
+one of the peer it is sending to and one shared by the whole node,
+limits are in KB/s (same as ``connect.ThroughputMixin.rate``), 0 means unlimited, and can be changed at runtime
+
+Interactive traffic (text messages) never waits, but bytes it sends are taken from the node's bucket,
+so that bulk transfers give way to it instead of keeping the uplink full
+
+References:
+    https://en.wikipedia.org/wiki/Token_bucket
+"""
+
+import asyncio
+import logging
+import time
+
+from src.avails import const
+
+_logger = logging.getLogger(__name__)
 
 
 class ConnectionLimiter:
     def __init__(self):
         self.connections = []
 
+
+class TokenBucket:
+    """Token bucket that is allowed to go into debt
+
+    Taking more tokens than there are puts the bucket into debt, and whoever took them waits till that debt
+    is paid back at ``rate`` before sending (see :meth:`take`), a chunk larger than the bucket just waits longer,
+    so that chunk sizes of senders do not need to know about limits
+
+    Attributes:
+        rate(float): bytes per second, 0 is unlimited
+        burst(float): maximum tokens that can be saved up while idle
+    """
+
+    __slots__ = 'rate', 'burst', '_tokens', '_last'
+
+    def __init__(self, rate=0):
+        self.rate = 0
+        self.burst = 0
+        self._tokens = 0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = max(0, rate)
+        self.burst = self.rate * const.BANDWIDTH_BURST_TIME
+        # debt made at the previous rate is not carried over, new limit applies from now on
+        self._tokens = min(max(self._tokens, 0), self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, nbytes):
+        """Takes ``nbytes`` tokens
+
+        Returns:
+            seconds to wait before sending those bytes, 0 if they can be sent right away
+        """
+        if not self.rate:
+            return 0
+        self._refill()
+        self._tokens -= nbytes
+        return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def __repr__(self):
+        return f"<TokenBucket rate={self.rate} tokens={self._tokens:.0f}>"
+
+
+class Shaper:
+    """Awaitable handed over to ``connect.Sender``, waits till every bucket lets ``nbytes`` through
+
+    Waits can be longer than send timeouts, ``connect.Sender.shape`` lets senders keep them out of those
+    """
+
+    __slots__ = 'buckets',
+
+    def __init__(self, *buckets):
+        self.buckets = buckets
+
+    async def __call__(self, nbytes):
+        delay = max(bucket.take(nbytes) for bucket in self.buckets)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def __repr__(self):
+        return f"<Shaper {self.buckets}>"
+
+
+_global_bucket = None
+_peer_buckets: dict[str, TokenBucket] = {}
+
+
+def _get_global_bucket():
+    global _global_bucket
+    if _global_bucket is None:
+        _global_bucket = TokenBucket(const.BANDWIDTH_LIMIT_GLOBAL * const.BYTES_PER_KB)
+    return _global_bucket
+
+
+def _get_peer_bucket(peer_id):
+    if peer_id not in _peer_buckets:
+        _peer_buckets[peer_id] = TokenBucket(const.BANDWIDTH_LIMIT_PER_PEER * const.BYTES_PER_KB)
+    return _peer_buckets[peer_id]
+
+
+def shaper_for(peer_id):
+    """Shaper for bulk data sent to ``peer_id``, follows limits changed after it is made"""
+    return Shaper(_get_peer_bucket(peer_id), _get_global_bucket())
+
+
+def set_limit(limit, peer_id=None):
+    """Changes bandwidth limit, applies to ongoing transfers too
+
+    Args:
+        limit(float): KB/s, 0 for unlimited
+        peer_id(str): peer to limit, whole node if not passed
+    """
+    bucket = _get_global_bucket() if peer_id is None else _get_peer_bucket(peer_id)
+    bucket.set_rate(limit * const.BYTES_PER_KB)
+    _logger.info(f"bandwidth limit of {peer_id or 'node'} set to {limit} KB/s")
+
+
+def get_limits():
+    """
+    Returns:
+        tuple of node's limit and a dict of peer limits (only peers that are limited), in KB/s
+    """
+    peer_limits = {
+        peer_id: bucket.rate / const.BYTES_PER_KB
+        for peer_id, bucket in _peer_buckets.items() if bucket.rate
+    }
+    return _get_global_bucket().rate / const.BYTES_PER_KB, peer_limits
+
+
+def interactive_sent(nbytes):
+    """Accounts ``nbytes`` of interactive traffic, bulk senders wait a little longer for them"""
+    _get_global_bucket().take(nbytes)
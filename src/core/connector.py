@@ -2,51 +2,171 @@
 Closely coupled with core.acceptor
 Works with connecting to other peer
 """
+import asyncio
+import heapq
+import itertools
 import logging
 import textwrap
+from collections import defaultdict
+from enum import IntEnum
 
-from src.avails import RemotePeer, SocketCache, Wire, WireData, connect, const, use
+from src.avails import ConnectionPool, RemotePeer, Wire, WireData, connect, const, use
+from src.avails.exceptions import ConnectionQuotaExceeded
 from src.avails.mixins import singleton_mixin
-from src.core import Dock, get_this_remote_peer
+from src.core import get_this_remote_peer
 from src.transfers import HEADERS
 
 _logger = logging.getLogger(__name__)
 
 
+FRAGMENTS_ACK = b'\x01'  # reply to verification, by peers that put fragmented frames back together
+
+
+class PRIORITY(IntEnum):
+    """Lower goes first"""
+    CONTROL = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+class FrameScheduler:
+    """Writes wire frames of a connection in order of their priority
+
+    Frames are queued and written by a single task, FIFO within the same priority,
+    frames larger than ``const.MAX_SCHEDULED_FRAME_SIZE`` are written as ``HEADERS.CMD_FRAME_FRAGMENT`` frames,
+    so a frame with higher priority waits at most for one fragment that is being written, instead of a whole payload
+
+    Other end puts fragments back together before dispatching (see :func:`core.acceptor.ProcessDataHandler`),
+    with ``fragment_size`` of None frames are written whole, for peers that do not know about fragments
+    """
+
+    __slots__ = 'sock', 'fragment_size', '_queue', '_counter', '_writer'
+
+    def __init__(self, sock, fragment_size=const.MAX_SCHEDULED_FRAME_SIZE):
+        self.sock = sock
+        self.fragment_size = fragment_size
+        self._queue = []  # heap of (priority, sequence, frame, future or None)
+        self._counter = itertools.count()
+        self._writer = None
+
+    async def send(self, data: bytes, priority=PRIORITY.BULK):
+        """Queues ``data`` as a wire frame, returns once it is written
+
+        Raises:
+            OSError: if connection broke before ``data`` is written
+        """
+        done = asyncio.get_running_loop().create_future()
+        sequence = next(self._counter)
+        if self.fragment_size is None or len(data) <= self.fragment_size:
+            heapq.heappush(self._queue, (priority, sequence, data, done))
+        else:
+            offsets = range(0, len(data), self.fragment_size)
+            for offset in offsets:
+                last = offset == offsets[-1]
+                fragment = WireData(
+                    header=HEADERS.CMD_FRAME_FRAGMENT,
+                    frame=sequence,
+                    chunk=data[offset: offset + self.fragment_size],
+                    last=last,
+                )
+                heapq.heappush(self._queue, (priority, next(self._counter), bytes(fragment), done if last else None))
+
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_all())
+        return await done
+
+    async def _write_all(self):
+        while self._queue:
+            *_, frame, done = heapq.heappop(self._queue)
+            try:
+                await Wire.send_async(self.sock, frame)
+            except OSError as exp:
+                self._fail_all(exp, done)
+                return
+            if done is not None and not done.done():
+                done.set_result(None)
+
+    def _fail_all(self, exp, done):
+        waiting = [done, *(item[-1] for item in self._queue)]
+        self._queue.clear()
+        for future in waiting:
+            if future is not None and not future.done():
+                future.set_exception(exp)
+
+    def __repr__(self):
+        return f"<FrameScheduler queued={len(self._queue)} sock={self.sock}>"
+
+
 class Connector:
     _current_connected: connect.Socket
-    connections = SocketCache()
+    connections = ConnectionPool()
+    schedulers: dict[str, FrameScheduler] = {}
+    _learning = set()  # tasks waiting for acknowledgements of fragments, see _learn_fragments
 
     # :todo: make this more advanced such that it can handle multiple requests related to same socket
 
     @classmethod
     async def get_connection(cls, peer_obj: RemotePeer) -> connect.Socket:
         use.echo_print('a connection request made to :', peer_obj.uri)  # debug
-        if sock := Dock.connected_peers.is_connected(peer_obj.peer_id):
-            pr_str = (f"[CONNECTIONS] cache hit !{textwrap.fill(peer_obj.username, width=10)}"
-                      f" and socket is connected"
-                      f"{sock.getpeername()}")
-            _logger.info(pr_str)
+        if sock := cls.connections.get(peer_obj.peer_id):
+            _logger.debug(f"[CONNECTIONS] pool hit !{textwrap.fill(peer_obj.username, width=10)}")
             cls._current_connected = sock
             return sock
         del sock
         peer_sock = await cls._add_connection(peer_obj)
         await cls._verifier(peer_sock)
+        task = asyncio.create_task(cls._learn_fragments(peer_obj.peer_id, peer_sock))
+        cls._learning.add(task)
+        task.add_done_callback(cls._learning.discard)
         _logger.debug(
             ("cache miss --current :",
              f"{textwrap.fill(peer_obj.username, width=10)}",
              f"{peer_sock.getpeername()[:2]}",
              f"{peer_sock.getsockname()[:2]}")
         )
-        Dock.connected_peers.add_peer_sock(peer_obj.peer_id, peer_sock)
         cls._current_connected = peer_sock
         # use.echo_print(f"handle signal to page, that we can't reach {peer_obj.username}, or he is offline")
         return peer_sock
 
+    @classmethod
+    async def send(cls, peer_obj: RemotePeer, data: bytes, priority=PRIORITY.BULK):
+        """Sends ``data`` as a wire frame over the cached connection to ``peer_obj``
+
+        Frames to the same peer are written in order of ``priority``, see :class:`FrameScheduler`
+        """
+        sock = await cls.get_connection(peer_obj)
+        scheduler = cls._scheduler(peer_obj.peer_id, sock)
+        try:
+            return await scheduler.send(data, priority)
+        except OSError:
+            cls.connections.discard(sock)
+            raise
+
+    @classmethod
+    def _scheduler(cls, peer_id, sock):
+        scheduler = cls.schedulers.get(peer_id)
+        if scheduler is None or scheduler.sock is not sock:
+            # frames are fragmented only once other end tells that it puts them back together, see _learn_fragments
+            scheduler = cls.schedulers[peer_id] = FrameScheduler(sock, fragment_size=None)
+        return scheduler
+
+    @classmethod
+    async def _learn_fragments(cls, peer_id, sock):
+        """Waits for other end to acknowledge that it puts fragmented frames back together (replied to verification),
+        peers of previous versions never reply, frames are written whole to them
+        """
+        try:
+            ack = await asyncio.wait_for(sock.arecv(1), const.SERVER_TIMEOUT)
+        except (OSError, TimeoutError):
+            _logger.debug(f"[CONNECTIONS] {peer_id} does not put fragments together, writing frames whole")
+            return
+        if ack == FRAGMENTS_ACK:
+            cls._scheduler(peer_id, sock).fragment_size = const.MAX_SCHEDULED_FRAME_SIZE
+
     @classmethod
     async def _add_connection(cls, peer_obj: RemotePeer) -> connect.Socket:
         connection_socket = await connect.connect_to_peer(peer_obj, timeout=1, retries=3)
-        Dock.connected_peers.add_peer_sock(peer_obj.id, connection_socket)
+        cls.connections.add(peer_obj.peer_id, connection_socket)
         return connection_socket
 
     @classmethod
@@ -54,6 +174,7 @@ class Connector:
         verification_data = WireData(
             header=HEADERS.CMD_BASIC_CONN,
             msg_id=get_this_remote_peer().peer_id,
+            fragments=True,  # asks other end to acknowledge with FRAGMENTS_ACK, if it puts fragments back together
         )
         await Wire.send_async(connection_socket, bytes(verification_data))
         _logger.info(f"Sent verification to {connection_socket.getpeername()}")  # debug
@@ -62,30 +183,76 @@ class Connector:
 
 @singleton_mixin
 class Connector1:
-    __slots__ = ()
+    """Hands out connections to peers, from separate pools for messages and for file transfers
+
+    Message connections are shared by everyone talking to a peer (see :class:`Connector`),
+    file connections are used by one transfer at a time and handed back with :meth:`release_file_conn`,
+    ones that ended cleanly are kept idle for the next transfer to the same peer, so that it skips tcp connect
 
-    msg_connections = {}
-    transfer_connections = {}
+    Connections to a peer (pooled or in use) are capped with ``const.MAX_CONNECTIONS_BETWEEN_PEERS``
+    """
+    __slots__ = ()
 
-    _conn_count = 0
+    msg_connections = Connector.connections
+    transfer_connections = ConnectionPool(idle_timeout=const.TRANSFER_CONNECTION_IDLE_TIMEOUT)
+    _in_use = defaultdict(int)  # peer_id: file connections handed out
 
     async def get_msg_conn(self, peer: RemotePeer):
-        ...
+        return await Connector.get_connection(peer)
+
+    async def get_file_conn(self, peer: RemotePeer, timeout=2, retries=2) -> connect.Socket:
+        """Idle file connection to ``peer`` if there is a live one, a new one otherwise
+
+        Raises:
+            ConnectionQuotaExceeded: if ``const.MAX_CONNECTIONS_BETWEEN_PEERS`` are already made to ``peer``
+            OSError: if connecting failed
+        """
+        while sock := self.transfer_connections.pop(peer.peer_id):
+            if connect.is_socket_connected(sock):
+                self._in_use[peer.peer_id] += 1
+                _logger.debug(f"reusing file connection to {peer}")
+                return sock
+            sock.close()
+
+        if self.max_connections_that_can_be_made(peer) <= 0:
+            raise ConnectionQuotaExceeded(f"{const.MAX_CONNECTIONS_BETWEEN_PEERS} connections already made to {peer}")
 
-    async def get_file_conn(self, peer: RemotePeer):
-        ...
+        self._in_use[peer.peer_id] += 1
+        try:
+            return await connect.connect_to_peer(peer, connect.CONN_URI, timeout=timeout, retries=retries)
+        except OSError:
+            self._put_back_quota(peer.peer_id)
+            raise
 
-    async def max_connections_that_can_be_made(self, peer: RemotePeer):
+    def release_file_conn(self, peer: RemotePeer, sock, reuse=False):
+        """Hands back a connection got from :meth:`get_file_conn`
+
+        Args:
+            peer: peer the connection is made to
+            sock: the connection
+            reuse(bool): keep it for the next transfer, only if the other end is waiting for another handshake on it
+        """
+        self._put_back_quota(peer.peer_id)
+        if reuse and sock.fileno() != -1:
+            self.transfer_connections.add(peer.peer_id, sock)
+        else:
+            sock.close()
+
+    def _put_back_quota(self, peer_id):
+        self._in_use[peer_id] -= 1
+        if self._in_use[peer_id] <= 0:
+            del self._in_use[peer_id]
+
+    def max_connections_that_can_be_made(self, peer: RemotePeer):
         return const.MAX_CONNECTIONS_BETWEEN_PEERS - self.active_connections_count(peer)
 
     def active_connections_count(self, peer: RemotePeer):
-        c = 0
-        if i := self.msg_connections.get(peer, None):
-            c += len(i)
-        if i := self.transfer_connections.get(peer, None):
-            c += len(i)
-        return c
+        return (
+                self.msg_connections.count(peer.peer_id)
+                + self.transfer_connections.count(peer.peer_id)
+                + self._in_use.get(peer.peer_id, 0)
+        )
 
     @property
     def conn_count(self):
-        return self._conn_count
+        return len(self.msg_connections) + len(self.transfer_connections) + sum(self._in_use.values())
@@ -84,15 +84,16 @@ referring 1.3 :
 
 """
 import asyncio
+import functools
 import logging
+import random
 import time
-from collections import defaultdict
 from collections.abc import AsyncIterator
 from typing import Optional, override
 
 from kademlia import crawling, storage
 
-from src.avails import GossipMessage, RemotePeer, use
+from src.avails import GossipMessage, RemotePeer, const, serializer, use
 from src.avails.remotepeer import convert_peer_id_to_byte_id
 from src.avails.useables import get_unique_id
 from src.core import Dock, connectivity, get_gossip, get_this_remote_peer
@@ -124,96 +125,345 @@ node_list_ids = [
     b'\xe6ffffffffffffffffffX',
     b'\xf3333333333333333333$',
 ]
+node_list_long_ids = {list_id: int.from_bytes(list_id) for list_id in node_list_ids}
+
+
+class PeerListStore:
+    """Peers stored in one of ``node_list_ids``, version stamped
+
+    Every change to the list (a peer added, details of a peer changed or a peer evicted) takes the next version,
+    readers keep the version they have read upto and ask only for changes after that (:meth:`changes_since`)
+
+    Peers that are not stored again within ``const.PEER_LIST_TTL`` are evicted, ids of evicted peers are remembered
+    for ``const.PEER_LIST_CACHE_TTL`` so that readers get to know about them, a reader that is behind the ones
+    forgotten reads the list again from scratch
+
+    Versions start again from 0 whenever a list is made again (holder restarted, or list emptied and dropped),
+    ``epoch`` is picked randomly for every list made, readers of some other epoch read it again from scratch
+    """
+    __slots__ = 'epoch', 'version', 'peers', 'evicted', 'forgotten'
+
+    def __init__(self):
+        self.epoch = random.getrandbits(32)
+        self.version = 0
+        self.peers = {}  # peer id: [version, stored at, serialized peer], in order of version
+        self.evicted = {}  # peer id: (version, evicted at), in order of version
+        self.forgotten = 0  # latest version of evicted peers that are forgotten
+
+    def store(self, peer_id, serialized_peer, now):
+        entry = self.peers.get(peer_id)
+        if entry is not None and entry[2] == serialized_peer:
+            entry[1] = now  # same details, only keeps it alive
+            return
+
+        self.peers.pop(peer_id, None)
+        self.evicted.pop(peer_id, None)
+        self.version += 1
+        self.peers[peer_id] = [self.version, now, serialized_peer]
+
+    def evict(self, now):
+        expired = [
+            peer_id for peer_id, (_, stored_at, _) in self.peers.items()
+            if now - stored_at > const.PEER_LIST_TTL
+        ]
+        for peer_id in expired:
+            del self.peers[peer_id]
+            self.version += 1
+            self.evicted[peer_id] = self.version, now
+
+        for peer_id, (version, evicted_at) in list(self.evicted.items()):
+            if now - evicted_at <= const.PEER_LIST_CACHE_TTL:
+                break
+            del self.evicted[peer_id]
+            self.forgotten = version
+
+    def changes_since(self, epoch, version, limit):
+        """Changes made after ``version`` of ``epoch``, ``limit`` peers at most
+
+        Returns:
+            dict of
+                peers: serialized peers added or changed
+                removed: ids of peers evicted
+                version: version these changes are upto, to be passed as ``version`` for next page/changes
+                more: whether there are more changes after this page
+                reset: whether this is read from scratch, and reader should forget what it has
+                epoch: epoch of these versions
+        """
+        reset = epoch != self.epoch or version == 0 or version < self.forgotten or version > self.version
+        if reset:
+            version = 0
+
+        changed = [entry for entry in self.peers.values() if entry[0] > version]
+        more = len(changed) > limit
+        page = changed[:limit]
+        upto = page[-1][0] if more else self.version
+        removed = [] if reset else [
+            peer_id for peer_id, (evicted_version, _) in self.evicted.items()
+            if version < evicted_version <= upto
+        ]
+
+        return {
+            'peers': [serialized_peer for _, _, serialized_peer in page],
+            'removed': removed,
+            'version': upto,
+            'more': more,
+            'reset': reset,
+            'epoch': self.epoch,
+        }
+
+    def __len__(self):
+        return len(self.peers)
 
 
 class Storage(storage.ForgetfulStorage):
-    # :todo: introduce diff based reads
     node_lists_ids = set(node_list_ids)
-    peer_data_storage = defaultdict(set)
+
+    def __init__(self, ttl=604800):
+        super().__init__(ttl)
+        self.peer_lists: dict[bytes, PeerListStore] = {}
+
+    def _get_peer_list(self, list_key):
+        peer_list = self.peer_lists.get(list_key)
+        if peer_list is None:
+            return None
+
+        peer_list.evict(time.monotonic())
+        if not peer_list.peers and not peer_list.evicted:
+            del self.peer_lists[list_key]
+            return None
+
+        return peer_list
 
     def get_list_of_peers(self, list_key):
-        if list_key in self.peer_data_storage:
-            return list(self.peer_data_storage.get(list_key))
+        if peer_list := self._get_peer_list(list_key):
+            return [serialized_peer for _, _, serialized_peer in peer_list.peers.values()]
+
+    def peer_list_changes(self, list_key, epoch, version, limit):
+        """see :meth:`PeerListStore.changes_since`, None if list is not held here"""
+        if (peer_list := self._get_peer_list(list_key)) is None:
+            return None
+        return peer_list.changes_since(epoch, version, min(limit, const.PEER_LIST_PAGE_SIZE))
 
     def all_peers_in_lists(self):
-        return self.peer_data_storage.items()
+        for list_key in list(self.peer_lists):
+            if peers_in_list := self.get_list_of_peers(list_key):
+                yield list_key, peers_in_list
 
     def store_peers_in_list(self, list_key, list_of_peers):
         if list_key not in self.node_lists_ids:
             return False
 
-        # temporary fix
-        filtered_peers = set()
-        for peer in list_of_peers:
-            if isinstance(peer, list):
-                filtered_peers.add(peer[0])
-            else:
-                filtered_peers.add(peer)
-        self.peer_data_storage[list_key] |= filtered_peers
+        try:
+            entries = list(_peer_list_entries(list_of_peers))
+        except (serializer.UnpackException, ValueError, TypeError, LookupError) as exp:
+            _logger.debug(f"rejecting store of malformed peers into list {list_key}", exc_info=exp)
+            return False
+
+        if list_key not in self.peer_lists:
+            self.peer_lists[list_key] = PeerListStore()
+        peer_list = self.peer_lists[list_key]
+
+        now = time.monotonic()
+        for peer_id, peer in entries:
+            peer_list.store(peer_id, peer, now)
+        peer_list.evict(now)
 
         return True
 
 
+def _peer_list_entries(list_of_peers):
+    """Yields (peer id, serialized peer) of peers sent to be stored in a list
+
+    Raises:
+        serializer.UnpackException, ValueError, TypeError, LookupError: if something in there is not a serialized peer
+    """
+    for peer in list_of_peers:
+        # temporary fix
+        if isinstance(peer, list):
+            peer = peer[0]
+        if not isinstance(peer, bytes):
+            raise TypeError(f"expected serialized peer, got {type(peer)}")
+        peer_id = serializer.loads(peer)[0]
+        if not isinstance(peer_id, bytes):
+            raise TypeError(f"expected peer id as bytes, got {type(peer_id)}")
+        yield peer_id, peer
+
+
 class SearchCrawler:
 
     @classmethod
     async def get_relevant_peers_for_list_id(cls, kad_server, list_id):
-        peer = RemotePeer(list_id)
-        nearest = kad_server.protocol.router.find_neighbors(peer)
-        crawler = crawling.NodeSpiderCrawl(
-            kad_server.protocol,
-            peer,
-            nearest,
-            kad_server.ksize,
-            kad_server.alpha
-        )
-        responsible_nodes = await crawler.find()
-        return responsible_nodes
+        return await kad_server.lookup(RemotePeer(list_id))
 
     @classmethod
-    async def search_for_nodes(cls, node_server, search_string):
+    async def search_for_nodes(cls, node_server, search_string, limit=None):
+        """Yields peers relevant to ``search_string``, known ones first and then the ones holders of lists know
+
+        Lists are crawled concurrently, ``const.MAX_CONCURRENT_SEARCH_CRAWLS`` network lookups at a time,
+        peers are yielded as replies arrive and only once each,
+        stops as soon as ``limit`` peers are yielded or when caller stops iterating (pending lookups are cancelled)
+        """
+        seen = set()
         for peer in use.search_relevant_peers(Dock.peer_list, search_string):
+            seen.add(peer.id)
             yield peer
+            if limit and len(seen) >= limit:
+                return
+
+        limiter = asyncio.Semaphore(const.MAX_CONCURRENT_SEARCH_CRAWLS)
+        replies = asyncio.Queue()
+        asked = set()  # a peer can be responsible for more than one list
+        pending = set()
+
+        def collect(task):
+            pending.discard(task)
+            if task.cancelled():
+                return
+            if exp := task.exception():
+                _logger.debug(f"search crawl failed for {search_string}", exc_info=exp)
+                replies.put_nowait(())
+            else:
+                replies.put_nowait(task.result())
+
+        def spawn(coro):
+            task = asyncio.create_task(coro)
+            pending.add(task)
+            task.add_done_callback(collect)
+
+        async def ask(peer):
+            async with limiter:
+                return await node_server.protocol.call_search_peers(peer, search_string)
+
+        async def crawl(list_id):
+            async with limiter:
+                responsible_peers = await cls.get_relevant_peers_for_list_id(node_server, list_id)
+            for peer in responsible_peers:
+                if peer.id not in asked:
+                    asked.add(peer.id)
+                    spawn(ask(peer))
+            return ()
 
-        for list_id in node_list_ids:
-            peers = await cls.get_relevant_peers_for_list_id(node_server, list_id)
-            for peer in peers:
-                _peers = await node_server.protocol.call_search_peers(peer, search_string)
-                yield _peers
+        try:
+            for list_id in node_list_ids:
+                spawn(crawl(list_id))
+
+            while pending or not replies.empty():
+                for peer in await replies.get():
+                    if peer.id in seen:
+                        continue
+                    seen.add(peer.id)
+                    yield peer
+                    if limit and len(seen) >= limit:
+                        return
+        finally:
+            for task in list(pending):
+                task.cancel()
+
+
+class PeerListView:
+    """What is read of one of ``node_list_ids``, kept up to date with changes read from the holder of that list"""
+    __slots__ = 'holder', 'epoch', 'version', 'peers', 'synced_at'
+
+    def __init__(self):
+        self.holder = None
+        self.epoch = None
+        self.version = 0
+        self.peers: dict[bytes, RemotePeer] = {}
+        self.synced_at = 0
+
+    @property
+    def cursor(self):
+        return self.holder, self.epoch, self.version
+
+    def apply(self, page):
+        if page['reset']:
+            self.peers.clear()
+        for peer_id in page['removed']:
+            self.peers.pop(peer_id, None)
+        for serialized_peer in page['peers']:
+            peer = RemotePeer.load_from(serialized_peer)
+            self.peers[peer.id] = peer
+
+        self.holder = page['holder']
+        self.epoch = page['epoch']
+        self.version = page['version']
+        self.synced_at = time.monotonic()
 
 
 class PeerListGetter(crawling.ValueSpiderCrawl):
-    peers_cache = {}
+    """Reads a page of changes of a list from it's holder, after ``cursor`` (holder id, epoch, version) of previous read
+
+    Any node that is not the holder given in cursor replies from scratch
+    """
+    peers_cache: dict[bytes, PeerListView] = {}
     previously_fetched_index = 0
 
+    def __init__(self, protocol, node, peers, ksize, alpha, cursor=(None, None, 0)):
+        super().__init__(protocol, node, peers, ksize, alpha)
+        self.cursor = cursor
+
     async def find(self):
-        return await self._find(self.protocol.call_find_peer_list)
+        return await self._find(functools.partial(self.protocol.call_find_peer_list, cursor=self.cursor))
 
     @override
     async def _handle_found_values(self, values):
+        _logger.debug(f"found values {values}")
+        pages = [self._as_page(value) for value in values]
+        holder = self.cursor[0]
+        page = next((page for page in pages if holder is not None and page['holder'] == holder), pages[0])
+
         peer = self.nearest_without_value.popleft()
-        if peer:
-            _logger.debug(f"found values {values}")
-            await self.protocol.call_store_peers_in_list(peer, self.node.id, values)
-        return values
+        if peer and page['peers']:
+            for batch in self.protocol.store_call_batches(self.node.id, page['peers']):
+                await self.protocol.call_store_peers_in_list(peer, self.node.id, batch)
+        return page
+
+    @staticmethod
+    def _as_page(value):
+        if isinstance(value, dict):
+            return value
+        # peers running previous versions reply with whole list
+        return {
+            'peers': value, 'removed': [], 'version': 0, 'more': False, 'reset': True, 'epoch': None, 'holder': None,
+        }
+
+    @classmethod
+    def _evict_stale_lists(cls):
+        now = time.monotonic()
+        for list_id, view in list(cls.peers_cache.items()):
+            if now - view.synced_at > const.PEER_LIST_CACHE_TTL:
+                del cls.peers_cache[list_id]
 
     @classmethod
     async def get_more_peers(cls, peer_server) -> list[RemotePeer]:
+        """Reads next page of changes of a list (moving on to next list once it is read completely)
+
+        Returns:
+            peers of that list (as far as read)
+        """
         _logger.debug(f"previous index {cls.previously_fetched_index}")
-        if cls.previously_fetched_index >= len(node_list_ids) - 1:
-            cls.previously_fetched_index = 0
+        cls._evict_stale_lists()
 
         find_list_id = node_list_ids[cls.previously_fetched_index]
         _logger.debug(f"looking into {find_list_id}")
-        list_of_peers = await peer_server.get_list_of_nodes(find_list_id)
-        cls.previously_fetched_index += 1
+        view = cls.peers_cache.get(find_list_id) or PeerListView()
+        page = await peer_server.get_peer_list_page(find_list_id, view.cursor)
 
-        if list_of_peers:
-            cls.peers_cache.update({x.peer_id: x for x in list_of_peers})
+        if not page:
+            cls.peers_cache.pop(find_list_id, None)
+            cls._move_to_next_list()
+            return []
 
-            return list(set(list_of_peers))
+        view.apply(page)
+        cls.peers_cache[find_list_id] = view
+        if not page['more']:
+            cls._move_to_next_list()
 
-        return []
+        return list(view.peers.values())
+
+    @classmethod
+    def _move_to_next_list(cls):
+        cls.previously_fetched_index = (cls.previously_fetched_index + 1) % len(node_list_ids)
 
 
 class GossipSearch:
@@ -268,7 +518,7 @@ class GossipSearch:
         gm.id = reply_id
         gm.message = get_this_remote_peer().serialized
         gm.created = time.time()
-        return bytes(gm)
+        return gm.actual_data
 
     @staticmethod
     def _prepare_search_message(find_str):
@@ -307,15 +557,15 @@ async def gossip_search(search_string) -> AsyncIterator[RemotePeer]:
         yield peer
 
 
-def search_for_nodes_with_name(search_string):
+def search_for_nodes_with_name(search_string, limit=None):
     """
     searches for nodes relevant to given ``:param search_string:``
 
     Returns:
-         a generator of peers that matches with the search_string
+         an async generator of peers that matches with the search_string, ``limit`` peers at most
     """
     peer_server = Dock.kademlia_network_server
-    return SearchCrawler.search_for_nodes(peer_server, search_string)
+    return SearchCrawler.search_for_nodes(peer_server, search_string, limit)
 
 
 async def get_remote_peer(peer_id):
@@ -1,14 +1,13 @@
 import asyncio
 import functools
-import inspect
 import logging
 import socket
 
-from src.avails import InvalidPacket, const, unpack_datagram, use
+from src.avails import InvalidPacket, const, note_wire_version, unpack_datagram, use
 from src.avails.bases import BaseDispatcher
 from src.avails.connect import UDPProtocol, ipv4_multicast_socket_helper, ipv6_multicast_socket_helper
 from src.avails.events import RequestEvent
-from src.avails.mixins import QueueMixIn, ReplyRegistryMixIn
+from src.avails.mixins import BatchQueueMixIn, ReplyRegistryMixIn
 from src.core import DISPATCHS, Dock, _kademlia, gossip
 from src.core.discover import discovery_initiate
 from src.managers.statemanager import State
@@ -110,34 +109,49 @@ async def _create_listen_socket(bind_address, multicast_addr):
     return sock
 
 
-class RequestsDispatcher(QueueMixIn, ReplyRegistryMixIn, BaseDispatcher):
+class RequestsDispatcher(BatchQueueMixIn, ReplyRegistryMixIn, BaseDispatcher):
+    """Dispatches datagrams arrived at requests endpoint
+
+    Endpoint only queues raw datagrams, they are unpacked and dispatched in batches
+    by a few workers (see :class:`BatchQueueMixIn`) instead of a task per datagram
+    """
     __slots__ = ()
 
     def __init__(self, transport, stop_flag):
         super().__init__(transport, stop_flag)
 
-    async def submit(self, req_event: RequestEvent):
-        self.msg_arrived(req_event.request)
+    def submit(self, datagram):
+        actual_data, addr = datagram
+        code, stripped_data = actual_data[:1], actual_data[1:]
+        try:
+            req_data = unpack_datagram(stripped_data)
+        except InvalidPacket as ip:
+            _logger.debug(f"error:", exc_info=ip)
+            return
+
+        note_wire_version(addr, req_data.version)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"received: {code} from : {addr}, {req_data.dict=}")
+
+        self.msg_arrived(req_data)
 
         # reply registry and dispatcher's registry are most often mutually exclusive
         # going with try except because the hit rate to the self.registry will be high
         # when compared to reply registry
         try:
-            handler = self.registry[req_event.root_code]
+            handler = self.registry[code]
         except KeyError:
             return
 
-        _logger.debug(f"dispatching request with code: {req_event.root_code} to {handler}")
         # expected type of handlers
-        # 1. Dispatcher objects that are coupled with QueueMixIn (sync)
-        # 2. Dispatcher objects that are not coupled with QueueMixIn (async)
-        # 3. any type of handlers (async)
-
-        try:
-            await f if inspect.isawaitable(f := handler(req_event)) else None
-        except Exception as e:
-            # we can't afford exceptions here as they move into QueueMixIn
-            _logger.warning(f"{handler}({req_event}) failed with \n", exc_info=e)
+        # 1. Dispatcher objects that are coupled with QueueMixIn (sync, gossip and discovery),
+        #    they own the task they spawn, not awaited here so that workers keep draining
+        # 2. plain functions (kademlia), done once they return
+        # 3. any type of handlers (async), awaited by the worker
+        r = handler(RequestEvent(root_code=code, request=req_data, from_addr=addr))
+        if isinstance(r, asyncio.Future):
+            return None
+        return r
 
 
 class RequestsEndPoint(asyncio.DatagramProtocol):
@@ -161,16 +175,7 @@ class RequestsEndPoint(asyncio.DatagramProtocol):
         _logger.info(f"started requests endpoint at {transport.get_extra_info("socket")}")
 
     def datagram_received(self, actual_data, addr):
-        code, stripped_data = actual_data[:1], actual_data[1:]
-        try:
-            req_data = unpack_datagram(stripped_data)
-        except InvalidPacket as ip:
-            _logger.info(f"error:", exc_info=ip)
-            return
-
-        _logger.info(f"received: {code} from : {addr}, {req_data.dict=}")
-        event = RequestEvent(root_code=code, request=req_data, from_addr=addr)
-        self.dispatcher(event)
+        self.dispatcher((actual_data, addr))
 
 
 async def end_requests():
@@ -11,7 +11,8 @@ from pathlib import Path
 from src.avails import TransfersBookKeeper, Wire, WireData, connect, const, get_dialog_handler, use
 from src.avails.events import ConnectionEvent
 from src.avails.exceptions import TransferRejected
-from src.core import Dock, get_this_remote_peer
+from src.core import Dock, bandwidth, get_this_remote_peer
+from src.core.connector import Connector1
 from src.core.handles import TaskHandle
 from src.transfers import HEADERS
 from src.transfers.files import DirReceiver, DirSender, rename_directory_with_increment
@@ -33,23 +34,17 @@ async def send_directory(remote_peer, dir_path):
     transfer_id = transfers_book.get_new_id()
     dir_recv_signal_packet = WireData(
         header=HEADERS.CMD_RECV_DIR,
+        version=DirSender.version,
         peer_id=get_this_remote_peer().peer_id,
         transfer_id=transfer_id,
         dir_name=dir_path.name,
     )
-    # from src.core.connections import Connector
-    # connection = await Connector.get_connection(remote_peer)
-
-    connection = await connect.connect_to_peer(
-        remote_peer,
-        to_which=connect.CONN_URI,
-        timeout=1,
-        retries=3
-    )
+    connector = Connector1()
+    connection = await connector.get_file_conn(remote_peer, timeout=1, retries=3)
 
-    with connection:
+    try:
         await Wire.send_async(connection, bytes(dir_recv_signal_packet))
-        await _get_confirmation(connection)
+        confirmation = await _get_confirmation(connection)
 
         status_mixin = StatusMixIn(const.TRANSFER_STATUS_UPDATE_FREQ)
         sender = DirSender(
@@ -58,7 +53,13 @@ async def send_directory(remote_peer, dir_path):
             dir_path,
             status_mixin,
         )
-        sender.connection_made(connect.Sender(connection),connect.Receiver(connection))
+        sender.peer_version = DirSender.version_of_confirmation(confirmation)
+        if sender.peer_version < DirSender.version:
+            _logger.info(f"{remote_peer} runs a previous version of directory transfers, sending files one by one")
+        sender.connection_made(
+            connect.Sender(connection, shaper=bandwidth.shaper_for(remote_peer.peer_id)),
+            connect.Receiver(connection),
+        )
         _logger.info(f"sending directory: {dir_path} to {remote_peer}")
         yield_decision = status_mixin.should_yield
         async with aclosing(sender.send_files()) as s:
@@ -71,6 +72,9 @@ async def send_directory(remote_peer, dir_path):
                     )
         status_mixin.close()
         _logger.info(f"completed sending directory {dir_path} to {remote_peer}")
+    finally:
+        # directory receivers close the connection once done
+        connector.release_file_conn(remote_peer, connection)
 
 
 async def _get_confirmation(connection):
@@ -80,6 +84,7 @@ async def _get_confirmation(connection):
         if confirmation == b'\x00':
             _logger.info("not sending directory, other end rejected")
             raise TransferRejected()
+        return confirmation
     except asyncio.TimeoutError:
         _logger.info(f"not sending directory, did not receive confirmation within {timeout} seconds")
         raise
@@ -115,10 +120,14 @@ def DirConnectionHandler():
             dir_path,
             status_iter,
         )
+        # senders of previous versions send only PATH and FILE records (no manifest, so no totals to report)
+        version = event.handshake.version
+        receiver.peer_version = version if isinstance(version, (int, float)) else 0
+        reports_totals = receiver.peer_version >= DirReceiver.version
         receiver.connection_made(connection.send, connection.recv)
         try:
             with connection:
-                await connection.send(b'\x01')  # :todo: get confirmation from user
+                await connection.send(DirReceiver.confirmation())  # :todo: get confirmation from user
                 transfers_book.add_to_current(transfer_id, receiver)
                 _logger.info(
                     f"receiving directory from {peer}, saving at {use.shorten_path(dir_path, 40)}"
@@ -130,7 +139,8 @@ def DirConnectionHandler():
                             await webpage.transfer_update(
                                 peer.peer_id,
                                 transfer_id,
-                                receiver.current_file
+                                receiver.current_file,
+                                (receiver.received_size, receiver.expected_size) if reports_totals else None,
                             )
                 _logger.info(f"directory received from {peer}")
                 transfers_book.add_to_completed(transfer_id, receiver)
@@ -1,23 +1,32 @@
 import asyncio
+import itertools
 import logging
 import socket
 import traceback
-from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+from contextlib import AsyncExitStack, ExitStack, aclosing, asynccontextmanager
 from pathlib import Path
 
-from src.avails import OTMInformResponse, OTMSession, RemotePeer, TransfersBookKeeper, Wire, WireData, connect, \
-    const, get_dialog_handler
+from src.avails import OTMInformResponse, OTMSession, RemotePeer, TransferJournal, TransfersBookKeeper, Wire, \
+    WireData, connect, const, get_dialog_handler
 from src.avails.events import ConnectionEvent
 from src.avails.exceptions import TransferIncomplete, TransferRejected
-from src.core import Dock, get_this_remote_peer, peers
+from src.core import Dock, bandwidth, get_this_remote_peer, peers
+from src.core.connector import Connector1
 from src.transfers import HEADERS, TransferState, files, otm
 from src.transfers.status import StatusMixIn
 from src.webpage_handlers import webpage
 
 transfers_book = TransfersBookKeeper()
+transfers_journal: TransferJournal | None = None  # set up by initiate_transfer_journal
 
 _logger = logging.getLogger(__name__)
 
+# bytes file receivers accept a connection with, b'\x00' rejects it
+# receivers of previous versions accept only with _ACCEPTED, they neither reuse connections nor take part in delta resume
+_ACCEPTED = b'\x01'
+_ACCEPTED_REUSE = b'\x02'  # waits for another handshake on the connection once done, delta resume
+_ACCEPTED_DELTA = b'\x03'  # delta resume
+
 
 @asynccontextmanager
 async def send_files_to_peer(peer_id, selected_files):
@@ -37,11 +46,42 @@ async def send_files_to_peer(peer_id, selected_files):
         file_sender_handle.attach_files(selected_files)
         return
 
-    file_sender, status_updater = await _send_setup(peer_id, selected_files)
+    file_sender, _ = await _send_setup(peer_id, selected_files)
+    async with _run_sender(file_sender, peer_id) as file_sender:
+        yield file_sender
+
+
+@asynccontextmanager
+async def continue_files_to_peer(peer_id, transfer_id):
+    """Continues a paused transfer to peer with ``peer_id``, which can also be the one restored from journal
+
+    Args:
+        peer_id(str): id of peer the transfer was with
+        transfer_id(str): id of the paused transfer
+
+    Yields:
+        files.Sender object
+    """
+    file_sender = transfers_book.get_transfer(peer_id, transfer_id)
+    if not isinstance(file_sender, files.Sender) or file_sender.state is not TransferState.PAUSED:
+        raise ValueError(f"paused transfer {transfer_id} not found")
+
+    file_sender.peer_obj = await peers.get_remote_peer_at_every_cost(peer_id)
+    if file_sender.peer_obj is None:
+        raise ValueError(f"cannot find remote peer object for given id {peer_id}")
+
+    transfers_book.add_to_current(peer_id, file_sender)
+    async with _run_sender(file_sender, peer_id, continuing=True) as file_sender:
+        yield file_sender
+
+
+@asynccontextmanager
+async def _run_sender(file_sender, peer_id, *, continuing=False):
+    status_updater = file_sender.status_updater
     yield_decision = status_updater.should_yield
 
     try:
-        async with _handle_sending(file_sender, peer_id) as sender:
+        async with _handle_sending(file_sender, peer_id, continuing=continuing) as sender:
             yield file_sender
 
             async for _ in sender:
@@ -70,15 +110,16 @@ async def _send_setup(peer_id, selected_files):
 
 
 @asynccontextmanager
-async def _handle_sending(file_sender, peer_id):
+async def _handle_sending(file_sender, peer_id, *, continuing=False):
     async with AsyncExitStack() as stack:
         try:
             may_be_confirmed = True
-            await stack.enter_async_context(prepare_connection(file_sender))
-            accepted = await asyncio.wait_for(file_sender.recv_func(1), const.DEFAULT_TRANSFER_TIMEOUT)
+            *_, accepted = await stack.enter_async_context(prepare_connection(file_sender))
             print(f"{accepted=}")
             if accepted == b'\x00':
                 may_be_confirmed = False
+            # resuming from block digests only if other end knows about it, otherwise only the offset is exchanged
+            file_sender.delta_resume = accepted in (_ACCEPTED_REUSE, _ACCEPTED_DELTA)
         except OSError as oe:  # unable to connect
             if const.debug:
                 traceback.print_exc()
@@ -90,49 +131,223 @@ async def _handle_sending(file_sender, peer_id):
         if may_be_confirmed is False:
             raise TransferRejected
 
-        yield await stack.enter_async_context(aclosing(file_sender.send_files()))
+        await _open_streams(stack, file_sender)
+        if continuing:
+            yield await stack.enter_async_context(aclosing(file_sender.continue_transfer()))
+        else:
+            yield await stack.enter_async_context(aclosing(file_sender.send_files()))
+
+
+async def _open_streams(stack, file_sender):
+    """Opens more connections to the peer so that files of ``file_sender`` are sent concurrently
+
+    Each connection is a separate file transfer for the other end (sharing the same transfer id),
+    connections that fail to open or are not accepted are skipped,
+    transfer continues with whatever got connected (see :meth:`files.Sender.stream_made`)
+    """
+    for index in range(1, min(file_sender.max_streams, len(file_sender.file_list))):
+        try:
+            send_func, recv_func, accepted = await stack.enter_async_context(prepare_connection(file_sender, index))
+        except (OSError, TimeoutError) as e:
+            _logger.warning(f"continuing with {index} streams", exc_info=e, extra={'id': file_sender.id})
+            break
+        if accepted in (_ACCEPTED, _ACCEPTED_REUSE, _ACCEPTED_DELTA):
+            file_sender.stream_made(send_func, recv_func)
 
 
 @asynccontextmanager
-async def prepare_connection(sender_handle):
-    _logger.debug(f"changing state to connection")  # debug
-    sender_handle.state = TransferState.CONNECTING
+async def prepare_connection(sender_handle, stream=0):
+    """Connects to the peer for ``sender_handle`` and waits for the other end to accept
+
+    Connections are taken from :class:`Connector1`, and handed back to it once done,
+    ones that carried the transfer to completion are kept for the next transfer if the other end accepted with
+    ``_ACCEPTED_REUSE`` (it waits for another handshake on them, see :func:`FileConnectionHandler`)
+
+    Args:
+        sender_handle(files.Sender): transfer to connect for
+        stream(int): index of this connection among the concurrent streams of the transfer,
+            only the main connection (0) is striped and handed over to ``sender_handle.connection_made``
+
+    Yields:
+        send and receive functions of the connection, and the byte other end replied with (``b'\\x00'`` is a reject)
+    """
+    if stream == 0:
+        _logger.debug(f"changing state to connection")  # debug
+        sender_handle.state = TransferState.CONNECTING
+    connector = Connector1()
+    peer = sender_handle.peer_obj
     try:
-        with await connect.connect_to_peer(
-                sender_handle.peer_obj,
-                connect.CONN_URI,
-                timeout=2,
-                retries=2,
-        ) as connection:
+        connection = await connector.get_file_conn(peer)
+        opened = [connection]
+        left_open = []
+        multiplexer = None
+        try:
             connection.setsockopt(socket.SOL_SOCKET, socket.TCP_NODELAY, 1)
+            stripes = 1
+            if stream == 0:
+                stripes = max(1, min(
+                    const.MAX_STRIPES_PER_FILE_TRANSFER,
+                    connector.max_connections_that_can_be_made(peer) + 1,
+                ))
             handshake = WireData(
                 header=HEADERS.CMD_FILE_CONN,
                 version=sender_handle.version,
                 file_id=sender_handle.id,
+                stripes=stripes,
+                stream=stream,
+                reuse=True,
                 peer_id=get_this_remote_peer().peer_id,
             )
 
             await Wire.send_async(connection, bytes(handshake))
             _logger.debug("authorization header sent for file connection", extra={'id': sender_handle.id})
 
-            send_func = connect.Sender(connection)
-            recv_func = connect.Receiver(connection)
-            sender_handle.connection_made(send_func, recv_func)
+            shaper = bandwidth.shaper_for(peer.peer_id)
+            if stripes > 1:
+                multiplexer = await _open_stripes(sender_handle, connection, stripes)
+                opened = list(multiplexer.sockets)
+                send_func = connect.MultiplexedSender(multiplexer, shaper=shaper)
+                recv_func = connect.MultiplexedReceiver(multiplexer)
+            else:
+                send_func = connect.Sender(connection, shaper=shaper)
+                recv_func = connect.Receiver(connection)
+            if stream == 0:
+                sender_handle.connection_made(send_func, recv_func)
             _logger.debug(f"connection established")
-            yield
+
+            accepted = await asyncio.wait_for(recv_func(1), const.DEFAULT_TRANSFER_TIMEOUT)
+            yield send_func, recv_func, accepted
+
+            reuse = accepted == _ACCEPTED_REUSE and sender_handle.state == TransferState.COMPLETED
+            if multiplexer:
+                left_open = await multiplexer.aclose(keep_open=reuse)
+            elif reuse:
+                left_open = opened
+        finally:
+            if multiplexer:
+                multiplexer.close()
+            for sock in opened:
+                connector.release_file_conn(peer, sock, reuse=sock in left_open)
     except OSError as oops:
-        if not sender_handle.state == TransferState.PAUSED:
+        if stream == 0 and not sender_handle.state == TransferState.PAUSED:
             _logger.warning(f"reverting state to PREPARING, failed to connect to peer",
                             exc_info=oops)
             sender_handle.state = TransferState.PREPARING
         raise
 
 
+async def _open_stripes(sender_handle, connection, stripes):
+    """Opens ``stripes - 1`` more connections to the peer and stripes the transfer over all of them
+
+    Connections that fail to open are skipped, transfer continues with whatever got connected,
+    other end attaches them to the transfer as they arrive (see :func:`FileStripeConnectionHandler`)
+
+    Returns:
+        connect.SocketMultiplexer wrapping ``connection`` and the newly opened ones
+    """
+
+    connector = Connector1()
+
+    async def open_stripe(index):
+        sock = await connector.get_file_conn(sender_handle.peer_obj)
+        stripe_handshake = WireData(
+            header=HEADERS.CMD_FILE_STRIPE_CONN,
+            file_id=sender_handle.id,
+            stripe=index,
+            peer_id=get_this_remote_peer().peer_id,
+        )
+        try:
+            await Wire.send_async(sock, bytes(stripe_handshake))
+        except OSError:
+            connector.release_file_conn(sender_handle.peer_obj, sock)
+            raise
+        return sock
+
+    opened = await asyncio.gather(*(open_stripe(i) for i in range(1, stripes)), return_exceptions=True)
+    sockets = [connection]
+    for sock in opened:
+        if isinstance(sock, Exception):
+            _logger.warning(f"failed to open a stripe, continuing with {len(sockets)}", exc_info=sock)
+            continue
+        sockets.append(sock)
+
+    _logger.debug(f"striping file transfer over {len(sockets)} connections", extra={'id': sender_handle.id})
+    return connect.SocketMultiplexer(sockets)
+
+
 async def _send_finalize(file_sender, peer_id):
     if file_sender.state in (TransferState.COMPLETED, TransferState.ABORTING):
         transfers_book.add_to_completed(peer_id, file_sender)
+        if transfers_journal:
+            transfers_journal.forget(peer_id, file_sender.id)
     elif file_sender.state in (TransferState.PAUSED, TransferState.CONNECTING):
+        file_sender.state = TransferState.PAUSED
         transfers_book.add_to_continued(peer_id, file_sender)
+        if transfers_journal:
+            transfers_journal.record(peer_id, file_sender.id, file_sender.journal_record())
+
+
+async def initiate_transfer_journal():
+    """Restores file transfers left unfinished by previous run into ``transfers_book`` as continued ones
+    and keeps journaling progress of file transfers from now on (see :class:`TransferJournal`)
+
+    Only senders are journaled, partially received files are picked up by the receiving end itself
+    when sender continues (see files.Receiver)
+    """
+    global transfers_journal
+
+    journal = TransferJournal(const.PATH_TRANSFER_JOURNAL)
+    records = await asyncio.to_thread(journal.replay)
+    for (peer_id, transfer_id), record in records.items():
+        try:
+            file_sender = files.Sender.from_journal_record(
+                record,
+                Dock.peer_list.get_peer(peer_id),
+                StatusMixIn(const.TRANSFER_STATUS_UPDATE_FREQ),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            _logger.warning(f"unable to restore transfer {transfer_id} from journal, dropping it", exc_info=e)
+            journal.forget(peer_id, transfer_id)
+            continue
+        transfers_book.add_to_continued(peer_id, file_sender)
+
+    transfers_book.skip_ids(transfer_id for _, transfer_id in records)
+    _logger.info(f"restored {len(records)} transfer(s) from journal {journal}")
+
+    transfers_journal = journal
+    await Dock.exit_stack.enter_async_context(_journaling(journal))
+
+
+@asynccontextmanager
+async def _journaling(journal):
+    """Periodically snapshots file senders in ``transfers_book`` into ``journal`` and flushes it in a batch"""
+
+    def snapshot():
+        for peer_id, handles in itertools.chain(transfers_book.current_items, transfers_book.continued_items):
+            for handle in handles:
+                if isinstance(handle, files.Sender):
+                    journal.record(peer_id, handle.id, handle.journal_record())
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(const.TRANSFER_JOURNAL_FLUSH_INTERVAL)
+            snapshot()
+            try:
+                await asyncio.to_thread(journal.flush)
+            except OSError as oe:
+                _logger.error("failed to flush transfer journal", exc_info=oe)
+
+    flusher = asyncio.create_task(flush_periodically())
+    try:
+        yield
+    finally:
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        snapshot()
+        try:
+            journal.flush()
+        except OSError as oe:
+            _logger.error("failed to flush transfer journal while finalizing", exc_info=oe)
 
 
 @asynccontextmanager
@@ -151,6 +366,8 @@ async def file_receiver(file_req: WireData, connection: connect.Connection, stat
         status_updater
     )
 
+    # senders before 1.2 do not wait for block digests
+    file_handle.delta_resume = version >= 1.2
     file_handle.connection_made(connection.send, connection.recv)
 
     transfers_book.add_to_current(file_req.id, file_handle)
@@ -205,15 +422,25 @@ def new_otm_request_arrived(req_data: WireData, addr):
 
 def FileConnectionHandler():
     async def handler(event: ConnectionEvent):
-        with event.connection:
-            file_req = event.handshake
-            _logger.info("new file connection arrived", extra={'id': file_req['file_id']})
+        file_req = event.handshake
+        _logger.info("new file connection arrived", extra={'id': file_req['file_id']})
+
+        # if not await webpage.get_transfer_ok(event.handshake.peer_id):  # :todo: ask webpage
+        #     await event.transport.send(b'\x00')
+        #     return
 
-            # if not await webpage.get_transfer_ok(event.handshake.peer_id):  # :todo: ask webpage
-            #     await event.transport.send(b'\x00')
-            #     return
+        # senders asking for reuse keep connections for their next transfer, if told that we wait on them
+        reuse = file_req.body.get('reuse', False)
+        receiver_handle = None
 
-            await event.connection.send(b'\x01')
+        def ended_cleanly():
+            return (
+                    reuse and receiver_handle is not None
+                    and receiver_handle.state == TransferState.COMPLETED and not receiver_handle.to_stop
+            )
+
+        async with _multiplexed(event, ended_cleanly) as connection:
+            await connection.send(_ACCEPTED_REUSE if reuse else _ACCEPTED_DELTA)
 
             _logger.debug(f"scheduling file transfer request {file_req!r}")
 
@@ -222,7 +449,7 @@ def FileConnectionHandler():
                     status_updater = StatusMixIn(const.TRANSFER_STATUS_UPDATE_FREQ)
                     receiver_handle = await exit_stack.enter_async_context(file_receiver(
                         file_req,
-                        event.connection,
+                        connection,
                         status_updater,
                     ))
                     receiver = await exit_stack.enter_async_context(aclosing(receiver_handle.recv_files()))
@@ -246,6 +473,78 @@ def FileConnectionHandler():
     return handler
 
 
+# stripes of a file transfer that arrived, keyed with (peer_id, file_id)
+# holds a list of sockets until the main connection of that transfer arrives, then the multiplexer itself
+_stripes = {}
+
+
+@asynccontextmanager
+async def _multiplexed(event: ConnectionEvent, reuse):
+    """Yields a connection striped over every connection the sender opened for this transfer
+
+    Falls back to ``event.connection`` if sender did not ask for striping,
+    owns the connections, they are closed once done or handed back to acceptor to wait for sender's next handshake
+
+    Args:
+        event: event of the main connection
+        reuse(Callable[[], bool]): checked once transfer is over, whether connections can be reused
+    """
+    handshake = event.handshake
+    if handshake.body.get('stripes', 1) <= 1:
+        with ExitStack() as closing:
+            closing.enter_context(event.connection)
+            yield event.connection
+            if reuse():
+                closing.pop_all()
+                _recycle(event.connection.socket, event.connection.recv.reader)
+        return
+
+    key = (handshake.peer_id, handshake['file_id'])
+    arrived = _stripes.pop(key, [])
+    multiplexer = connect.SocketMultiplexer([event.connection.socket, *arrived])
+    _stripes[key] = multiplexer
+    try:
+        yield connect.Connection.create_multiplexed(multiplexer, event.connection.peer)
+    except BaseException:
+        multiplexer.close()
+        raise
+    finally:
+        _stripes.pop(key, None)
+
+    for sock in await multiplexer.aclose(keep_open=reuse()):
+        _recycle(sock)
+
+
+def _recycle(sock, reader=None):
+    from src.core import acceptor  # acceptor imports this module
+    acceptor.recycle_connection(sock, reader)
+
+
+def FileStripeConnectionHandler():
+    def drop_orphans(key):
+        arrived = _stripes.get(key)
+        if isinstance(arrived, list):
+            del _stripes[key]
+            _logger.warning(f"main connection of file transfer did not arrive, closing {len(arrived)} stripes")
+            for sock in arrived:
+                sock.close()
+
+    async def handler(event: ConnectionEvent):
+        stripe = event.handshake
+        key = (stripe.peer_id, stripe['file_id'])
+        arrived = _stripes.get(key)
+        if isinstance(arrived, connect.SocketMultiplexer):
+            arrived.add_socket(event.connection.socket)
+            return
+
+        if arrived is None:
+            arrived = _stripes[key] = []
+            asyncio.get_running_loop().call_later(const.SERVER_TIMEOUT, drop_orphans, key)
+        arrived.append(event.connection.socket)
+
+    return handler
+
+
 def OTMConnectionHandler():
     async def handler(event: ConnectionEvent):
         """
@@ -11,7 +11,9 @@ class HEADERS:
     CMD_TEXT = b"this is message "
     CMD_RECV_DIR = b"cmd to recv dir "
     CMD_FILE_CONN = b"connection for file transfer"
+    CMD_FILE_STRIPE_CONN = b"connection for file transfer stripe"
     CMD_DIR_CONN = b'connection for dir transfer'
+    CMD_FRAME_FRAGMENT = b"frame fragment  "
 
     GOSSIP_CREATE_SESSION = b"gossip_session_activate"
     GOSSIP_DOWNGRADE_CONN = "gossip_downgrade_connection"
@@ -1,8 +1,7 @@
+import hashlib
 from pathlib import Path
 
-import umsgpack
-
-from src.avails import const, use
+from src.avails import const, serializer, use
 
 
 def stringify_size(size):
@@ -35,16 +34,19 @@ class FileItem:
     """
     __slots__ = '_name', 'size', 'path', 'seeked', 'original_ext'
 
-    def __init__(self, path, seeked):
+    def __init__(self, path, seeked, size=None):
         """Initializes the file object, fetching its size and name from the filesystem.
 
         Args:
             path(Path): file path to use operate with during transfer
             seeked(int): used to persist transfer state
+            size(int): size of file if already known, skips querying filesystem
         """
         self.path: Path = path
         self.seeked = seeked
-        if self.path.exists():
+        if size is not None:
+            self.size = size
+        elif self.path.exists():
             self.size = self.path.stat().st_size
         self._name = self.path.name
 
@@ -59,18 +61,17 @@ class FileItem:
 
     @staticmethod
     def load_from(data: bytes, file_parent_path):
-        name, size, seeked = umsgpack.loads(data)
+        name, size, seeked = serializer.loads(data)
 
         if const.IS_WINDOWS:
             name = name.replace('\\', '_')
 
-        file = FileItem(Path(file_parent_path, name), seeked)
+        file = FileItem(Path(file_parent_path, name), seeked, size=size)
         file._name = name
-        file.size = size
         return file
 
     def __bytes__(self):
-        return umsgpack.dumps(tuple(self))
+        return serializer.dumps(tuple(self))
 
     def __iter__(self):
         return iter((self.name, self.size, self.seeked))
@@ -187,6 +188,112 @@ def validatename(file_item: FileItem, root_path) -> str:
     return new_file_name
 
 
+def partial_path(path):
+    """Path a file is written to until it is received completely
+
+    Marks incomplete files on disk, so that they can be resumed even after the application restarts
+    """
+    return path.with_name(path.name + const.FILE_ERROR_EXT)
+
+
+def _block_digest(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def block_digests(path, block_size, limit):
+    """Digests of consecutive ``block_size`` blocks of the file at ``path``, upto ``limit`` bytes
+
+    A trailing block shorter than ``block_size`` is left out, it gets received again anyway
+
+    Returns:
+        list[bytes]: digest of each block in order
+    """
+    digests = []
+    buffer = bytearray(block_size)
+    with open(path, 'rb') as f:
+        while (len(digests) + 1) * block_size <= limit:
+            if f.readinto(buffer) < block_size:
+                break
+            digests.append(_block_digest(buffer))
+    return digests
+
+
+def matching_prefix(path, block_size, digests):
+    """Counterpart of :func:`block_digests`, compares ``digests`` against blocks of the file at ``path``
+
+    Returns:
+        int: length of the leading blocks that are same on both ends, the file can be resumed from there
+    """
+    matched = 0
+    buffer = bytearray(block_size)
+    with open(path, 'rb') as f:
+        for digest in digests:
+            if f.readinto(buffer) < block_size or _block_digest(buffer) != digest:
+                break
+            matched += block_size
+    return matched
+
+
+class AdaptiveChunkSize:
+    """Tunes chunk size while a file is being sent, the way TCP slow start tunes its window
+
+    Starts from ``initial`` and doubles after every chunk (slow start), until a chunk takes longer than
+    ``target_latency`` to send, then halves and grows linearly by ``min_size`` from there (congestion avoidance)
+    size is also capped to what the link moved in ``2 * target_latency`` going by the measured rate,
+    so chunks on slow links stay small enough to be sent well within timeouts (and pause/cancel stay responsive)
+    while fast links quickly get large chunks, whatever the file size is
+
+    Attributes:
+        size(int): size of the next chunk
+    """
+    __slots__ = 'size', 'min_size', 'max_size', 'target_latency', '_threshold'
+
+    def __init__(
+            self,
+            initial,
+            *,
+            min_size=const.MIN_CHUNK_SIZE,
+            max_size=const.MAX_CHUNK_SIZE,
+            target_latency=const.CHUNK_SEND_LATENCY_TARGET,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.size = min(max(initial, min_size), max_size)
+        self._threshold = max_size
+
+    @classmethod
+    def fixed(cls, size):
+        """Chunk size that never changes"""
+        return cls(size, min_size=size, max_size=size)
+
+    def update(self, elapsed, rate=None):
+        """Adjusts ``size`` after a chunk of current size got sent
+
+        Args:
+            elapsed(float): seconds it took to send the chunk
+            rate(float): throughput of the link in KB/s if known, see ``connect.ThroughputMixin.rate``
+
+        Returns:
+            int: size of the next chunk
+        """
+        if elapsed > self.target_latency:
+            self._threshold = max(self.min_size, self.size // 2)
+            size = self._threshold
+        elif self.size < self._threshold:
+            size = self.size * 2
+        elif elapsed < self.target_latency / 2:
+            size = self.size + self.min_size
+        else:
+            size = self.size
+
+        if rate:
+            size = min(size, int(rate * const.BYTES_PER_KB * self.target_latency * 2))
+
+        self.size = min(max(size, self.min_size), self.max_size)
+        return self.size
+
+
 def calculate_chunk_size(
         file_size: int,
         *,
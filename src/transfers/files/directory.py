@@ -1,23 +1,24 @@
 import asyncio
+import os
 import struct
 from contextlib import aclosing
 from pathlib import Path
-from typing import override
+from typing import NamedTuple, override
 
-import umsgpack
-
-from src.avails import const, use
+from src.avails import const, serializer, use
 from src.avails.exceptions import TransferIncomplete
 from src.avails.useables import recv_int
-from src.transfers import TransferState
+from src.transfers import TransferState, thread_pool_for_disk_io
 from src.transfers._logger import logger
-from src.transfers.files._fileobject import FileItem
+from src.transfers.files._fileobject import FileItem, validatename
 from src.transfers.files.receiver import Receiver
 from src.transfers.files.sender import Sender
 from src.transfers.status import StatusMixIn
 
 _FILE_CODE = b'\x01'
 _PATH_CODE = b'\x02'
+_BATCH_CODE = b'\x03'
+_MANIFEST_CODE = b'\x04'
 
 
 def rename_directory_with_increment(root_path: Path, relative_path: Path):
@@ -51,18 +52,110 @@ def rename_directory_with_increment(root_path: Path, relative_path: Path):
     return new_path
 
 
+class Manifest(NamedTuple):
+    """Everything under a directory, relative to it
+
+    Attributes:
+        dirs: list of (parent, name)
+        files: list of (parent, name, size, mtime)
+        file_items: FileItem for each entry in ``files``, pointing to local path
+    """
+    dirs: list
+    files: list
+    file_items: list
+
+    @property
+    def total_size(self):
+        return sum(size for *_, size, _ in self.files)
+
+    def __bytes__(self):
+        return serializer.dumps([
+            [(parent, _wire_name(name)) for parent, name in self.dirs],
+            [(parent, _wire_name(name), size, mtime) for parent, name, size, mtime in self.files],
+        ])
+
+
+async def build_manifest(root_path, *, th_pool=thread_pool_for_disk_io):
+    """Walks ``root_path``, every directory is scanned using ``os.scandir`` in a worker thread
+
+    Subdirectories are scanned concurrently as soon as they are found, event loop is never blocked on
+    filesystem calls
+
+    Args:
+        root_path(Path): directory to walk
+        th_pool(ThreadPoolExecutor): executor to scan directories in
+
+    Returns:
+        Manifest: of everything under ``root_path``
+    """
+    loop = asyncio.get_running_loop()
+    manifest = Manifest([], [], [])
+    pending = {loop.run_in_executor(th_pool, _scan_directory, root_path, '.')}
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for scanned in done:
+            dirs, files, file_items = scanned.result()
+            manifest.dirs.extend(dirs)
+            manifest.files.extend(files)
+            manifest.file_items.extend(file_items)
+            for parent, name in dirs:
+                relative_dir = name if parent == '.' else f"{parent}/{name}"
+                pending.add(loop.run_in_executor(th_pool, _scan_directory, root_path, relative_dir))
+
+    return manifest
+
+
+def _scan_directory(root_path, relative_dir):
+    dirs, files, file_items = [], [], []
+    try:
+        with os.scandir(Path(root_path, relative_dir)) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append((relative_dir, entry.name))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((relative_dir, entry.name, stat.st_size, stat.st_mtime))
+                    file_items.append(FileItem(Path(entry.path), 0, size=stat.st_size))
+    except OSError as oe:
+        logger.warning(f"skipping {relative_dir}, failed to scan", exc_info=oe)
+    return dirs, files, file_items
+
+
+def _wire_name(name):
+    if const.IS_LINUX:
+        return name.replace('\\', '_')
+    return name
+
+
 class DirSender(Sender):
     """
     Data Layout:
 
+    (1B) MANIFEST -> INT(4) | [[(PARENT, NAME), ...], [(PARENT, NAME, FILE_SIZE, MTIME), ...]] | goto `code`
+
                 |  DIR -> INT(4) | PARENT | NAME | goto `code`
                 |
-    (1B) | code |
+    (1B) | code |  FILE -> INT(4) | PARENT | NAME | FILE_SIZE(8) | FILE CONTENTS | wait for ack | goto `code`
                 |
-                |  FILE -> INT(4) | PARENT | NAME | FILE_SIZE(8) | FILE CONTENTS | goto `code`
+                |  BATCH -> INT(4) | [(PARENT, NAME, FILE_SIZE), ...] | CONTENTS OF ALL FILES | wait for ack | goto `code`
+
+    Directory is walked up front (see :func:`build_manifest`) and the manifest is sent first,
+    other end creates every directory from it, so DIR records are not sent anymore
+
+    Files smaller than ``batch_file_size`` are not sent one by one, they are collected and sent as a single
+    BATCH record once ``batch_count`` files or ``batch_size`` bytes are collected, acknowledged once per batch
+
+    Receivers of previous versions (``peer_version``, see :meth:`version_of_confirmation`) know only DIR and FILE
+    records, every directory is sent as a DIR record and every file as a FILE record to them
     """
 
+    version = const.VERSIONS['DO']
     timeout = const.DEFAULT_TRANSFER_TIMEOUT
+    batch_file_size = 64 * 1024  # 64 KB
+    batch_size = 2 * 1024 * 1024  # 2 MB
+    batch_count = 512
+    delta_resume = False  # every directory is received into a new one, nothing to resume from
 
     def __init__(self, peer_obj, transfer_id, root_path, status_updater):
         """
@@ -73,51 +166,115 @@ class DirSender(Sender):
         """
         super().__init__(peer_obj, transfer_id, [], status_updater)
         self.root_path = root_path
-        self.dir_iterator = self.root_path.rglob('*')
+        self.manifest = None
         self._current_file = None
+        self.peer_version = self.version
+
+    @staticmethod
+    def version_of_confirmation(confirmation):
+        """Version of receiver, from the byte it accepted transfer with (see :meth:`DirReceiver.confirmation`)
+
+        receivers of previous versions accept with ``b'\\x01'``, which reads as a version older than any
+        """
+        return confirmation[0] / 100
 
     async def send_files(self):
         self.send_files_task = asyncio.current_task()
-
-        for item in self.dir_iterator:
+        self.manifest = await build_manifest(self.root_path)
+        batch_file_size = self.batch_file_size
+        if self.peer_version >= self.version:
+            await self._send_manifest()
+        else:
+            batch_file_size = 0
+            for parent, name in self.manifest.dirs:
+                await self.__send_code_parts(_PATH_CODE, Path(self.root_path, parent, name))
+        batch, batch_bytes = [], 0
+
+        for (parent, name, *_), file_item in zip(self.manifest.files, self.manifest.file_items):
             if self.to_stop:
                 break
 
-            if item.is_dir():
-                await self.__send_code_parts(_PATH_CODE, item)
-                self._current_file = FileItem(item, 0)
+            if file_item.size < batch_file_size:
+                batch.append((parent, name, file_item))
+                batch_bytes += file_item.size
+                if len(batch) >= self.batch_count or batch_bytes >= self.batch_size:
+                    yield await self._send_batch(batch)
+                    batch, batch_bytes = [], 0
                 continue
 
-            if item.is_file():
-                self._current_file = await self._send_file_item(item)
-                if self.current_file.size > 0:
-                    async with aclosing(self.send_one_file(self.current_file)) as sender:
-                        async for i in sender:
-                            yield i
-                assert (await self.recv_func(1)) == _FILE_CODE
-                # print("OK" if await self.recv_func(1) == _FILE_CODE else "NOT OK")
+            self._current_file = await self._send_file_item(file_item)
+            async with aclosing(self.send_one_file(self.current_file)) as sender:
+                async for i in sender:
+                    yield i
+            await self._get_ack(_FILE_CODE)
+
+        if batch and not self.to_stop:
+            yield await self._send_batch(batch)
 
         await self.send_func(b'\x00')  # code to inform end of transfer
 
     @override
-    async def _send_file_item(self, file_path):
-        await self.__send_code_parts(_FILE_CODE, file_path)
-        file_item = FileItem(file_path, 0)
+    async def _send_file_item(self, file_item):
+        await self.__send_code_parts(_FILE_CODE, file_item.path)
         await self.send_func(struct.pack('!Q', file_item.size))
         return file_item
 
-    async def __send_code_parts(self, code, path: Path):
+    async def _send_manifest(self):
+        dumped_manifest = await asyncio.get_running_loop().run_in_executor(
+            thread_pool_for_disk_io, bytes, self.manifest
+        )
+        try:
+            await self.send_func(_MANIFEST_CODE)
+            await self.send_func(struct.pack('!I', len(dumped_manifest)) + dumped_manifest)
+        except Exception as exp:
+            self.handle_exception(exp)
 
-        rel_path = path.relative_to(self.root_path)
-        parent = rel_path.parent
-        name = rel_path.name
+    async def _send_batch(self, batch):
+        """Sends all the ``batch`` files as one record and waits for a single acknowledgement
 
-        if const.IS_WINDOWS:
-            parent = parent.as_posix()
-        if const.IS_LINUX:
-            name = name.replace('\\', '_')
+        Args:
+            batch(list[tuple[str, str, FileItem]]): parent, name and FileItem of each file
+
+        Returns:
+            total bytes sent as file contents
+        """
+        batch = [(parent, _wire_name(name), file_item) for parent, name, file_item in batch]
+        contents = await asyncio.get_running_loop().run_in_executor(
+            thread_pool_for_disk_io, _read_files, [file_item for *_, file_item in batch]
+        )
+        batch_header = serializer.dumps([
+            (parent, name, len(content))
+            for (parent, name, _), content in zip(batch, contents)
+        ])
+        try:
+            await self.send_func(_BATCH_CODE)
+            await self.send_func(struct.pack('!I', len(batch_header)) + batch_header)
+            await self.send_func(b''.join(contents))
+        except Exception as exp:
+            self.handle_exception(exp)
+        await self._get_ack(_BATCH_CODE)
+
+        for (*_, file_item), content in zip(batch, contents):
+            file_item.seeked = file_item.size = len(content)
+        self._current_file = batch[-1][-1]
+        return sum(map(len, contents))
 
-        dumped_code = umsgpack.dumps((parent, name))
+    async def _get_ack(self, code):
+        try:
+            ack = await self.recv_func(1)
+        except Exception as exp:
+            self.handle_exception(exp)
+        else:
+            if ack != code:
+                raise TransferIncomplete(f"expected acknowledgement {code}, received {ack}")
+
+    def __relative_parts(self, path: Path):
+        rel_path = path.relative_to(self.root_path)
+        return rel_path.parent.as_posix(), _wire_name(rel_path.name)
+
+    async def __send_code_parts(self, code, path: Path):
+        parent, name = self.__relative_parts(path)
+        dumped_code = serializer.dumps((parent, name))
         try:
             await self.send_func(code)  # code to inform that there are more files to get
             await self.send_func(struct.pack('!I', len(dumped_code)) + dumped_code)
@@ -144,17 +301,44 @@ class DirReceiver(Receiver):
                               (FILE) INT(4) | parents | name | FILE SIZE(8) | FILE_CONTENTS
                               |      -------------------------------------------------
                               |
-        (1 byte) STOP or FILE
+                              |      ----------------------
+        (1 byte) STOP or CODE (PATH) INT(4) | parents | name
+                              |      ----------------------
                               |
+                              |      -------------------------------------------------------------------
+                              (MANIFEST) INT(4) | [[(parents, name), ...], [(parents, name, size, mtime), ...]]
+                              |      -------------------------------------------------------------------
                               |
-                              |      ----------------------
-                              (PATH) INT(4) | parents | name
-                                     ----------------------
+                              |      --------------------------------------------------------
+                              (BATCH) INT(4) | [(parents, name, size), ...] | ALL FILE_CONTENTS
+                                     --------------------------------------------------------
 
+    FILE and BATCH records are acknowledged with their own code once written to disk
+    MANIFEST comes first, every directory in it is created up front and totals are noted for progress,
+    files sent as FILE records are preallocated with their sizes before being written
+
+    Senders of previous versions (``peer_version`` older than ours) send only PATH and FILE records, no totals then
+
+    Attributes:
+        expected_size(int): total bytes of files listed in manifest
+        received_size(int): total bytes of files received so far (including the one being received)
     """
 
+    version = const.VERSIONS['DO']
+    delta_resume = False
+    preallocate = True
+
     def __init__(self, peer_obj, transfer_id, download_path, status_iter):
         super().__init__(peer_obj, transfer_id, download_path, status_iter)
+        self.expected_size = 0
+        self.expected_files = 0
+        self.received_size = 0
+        self.peer_version = self.version
+
+    @classmethod
+    def confirmation(cls):
+        """Byte to accept a transfer with, carries our version (see :meth:`DirSender.version_of_confirmation`)"""
+        return bytes([round(cls.version * 100)])
 
     async def recv_files(self):
         self.state = TransferState.RECEIVING
@@ -165,12 +349,24 @@ class DirReceiver(Receiver):
                 break
 
             if code == _FILE_CODE:
+                received_before = self.received_size
                 async with aclosing(self._recv_file_once()) as loop:
                     # print(self.current_file)  # debug
                     async for _ in loop:
+                        self.received_size = received_before + self.current_file.seeked
                         yield _
+                self.received_size = received_before + self.current_file.size
                 await self.send_func(code)
 
+            elif code == _BATCH_CODE:
+                batch_size = await self._recv_batch()
+                self.received_size += batch_size
+                yield batch_size
+                await self.send_func(code)
+
+            elif code == _MANIFEST_CODE:
+                yield await self._recv_manifest()
+
             elif code == _PATH_CODE:
                 parent, item_name = await self._recv_parts()
                 full_path = Path(self.download_path, parent, item_name)
@@ -190,16 +386,84 @@ class DirReceiver(Receiver):
         file.size = size
         return file
 
+    async def _recv_manifest(self):
+        loop = asyncio.get_running_loop()
+        try:
+            manifest_len = await recv_int(self.recv_func)
+            raw_manifest = await use.recv_exactly(self.recv_func, manifest_len)
+            dirs, files = await loop.run_in_executor(thread_pool_for_disk_io, serializer.loads, raw_manifest)
+        except (struct.error, ValueError, OSError, serializer.UnpackException) as exp:
+            raise TransferIncomplete("failed to receive manifest") from exp
+
+        await loop.run_in_executor(thread_pool_for_disk_io, _make_dirs, self.download_path, dirs)
+        self.expected_files = len(files)
+        self.expected_size = sum(size for *_, size, _ in files)
+        logger.debug(f"{self._log_prefix} manifest received, {len(dirs)} directories, {len(files)} files")
+        return self.expected_size
+
+    async def _recv_batch(self):
+        try:
+            header_len = await recv_int(self.recv_func)
+            batch_header = serializer.loads(await use.recv_exactly(self.recv_func, header_len))
+            contents = await use.recv_exactly(self.recv_func, sum(size for *_, size in batch_header))
+        except (struct.error, ValueError, OSError, serializer.UnpackException) as exp:
+            raise TransferIncomplete("failed to receive batch") from exp
+
+        batch = []
+        for parent, item_name, size in batch_header:
+            if const.IS_WINDOWS:
+                item_name = item_name.replace("\\", "_")
+            file_item = FileItem(Path(self.download_path, parent, item_name), 0)
+            file_item.size = size
+            batch.append(file_item)
+
+        await asyncio.get_running_loop().run_in_executor(
+            thread_pool_for_disk_io, _write_files, batch, contents
+        )
+        self.file_items.extend(batch)
+        self._current_file = batch[-1]
+        return len(contents)
+
     async def _recv_parts(self):
         try:
             code_len = await recv_int(self.recv_func)
             # print(f"{code_len=}")
-            parent, item_name = umsgpack.loads(await self.recv_func(code_len))
+            parent, item_name = serializer.loads(await self.recv_func(code_len))
             if const.IS_WINDOWS:
                 item_name = item_name.replace("\\", "_")
             return parent, item_name
-        except (struct.error, umsgpack.UnpackException) as exp:
+        except (struct.error, serializer.UnpackException) as exp:
             raise TransferIncomplete("failed to receive item code") from exp
 
     async def continue_transfer(self):
         self.state = TransferState.RECEIVING
+
+
+def _make_dirs(download_path, dirs):
+    for parent, name in dirs:
+        if const.IS_WINDOWS:
+            name = name.replace("\\", "_")
+        Path(download_path, parent, name).mkdir(parents=True, exist_ok=True)
+
+
+def _read_files(file_items):
+    contents = []
+    for file_item in file_items:
+        with open(file_item.path, 'rb') as f:
+            contents.append(f.read())
+    return contents
+
+
+def _write_files(file_items, contents):
+    view = memoryview(contents)
+    offset = 0
+    for file_item in file_items:
+        try:
+            f = open(file_item.path, 'xb')
+        except FileExistsError:
+            validatename(file_item, file_item.path.parent)
+            f = open(file_item.path, 'xb')
+        with f:
+            f.write(view[offset: offset + file_item.size])
+        offset += file_item.size
+        file_item.seeked = file_item.size
@@ -1,20 +1,64 @@
 import asyncio
+import errno
 import functools
 import os
 import struct
+import time
 from contextlib import aclosing, contextmanager
 
-from src.avails import const, use
-from src.avails.connect import Sender
+from src.avails import connect, const, serializer, use
 from src.avails.exceptions import CancelTransfer, InvalidStateError, TransferIncomplete
 from src.transfers import TransferState, thread_pool_for_disk_io
 from src.transfers._logger import logger as _logger
 from src.transfers.abc import AbstractReceiver, CommonAExitMixIn, CommonExceptionHandlersMixIn, PauseMixIn
-from src.transfers.files._fileobject import FileItem, calculate_chunk_size, validatename
+from src.transfers.files._fileobject import (
+    AdaptiveChunkSize,
+    FileItem,
+    block_digests,
+    calculate_chunk_size,
+    partial_path,
+    validatename,
+)
+
+
+# partial paths being written into right now
+_claimed_partial_paths = set()
+
+
+@contextmanager
+def _claim_partial_path(final_path):
+    """Partial path of ``final_path`` that no other receiver is writing into, kept claimed till exited
+
+    Path is the usual one (see ``partial_path``) unless it is already claimed,
+    then ``name (n)`` is tried in the same way ``validatename`` does
+    """
+    path = partial_path(final_path)
+    counter = 1
+    while path in _claimed_partial_paths:
+        path = partial_path(final_path.with_name(f"{final_path.stem} ({counter}){final_path.suffix}"))
+        counter += 1
+
+    _claimed_partial_paths.add(path)
+    try:
+        yield path
+    finally:
+        _claimed_partial_paths.discard(path)
 
 
 class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, AbstractReceiver):
+    """
+    Receives files sent by files.Sender
+
+    Files are written with ``const.FILE_ERROR_EXT`` appended to their names and renamed once received completely,
+    if such a partial file is found while receiving the same file again (even after the application restarted)
+    digests of its blocks are sent to other end so that only the rest of it is sent (see :meth:`_sync_resume_offset`)
+    """
     version = const.VERSIONS['FO']
+    use_recv_into = True
+    adaptive_chunk_size = True
+    delta_resume = True
+    preallocate = False  # reserve whole size of a file on disk before receiving it, see _setup_transfer
+    resume_block_size = const.FILE_RESUME_BLOCK_SIZE
 
     def __init__(self, peer_obj, file_id, download_path, status_updater):
         self.recv_files_task = None
@@ -29,6 +73,7 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
         self.send_func = None
         self.recv_func = None
         self.status_updater = status_updater
+        self._chunk_sizer = None
         self._expected_errors = set()
 
     async def recv_files(self):
@@ -96,7 +141,7 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
         except ValueError as ve:
             raise TransferIncomplete from ve
         try:
-            raw_file_item = await self.recv_func(file_item_size)
+            raw_file_item = await use.recv_exactly(self.recv_func, file_item_size)
         except OSError as oe:
             raise TransferIncomplete from oe
         else:
@@ -104,30 +149,102 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
             return file_item
 
     async def _receive_single_file(self):
-        validatename(file_item=self.current_file, root_path=self.download_path)
-        receiver = recv_file_contents(self.recv_func, self.current_file)
-        self.status_updater.status_setup(self._status_string_prefix, self.current_file.seeked, self.current_file.size)
-
-        status_updater = self.status_updater.update_status
+        if not self.delta_resume and self.current_file.seeked == 0:
+            # a partially received file continues into the same file, renaming is only for new ones
+            validatename(file_item=self.current_file, root_path=self.download_path)
+        # with delta resume, partial file of same name is looked for and final name is validated only once received
+        # (see _finalize_file), files of same name received at the same time (over other streams or transfers)
+        # are kept apart by claiming partial paths
+        final_path = self.current_file.path
+        with _claim_partial_path(final_path) as receiving_path:
+            self.current_file.path = receiving_path
+            await self._sync_resume_offset()
+
+            if self.use_recv_into and hasattr(self.recv_func, 'recv_into'):
+                if self.adaptive_chunk_size and self._chunk_sizer is None:
+                    # learnt buffer size is carried over from file to file
+                    self._chunk_sizer = AdaptiveChunkSize(calculate_chunk_size(self.current_file.size))
+                receiver = recv_file_contents_into(
+                    self.recv_func,
+                    self.current_file,
+                    adaptive=self.adaptive_chunk_size,
+                    chunk_sizer=self._chunk_sizer,
+                    preallocate=self.preallocate,
+                )
+            else:
+                receiver = recv_file_contents(self.recv_func, self.current_file, preallocate=self.preallocate)
+            self.status_updater.status_setup(
+                self._status_string_prefix, self.current_file.seeked, self.current_file.size
+            )
+
+            status_updater = self.status_updater.update_status
+
+            async with aclosing(receiver) as file_receiver:
+                try:
+                    async for received_len in file_receiver:
+                        status_updater(received_len)
+                        yield
+                        if self.to_stop:
+                            break
+                except Exception as exp:
+                    # raise early
+                    self.handle_exception(exp)
+
+            if self.current_file.seeked < self.current_file.size:
+                if self.to_stop is True:
+                    # if we are expected to finalize then no need to raise TransferIncomplete
+                    return
+
+                # we don't reach to this point (mostly)
+                raise TransferIncomplete("exiting before completion of transfer")
 
-        async with aclosing(receiver) as file_receiver:
             try:
-                async for received_len in file_receiver:
-                    status_updater(received_len)
-                    yield
-                    if self.to_stop:
-                        break
-            except Exception as exp:
-                # raise early
-                self.handle_exception(exp)
+                self._finalize_file(final_path)
+            except OSError as oe:
+                self.handle_exception(oe)
 
-        if self.current_file.seeked < self.current_file.size:
-            if self.to_stop is True:
-                # if we are expected to finalize then no need to raise TransferIncomplete
-                return
+    async def _sync_resume_offset(self):
+        """Tells other end what we already have of current file, see files.Sender._sync_resume_offset
 
-            # we don't reach to this point (mostly)
-            raise TransferIncomplete("exiting before completion of transfer")
+        Sends digests of blocks of the partial file found at ``current_file.path`` (if any) and receives the offset
+        other end is going to send from, partial file is cut down to that offset
+        """
+        if not self.delta_resume:
+            return
+
+        file_item = self.current_file
+        loop = asyncio.get_running_loop()
+        try:
+            digests = []
+            if os.path.exists(file_item.path):
+                digests = await loop.run_in_executor(
+                    thread_pool_for_disk_io,
+                    block_digests, file_item.path, self.resume_block_size, file_item.size
+                )
+            signature = serializer.dumps((self.resume_block_size, digests))
+            await self.send_func(struct.pack('!I', len(signature)) + signature)
+            offset = await use.recv_int(self.recv_func, use.LONG_INT)
+            if offset > len(digests) * self.resume_block_size:
+                raise ValueError(f"other end is resuming from {offset}, which we never had")
+            if offset:
+                await loop.run_in_executor(thread_pool_for_disk_io, os.truncate, file_item.path, offset)
+            elif os.path.exists(file_item.path):
+                # nothing in there is usable
+                await loop.run_in_executor(thread_pool_for_disk_io, os.remove, file_item.path)
+        except ValueError as ve:
+            self._raise_transfer_incomplete_and_change_state(ve, "unable to synchronize resume offset")
+        except Exception as exp:
+            self.handle_exception(exp)
+            raise
+        else:
+            file_item.seeked = offset
+
+    def _finalize_file(self, final_path):
+        """Moves completely received file from its partial path to ``final_path`` (renamed if already taken)"""
+        received_path = self.current_file.path
+        self.current_file.path = final_path
+        validatename(file_item=self.current_file, root_path=final_path.parent)
+        received_path.rename(self.current_file.path)
 
     async def continue_transfer(self):
         if not self.state == TransferState.PAUSED or self.to_stop is True:
@@ -139,14 +256,16 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
         self.state = TransferState.RECEIVING
         await self.connection_wait
 
-        try:
-            # synchronizing last received file seek
-            await self.send_func(struct.pack('!Q', self.current_file.seeked))
-        except Exception as exp:
-            self.handle_exception(exp)
+        # with delta resume, offset of every file is agreed upon before receiving it, see _sync_resume_offset
+        if not self.delta_resume:
+            try:
+                # synchronizing last received file seek
+                await self.send_func(struct.pack('!Q', self.current_file.seeked))
+            except Exception as exp:
+                self.handle_exception(exp)
 
         while True:
-            if not self._should_proceed():
+            if not await self._should_proceed():
                 break
 
             # getting remaining files
@@ -155,8 +274,8 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
                     yield items
 
     def connection_made(self, sender, receiver):
-        assert isinstance(sender, Sender), f"Expected Sender instance found {sender=}"
-        assert isinstance(receiver, Receiver), f"Expected Receiver instance found {receiver=}"
+        assert isinstance(sender, connect.Sender), f"Expected Sender instance found {sender=}"
+        assert isinstance(receiver, connect.Receiver), f"Expected Receiver instance found {receiver=}"
 
         self.connection_wait.set_result((sender, receiver))
         self.send_func = sender
@@ -192,7 +311,7 @@ class Receiver(CommonAExitMixIn, PauseMixIn, CommonExceptionHandlersMixIn, Abstr
         return f"{self.peer.peer_id} {self._file_id}"
 
 
-async def recv_file_contents(recv_function, file_item, *, chunk_size=None):
+async def recv_file_contents(recv_function, file_item, *, chunk_size=None, preallocate=False):
     """Receive a file over a network connection and write it to disk.
 
     if ``FileItem.seeked`` attribute is non-zero then the file at ``file_item.path`` is checked for existence
@@ -203,6 +322,7 @@ async def recv_file_contents(recv_function, file_item, *, chunk_size=None):
         recv_function (Callable): A function to receive data.
         file_item (FileItem): An object containing file metadata.
         chunk_size(int): The size of each chunk passed into ``recv_function``
+        preallocate(bool): reserve ``file_item.size`` bytes on disk up front, when file is newly created
         # progress (ProgressTracker): An object to track progress of file writing.
         # stopping_flag(Callable): gets called to check when looping over byte chunks received from ``recv_function``
 
@@ -213,7 +333,7 @@ async def recv_file_contents(recv_function, file_item, *, chunk_size=None):
         int: updated remaining file size to be received
     """
 
-    with _setup_transfer(chunk_size, file_item) as t:  # noqa
+    with _setup_transfer(chunk_size, file_item, preallocate=preallocate) as t:  # noqa
         chunk_size, file_size, f_writer, remaining_bytes = t
 
         while remaining_bytes > 0:
@@ -228,8 +348,103 @@ async def recv_file_contents(recv_function, file_item, *, chunk_size=None):
             yield file_size - remaining_bytes
 
 
+async def recv_file_contents_into(
+        recv_function,
+        file_item,
+        *,
+        chunk_size=None,
+        buffers=const.MAX_FILE_RECV_BUFFERING,
+        adaptive=True,
+        chunk_sizer=None,
+        preallocate=False,
+):
+    """Receive a file over a network connection into preallocated buffers and write it to disk.
+
+    A ring of ``buffers`` chunk sized buffers is filled by ``recv_function.recv_into`` while previously
+    filled ones are being written to disk, so network reads and disk writes overlap
+    each buffer is filled completely before handing it to disk (short reads are continued into the same buffer)
+    if ``adaptive`` is set, buffer size is tuned by how quickly buffers get filled (see :class:`AdaptiveChunkSize`),
+    buffers are reallocated lazily as they come back to the ring
+
+    ``FileItem.seeked`` is advanced only after a chunk is written, pending chunks are flushed before returning
+    so that it stays accurate to resume from
+
+    Args:
+        recv_function (connect.Receiver): object with an async ``recv_into(buffer)`` method
+        file_item (FileItem): An object containing file metadata.
+        chunk_size(int): size of each buffer in the ring (initial size if ``adaptive``)
+        buffers(int): number of buffers in the ring
+        adaptive(bool): tune buffer size using fill latency and throughput of ``recv_function``
+        chunk_sizer(AdaptiveChunkSize): continue tuning from this one (learnt while receiving previous files)
+        preallocate(bool): reserve ``file_item.size`` bytes on disk up front, when file is newly created
+
+    Raises:
+        FileNotFoundError: If ``file_item.path`` is not found when resuming.
+
+    Yields:
+        int: file size received so far
+    """
+
+    with _setup_transfer(chunk_size, file_item, preallocate=preallocate) as t:  # noqa
+        chunk_size, file_size, f_writer, remaining_bytes = t
+        if remaining_bytes <= 0:
+            return
+
+        if adaptive:
+            chunk_size = chunk_sizer or AdaptiveChunkSize(chunk_size)
+        else:
+            chunk_size = AdaptiveChunkSize.fixed(chunk_size)
+        free = asyncio.Queue()
+        for _ in range(buffers):
+            free.put_nowait(memoryview(bytearray()))  # allocated on first use
+        filled = asyncio.Queue()
+
+        async def write_filled():
+            try:
+                while (filled_chunk := await filled.get()) is not None:
+                    view, nbytes = filled_chunk
+                    await f_writer(view[:nbytes])
+                    file_item.seeked += nbytes
+                    free.put_nowait(view)
+            except BaseException:
+                free.put_nowait(None)  # wake up reader
+                raise
+
+        writer = asyncio.create_task(write_filled())
+        try:
+            while remaining_bytes > 0:
+                view = await free.get()
+                if view is None:  # writer failed
+                    break
+
+                to_fill = min(chunk_size.size, remaining_bytes)
+                if len(view) < to_fill:
+                    view = memoryview(bytearray(to_fill))  # smaller one is dropped
+
+                started = time.perf_counter()
+                received = 0
+                while received < to_fill:
+                    got = await recv_function.recv_into(view[received:to_fill])
+                    if not got:
+                        break
+                    received += got
+                chunk_size.update(time.perf_counter() - started, getattr(recv_function, 'rate', None))
+
+                if received:
+                    filled.put_nowait((view, received))
+                remaining_bytes -= received
+                if received < to_fill:  # connection closed in between
+                    break
+                yield file_size - remaining_bytes
+        finally:
+            filled.put_nowait(None)
+            await asyncio.gather(writer, return_exceptions=True)
+
+        writer.result()  # raise if writing failed
+
+
 @contextmanager
-def _setup_transfer(chunk_size, file_item, *, th_pool=thread_pool_for_disk_io):
+def _setup_transfer(chunk_size, file_item, *, preallocate=False, th_pool=thread_pool_for_disk_io):
     mode = 'xb' if file_item.seeked == 0 else 'rb+'  # Create a new file or open for reading and writing
     # Check for the existence of the file for resuming
     # A reason for going with more specific modes like xb or rb+ rather than using "w" modes
@@ -245,7 +460,25 @@ def _setup_transfer(chunk_size, file_item, *, th_pool=thread_pool_for_disk_io):
     loop = asyncio.get_running_loop()
 
     with open(file_item.path, mode) as fd:
+        if preallocate and mode == 'xb':
+            _preallocate(fd, file_item.size)
         fd.seek(file_item.seeked)
         async_writer = functools.partial(loop.run_in_executor, th_pool, fd.write)
         remaining_bytes -= file_item.seeked
         yield chunk_size, file_item.size, async_writer, remaining_bytes
+
+
+def _preallocate(fd, size):
+    """Reserves ``size`` bytes for ``fd`` up front so that file is laid out in one go (less fragmented on disk)
+
+    Only where ``os.posix_fallocate`` is available, running out of space is raised early instead of halfway through,
+    other failures (file system doesn't support it) are ignored as it is just a hint
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd.fileno(), 0, size)
+    except OSError as oe:
+        if oe.errno == errno.ENOSPC:
+            raise
+        _logger.debug(f"preallocation not supported for {fd.name}", exc_info=oe)
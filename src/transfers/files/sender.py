@@ -1,22 +1,39 @@
 import asyncio
+import collections
 import functools
 import mmap
 import struct
+import time
 from contextlib import aclosing
 from pathlib import Path
 
-from src.avails import const, use
-from src.avails.exceptions import CancelTransfer, InvalidStateError
+from src.avails import const, serializer, use
+from src.avails.exceptions import CancelTransfer, InvalidStateError, TransferIncomplete
 from src.transfers import TransferState, thread_pool_for_disk_io
 from src.transfers._logger import logger as _logger
 from src.transfers.abc import AbstractSender, CommonAExitMixIn, CommonExceptionHandlersMixIn, PauseMixIn
-from src.transfers.files._fileobject import FileItem, calculate_chunk_size
+from src.transfers.files._fileobject import AdaptiveChunkSize, FileItem, calculate_chunk_size, matching_prefix
 
 
 class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, AbstractSender):
+    """
+    Sends files one after the other over the connection passed into ``connection_made``
+
+    If more connections are attached using ``stream_made``, files are sent concurrently, one file per connection
+    at a time, each connection is a separate stream of files for the other end
+    files sent completely are remembered, remaining ones are sent from ``FileItem.seeked`` when transfer continues
+
+    Before sending contents of a file, other end tells what it already has as digests of fixed size blocks,
+    leading blocks that match are not sent again (see :meth:`_sync_resume_offset`)
+    """
 
     version = const.VERSIONS['FO']
     timeout = const.DEFAULT_TRANSFER_TIMEOUT
+    use_sendfile = True
+    read_ahead = const.MAX_FILE_READ_AHEAD
+    adaptive_chunk_size = True
+    max_streams = const.MAX_CONCURRENT_FILE_STREAMS
+    delta_resume = True
 
     def __init__(self, peer_obj, transfer_id, file_list, status_updater):
         self.send_files_task = None
@@ -32,6 +49,9 @@ class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, Abstrac
         self._current_file_index = 0
         self.send_func = None
         self.recv_func = None
+        self.streams = []
+        self._sent_indices = set()
+        self._chunk_sizers = {}
         self._expected_errors = set()
 
     async def send_files(self):
@@ -39,26 +59,103 @@ class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, Abstrac
         self.state = TransferState.SENDING
         self.send_files_task = asyncio.current_task()
 
-        for index in range(self._current_file_index, len(self.file_list)):
+        if self.streams:
+            files_sender = self._send_files_concurrently()
+        else:
+            files_sender = self._send_files_one_by_one()
+
+        async with aclosing(files_sender) as loop:
+            async for _ in loop:
+                yield _
+
+        # end of transfer, signalling that there are no more files
+        try:
+            for send_func in (self.send_func, *(send for send, _ in self.streams)):
+                await send_func(b'\x00')
+        except Exception as exp:
+            self.handle_exception(exp)
+
+        _logger.info(f"{self._log_prefix} sent final flag, completed sending")
+        self.state = TransferState.COMPLETED
+
+    async def _send_files_one_by_one(self):
+        for index in range(len(self.file_list)):
 
             if self.to_stop:
                 break
+            if index in self._sent_indices:
+                continue
             file_item = self.file_list[index]
             self._current_file_index = index
             await self._send_file_item(file_item)
+            await self._sync_resume_offset(file_item)
             async with aclosing(self.send_one_file(file_item)) as loop:
                 async for _ in loop:
                     yield _
+            if file_item.seeked >= file_item.size:
+                self._sent_indices.add(index)
             print("file sent", file_item)  # debug
 
-        # end of transfer, signalling that there are no more files
+    async def _send_files_concurrently(self):
+        pending = collections.deque(i for i in range(len(self.file_list)) if i not in self._sent_indices)
+        progress = asyncio.Queue()
+        sent = sum(file_item.seeked for file_item in self.file_list)
+        self.status_updater.status_setup(
+            prefix=f"sending: {len(pending)} files over {len(self.streams) + 1} streams",
+            initial_limit=sent,
+            final_limit=sum(file_item.size for file_item in self.file_list),
+        )
+
+        lanes = [
+            asyncio.create_task(self._send_lane(send_func, recv_func, pending, progress))
+            for send_func, recv_func in ((self.send_func, self.recv_func), *self.streams)
+        ]
+        all_lanes = asyncio.gather(*lanes)
+        all_lanes.add_done_callback(lambda _: progress.put_nowait(None))
         try:
-            await self.send_func(b'\x00')
-        except Exception as exp:
-            self.handle_exception(exp)
-
-        _logger.info(f"{self._log_prefix} sent final flag, completed sending")
-        self.state = TransferState.COMPLETED
+            while (update := await progress.get()) is not None:
+                self._current_file_index, sent_now = update
+                sent += sent_now
+                self.status_updater.update_status(sent)
+                yield sent
+            await all_lanes
+        finally:
+            for lane in lanes:
+                lane.cancel()
+            await asyncio.gather(*lanes, return_exceptions=True)
+            if all_lanes.done() and not all_lanes.cancelled():
+                all_lanes.exception()  # retrieved, it is already raised or we are closing anyway
+
+    async def _send_lane(self, send_func, recv_func, pending, progress):
+        """Keeps sending files from ``pending`` over ``send_func`` until nothing is left
+
+        Progress is reported into ``progress`` queue as (file index, bytes sent since last report)
+        """
+        while pending and not self.to_stop:
+            index = pending.popleft()
+            file_item = self.file_list[index]
+            await self._send_file_item(file_item, send_func)
+            await self._sync_resume_offset(file_item, send_func, recv_func)
+            last_seeked = file_item.seeked
+            try:
+                async with aclosing(send_actual_file(
+                        send_func,
+                        file_item,
+                        use_sendfile=self.use_sendfile,
+                        read_ahead=self.read_ahead,
+                        adaptive=self.adaptive_chunk_size,
+                        chunk_sizer=self._chunk_sizer(send_func, file_item),
+                )) as send_file:
+                    async for seeked in send_file:
+                        progress.put_nowait((index, seeked - last_seeked))
+                        last_seeked = seeked
+                        if self.to_stop:
+                            break
+            except Exception as exp:
+                self.handle_exception(exp)
+
+            if file_item.seeked >= file_item.size:
+                self._sent_indices.add(index)
 
     async def send_one_file(self, file_item):
         try:
@@ -71,6 +168,10 @@ class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, Abstrac
             async with aclosing(send_actual_file(
                     self.send_func,
                     file_item,
+                    use_sendfile=self.use_sendfile,
+                    read_ahead=self.read_ahead,
+                    adaptive=self.adaptive_chunk_size,
+                    chunk_sizer=self._chunk_sizer(self.send_func, file_item),
             )) as send_file:
                 async for seeked in send_file:
                     updater(seeked)
@@ -80,49 +181,127 @@ class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, Abstrac
         except Exception as exp:
             self.handle_exception(exp)
 
-    async def _send_file_item(self, file_item):
+    def _chunk_sizer(self, send_func, file_item):
+        """Chunk size learnt over a connection is carried over from file to file, see :class:`AdaptiveChunkSize`"""
+        if not self.adaptive_chunk_size:
+            return None
+        if send_func not in self._chunk_sizers:
+            self._chunk_sizers[send_func] = AdaptiveChunkSize(calculate_chunk_size(file_item.size))
+        return self._chunk_sizers[send_func]
+
+    async def _send_file_item(self, file_item, send_func=None):
+        send_func = send_func or self.send_func
         try:
-            # a signal that says there is more to receive
-            await self.send_func(b'\x01')
+            # a signal that says there is more to receive, followed by length prefixed file item
             file_object = bytes(file_item)
-            file_packet = struct.pack('!I', len(file_object)) + file_object
-            await self.send_func(file_packet)
+            await send_func.sendmsg((b'\x01', struct.pack('!I', len(file_object)), file_object))
         except Exception as exp:
             self.handle_exception(exp)
 
+    async def _sync_resume_offset(self, file_item, send_func=None, recv_func=None):
+        """Agrees upon the offset to send ``file_item`` from, with the other end
+
+        Other end replies to the file item with digests of blocks it already has (possibly from an earlier
+        transfer that got interrupted), those are compared against our file and offset
+        after the leading matching blocks is sent back, contents are sent from there
+
+        ``FileItem.seeked`` is set to the agreed offset
+        """
+        if not self.delta_resume or file_item.size <= 0:
+            return
+
+        send_func = send_func or self.send_func
+        recv_func = recv_func or self.recv_func
+        loop = asyncio.get_running_loop()
+        try:
+            signature_len = await use.recv_int(recv_func)
+            signature = await use.recv_exactly(recv_func, signature_len)
+            block_size, digests = await loop.run_in_executor(thread_pool_for_disk_io, serializer.loads, signature)
+            offset = 0
+            if digests and 0 < block_size <= file_item.size:
+                offset = await loop.run_in_executor(
+                    thread_pool_for_disk_io,
+                    matching_prefix, file_item.path, block_size, digests
+                )
+            await send_func(struct.pack('!Q', offset))
+        except (ValueError, TypeError, serializer.UnpackException) as exp:
+            self._raise_transfer_incomplete_and_change_state(exp, "unable to synchronize resume offset")
+        except Exception as exp:
+            self.handle_exception(exp)
+            raise
+        else:
+            if offset:
+                _logger.info(f"{self._log_prefix} other end has {offset} bytes of {file_item}, skipping them")
+            file_item.seeked = offset
+
     async def continue_transfer(self):
-        if not self.state == TransferState.PAUSED or self.to_stop is True:
+        """Sends remaining files of a paused transfer over the connection made again
+
+        Transfer might have been restored from journal (see :meth:`from_journal_record`),
+        so ``CONNECTING`` state (connection got made again) is also accepted
+        """
+        if self.state not in (TransferState.PAUSED, TransferState.CONNECTING) or self.to_stop is True:
             raise InvalidStateError(f"{self.state=}, {self.to_stop=}")
 
         _logger.debug(f'FILE[{self._file_id}] changing state to sending')
         self.state = TransferState.SENDING
         start_file = self.file_list[self._current_file_index]
 
-        # synchronizing last file sent
-        try:
-            start_file.seeked = await use.recv_int(self.recv_func, use.LONG_INT)
-        except ValueError as ve:
-            self._raise_transfer_incomplete_and_change_state(ve)
-        else:
-            self.status_updater.status_setup(f"resuming file:{start_file}", start_file.seeked, start_file.size)
+        # with delta resume, offset of every file is agreed upon before sending it, see _sync_resume_offset
+        if not self.delta_resume:
+            # synchronizing last file sent
+            try:
+                start_file.seeked = await use.recv_int(self.recv_func, use.LONG_INT)
+            except ValueError as ve:
+                self._raise_transfer_incomplete_and_change_state(ve)
+            else:
+                self.status_updater.status_setup(f"resuming file:{start_file}", start_file.seeked, start_file.size)
 
         # continuing with remaining transfer
         async with aclosing(self.send_files()) as file_sender:
             async for items in file_sender:
                 yield items
 
+    def journal_record(self):
+        """Snapshot of this transfer to persist in :class:`TransferJournal`, see :meth:`from_journal_record`"""
+        return {
+            'files': [[str(file_item.path), file_item.size, file_item.seeked] for file_item in self.file_list],
+            'sent': sorted(self._sent_indices),
+        }
+
+    @classmethod
+    def from_journal_record(cls, record, peer_obj, status_updater):
+        """Restores a transfer from its snapshot taken using :meth:`journal_record`
+
+        Restored transfer is in ``PAUSED`` state, ready to ``continue_transfer`` once connected
+        """
+        file_sender = cls(peer_obj, record['transfer_id'], [], status_updater)
+        file_sender.file_list = [FileItem(Path(path), seeked, size=size) for path, size, seeked in record['files']]
+        file_sender._sent_indices = set(record['sent'])
+        file_sender.state = TransferState.PAUSED
+        return file_sender
+
     def attach_files(self, paths_list):
         if self.state not in (TransferState.PAUSED, TransferState.SENDING):
             raise InvalidStateError(f"expected state to be {(TransferState.PAUSED, TransferState.SENDING)}, found {self.state=}")
 
         self.file_list.extend(FileItem(Path(path), 0) for path in paths_list)
 
+    def pause(self):
+        super().pause()
+        for send_func, recv_func in self.streams:
+            send_func.pause()
+            recv_func.pause()
+
     def resume(self):
         if self.state is not TransferState.PAUSED:
             return
         self.state = TransferState.SENDING
         self.recv_func.resume()
         self.send_func.resume()
+        for send_func, recv_func in self.streams:
+            send_func.resume()
+            recv_func.resume()
 
     async def cancel(self):
         if self.state not in (TransferState.SENDING, TransferState.PAUSED):
@@ -136,6 +315,11 @@ class Sender(CommonExceptionHandlersMixIn, PauseMixIn, CommonAExitMixIn, Abstrac
     def connection_made(self, sender, receiver):
         self.send_func = sender
         self.recv_func = receiver
+        self.streams = []
+
+    def stream_made(self, sender, receiver):
+        """Another connection for this transfer has arrived, files will be sent concurrently over it too"""
+        self.streams.append((sender, receiver))
 
     @property
     def id(self):
@@ -153,13 +337,21 @@ async def send_actual_file(
         chunk_len=None,
         timeout=10,
         th_pool=thread_pool_for_disk_io,
+        use_sendfile=True,
+        read_ahead=const.MAX_FILE_READ_AHEAD,
+        adaptive=True,
+        chunk_sizer=None,
 ):
     """Sends file to other end using ``send_function``
 
     Opens file in **rb** mode from the ``path`` attribute from ``file item``
     reads ``seeked`` attribute of ``file item`` to start the transfer from
+    if ``use_sendfile`` is set and ``send_function`` supports it, file is handed to the kernel (zero copy)
+    in chunks using ``send_function.sendfile``, falls back to reading mmap slices otherwise
+    while falling back, up to ``read_ahead`` chunks are read from disk in background while previous ones are sent
     calls ``send_function`` and awaits on it every time this function tries to send a chunk
     if chunk_size parameter is not provided then calculates chunk size by calling ``calculate_chunk_size``
+    and if ``adaptive`` is set, tunes it from there as chunks get sent (see :class:`AdaptiveChunkSize`)
 
     Args:
         send_function(Callable): function to call when a chunk is ready
@@ -167,12 +359,37 @@ async def send_actual_file(
         chunk_len(int): length of each chunk passed into ``send_function`` for each call
         timeout(int): timeout in seconds used to wait upon send_function
         th_pool(ThreadPoolExecutor): thread pool executor to use while reading the file
+        use_sendfile(bool): try zero copy sendfile before falling back to mmap
+        read_ahead(int): number of chunks to prefetch, 0 reads each chunk only when it is about to be sent
+        adaptive(bool): tune chunk size using send latency and throughput of ``send_function``
+        chunk_sizer(AdaptiveChunkSize): continue tuning from this one (learnt while sending previous files)
 
     Yields:
         number indicating the file size sent
     """
 
-    chunk_size = chunk_len or calculate_chunk_size(file.size)
+    if chunk_len or not adaptive:
+        chunk_size = AdaptiveChunkSize.fixed(chunk_len or calculate_chunk_size(file.size))
+    else:
+        chunk_size = chunk_sizer or AdaptiveChunkSize(calculate_chunk_size(file.size))
+
+    if use_sendfile and hasattr(send_function, 'sendfile'):
+        try:
+            async with aclosing(_sendfile_actual_file(
+                    send_function,
+                    file,
+                    chunk_size=chunk_size,
+                    timeout=timeout
+            )) as zero_copy_sender:
+                async for seek in zero_copy_sender:
+                    yield seek
+            return
+        except asyncio.SendfileNotAvailableError as snae:
+            _logger.debug(f"sendfile not available, falling back to mmap: {snae}")
+
+    if file.seeked >= file.size:
+        return
+
     with open(file.path, 'rb') as f:
         with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as f_mapped:
             seek = file.seeked
@@ -182,10 +399,111 @@ async def send_actual_file(
                 f_mapped.__getitem__
             )
 
-            for offset in range(seek, file.size, chunk_size):
-                chunk = await asyncify(slice(offset, offset + chunk_size))
+            spans = _spans(seek, file.size, chunk_size)
+            if read_ahead > 0:
+                chunks = _read_ahead(asyncify, spans, read_ahead)
+            else:
+                chunks = (await asyncify(slice(offset, offset + length)) for offset, length in spans)
+
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    # pauses and bandwidth limits can take longer than timeout, only the write is timed out
+                    shaped = await _shape(send_function, len(chunk))
+                    started = time.perf_counter()
+                    sending = send_function(chunk, shaped=True) if shaped else send_function(chunk)
+                    await asyncio.wait_for(sending, timeout)
+                    chunk_size.update(time.perf_counter() - started, getattr(send_function, 'rate', None))
+                    seek += len(chunk)
+                    file.seeked = seek
+                    yield seek
+
+            if seek < file.size:  # slices past the end of a truncated file come out short
+                raise TransferIncomplete(f"{file.path} got truncated underneath us, at {seek} of {file.size} bytes")
+
+
+async def _shape(send_function, nbytes):
+    """Awaits ``send_function.shape`` if it has one (see ``connect.Sender.shape``)
+
+    Returns:
+        whether ``send_function`` got shaped
+    """
+    if (shape := getattr(send_function, 'shape', None)) is None:
+        return False
+    await shape(nbytes)
+    return True
+
+
+def _spans(start, end, chunk_size):
+    """Yields (offset, length) of chunks from ``start`` to ``end``
+
+    ``chunk_size.size`` is read for every chunk, so chunk size can change in between
+    """
+    offset = start
+    while offset < end:
+        length = min(chunk_size.size, end - offset)
+        yield offset, length
+        offset += length
 
-                await asyncio.wait_for(send_function(chunk), timeout)
-                seek += len(chunk)
-                file.seeked = seek
-                yield seek
+
+async def _read_ahead(read, spans, depth):
+    """Reads chunks at ``spans`` in background keeping at most ``depth`` of them ready ahead of the consumer
+
+    Reading stops as soon as ``depth`` chunks are waiting, so a paused transfer (send function blocked)
+    holds only that many chunks in memory, closing this generator cancels background reading
+
+    Args:
+        read(Callable): async callable that returns bytes for a given slice
+        spans(Iterable[tuple[int, int]]): offset and length of each chunk to read
+        depth(int): number of chunks to keep ready
+
+    Yields:
+        chunks in the order of ``spans``
+    """
+    chunks = asyncio.Queue(maxsize=depth)
+
+    async def reader():
+        try:
+            for offset, length in spans:
+                await chunks.put(await read(slice(offset, offset + length)))
+        except Exception as exp:
+            await chunks.put(exp)
+        else:
+            await chunks.put(None)
+
+    reading = asyncio.create_task(reader())
+    try:
+        while (chunk := await chunks.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        reading.cancel()
+        await asyncio.gather(reading, return_exceptions=True)
+
+
+async def _sendfile_actual_file(send_function, file, *, chunk_size, timeout=10):
+    """Zero copy counterpart of :func:`send_actual_file`
+
+    File is still sent in chunks, so that progress can be reported and pause/cancel are honoured in between
+
+    Args:
+        chunk_size(AdaptiveChunkSize): size of chunks, updated as they get sent
+
+    Raises:
+        asyncio.SendfileNotAvailableError: before sending anything, if zero copy is not possible
+        TransferIncomplete: if file got shorter than ``file.size`` while sending
+    """
+
+    with open(file.path, 'rb') as f:
+        seek = file.seeked
+        while seek < file.size:
+            count = min(chunk_size.size, file.size - seek)
+            await send_function.shape(count)
+            started = time.perf_counter()
+            sent = await asyncio.wait_for(send_function.sendfile(f, seek, count, shaped=True), timeout)
+            if not sent:
+                raise TransferIncomplete(f"{file.path} got truncated underneath us, at {seek} of {file.size} bytes")
+            chunk_size.update(time.perf_counter() - started, send_function.rate)
+            seek += sent
+            file.seeked = seek
+            yield seek
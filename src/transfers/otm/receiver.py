@@ -5,9 +5,7 @@ from contextlib import ExitStack, asynccontextmanager
 from itertools import islice
 from typing import AsyncGenerator, BinaryIO
 
-import umsgpack
-
-from src.avails import OTMSession, const
+from src.avails import OTMSession, const, serializer
 from src.transfers.files._fileobject import FileItem
 from src.transfers.otm.relay import OTMFilesRelay
 
@@ -39,7 +37,7 @@ class FilesReceiver:
 
     def _load_files_metadata(self, file_data: bytes):
         # a list of bytes
-        loaded_data = umsgpack.loads(file_data)
+        loaded_data = serializer.loads(file_data)
         self.file_items = [
             FileItem.load_from(file_item, const.PATH_DOWNLOAD)
             for file_item in loaded_data
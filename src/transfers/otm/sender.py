@@ -2,9 +2,7 @@ import asyncio
 import mmap
 from pathlib import Path
 
-import umsgpack
-
-from src.avails import OTMSession, RemotePeer, WireData, const, use
+from src.avails import OTMSession, RemotePeer, WireData, const, serializer, use
 from src.core import get_this_remote_peer
 from src.transfers import HEADERS
 from src.transfers.files._fileobject import FileItem, calculate_chunk_size
@@ -103,7 +101,7 @@ class FilesSender:
         )
 
     def _make_file_metadata(self):
-        return umsgpack.dumps([bytes(x) for x in self.file_items])
+        return serializer.dumps([bytes(x) for x in self.file_items])
 
     @property
     def id(self):
@@ -142,7 +142,7 @@ class RumorMongerProtocol:
     def __forward_payload(self, message, peer_id):
         peer_obj = Dock.peer_list.get_peer(peer_id)
         if peer_obj is not None:
-            self.transport.sendto(bytes(message), peer_obj.req_uri)
+            self.transport.sendto(message.actual_data, peer_obj.req_uri)
             return peer_obj
 
     def gossip_message(self, message):
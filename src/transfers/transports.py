@@ -2,8 +2,8 @@ import struct
 from asyncio import BaseTransport
 from typing import override
 
-from src.avails import WireData
-from src.transfers import REQUESTS_HEADERS
+from src.avails import SEND_COMPACT, WireData, register_compact_header, speaks_compact
+from src.transfers import DISCOVERY, GOSSIP, HEADERS, REQUESTS_HEADERS
 
 
 class RequestsTransport(BaseTransport):  # just for type hinting
@@ -22,6 +22,8 @@ class RequestsTransport(BaseTransport):  # just for type hinting
     or:
         >>> RequestsTransport(transport, _event_trigger_header=b'\x23')  # noqa
 
+    WireData passed (instead of bytes) goes in compact framing to peers that negotiated it,
+    see ``wire.speaks_compact`` and ``wire.SEND_COMPACT``
     """
 
     __slots__ = 'transport', 'trigger'
@@ -32,7 +34,10 @@ class RequestsTransport(BaseTransport):  # just for type hinting
         self.transport = transport
         self.trigger = self._trigger or _event_trigger_header
 
-    def sendto(self, data: bytes, addr: tuple = None):
+    def sendto(self, data: bytes | WireData, addr: tuple = None):
+        if SEND_COMPACT and isinstance(data, WireData) and addr and speaks_compact(addr):
+            if (compact := data.compact()) is not None:
+                return self.transport.sendto(self._trigger + compact, addr)
         data_size = struct.pack('!I', len(req_data_in_bytes := bytes(data)))
         data_to_send = self._trigger + data_size + req_data_in_bytes
         return self.transport.sendto(data_to_send, addr)
@@ -47,7 +52,7 @@ class KademliaTransport(RequestsTransport):
 
     @override
     def sendto(self, data: bytes, addr: tuple[str, int] = None):
-        formatted = bytes(WireData(data=data))
+        formatted = WireData(data=data)
         return super().sendto(formatted, addr)
 
 
@@ -59,3 +64,17 @@ class DiscoveryTransport(RequestsTransport):
 class GossipTransport(RequestsTransport):
     __slots__ = ()
     _trigger = REQUESTS_HEADERS.GOSSIP
+
+
+# codes are part of the wire format, never reorder or reuse them
+for _code, _header in enumerate((
+        None,  # kademlia
+        DISCOVERY.NETWORK_FIND,
+        DISCOVERY.NETWORK_FIND_REPLY,
+        GOSSIP.MESSAGE,
+        GOSSIP.SEARCH_REQ,
+        GOSSIP.SEARCH_REPLY,
+        GOSSIP.CREATE_SESSION,
+        HEADERS.REMOVAL_PING,
+)):
+    register_compact_header(_code, _header)
@@ -1,9 +1,9 @@
 import traceback
 from pathlib import Path
 
-from src.avails import BaseDispatcher, DataWeaver, Wire, WireData
-from src.core import Dock, get_this_remote_peer, peers
-from src.core.connector import Connector
+from src.avails import BaseDispatcher, DataWeaver, WireData
+from src.core import Dock, bandwidth, get_this_remote_peer, peers
+from src.core.connector import Connector, PRIORITY
 from src.managers import directorymanager, filemanager
 from src.transfers import HEADERS
 from src.webpage_handlers import logger
@@ -27,6 +27,7 @@ class FrontEndDataDispatcher(BaseDispatcher):
                 HANDLE.SEND_TEXT: send_text,
                 HANDLE.SEND_FILE_TO_MULTIPLE_PEERS: send_files_to_multiple_peers,
                 HANDLE.SEND_DIR_TO_MULTIPLE_PEERS: send_dir_to_multiple_peers,
+                HANDLE.CONTINUE_FILE_TRANSFER: continue_file_transfer,
             }
         )
 
@@ -64,20 +65,31 @@ async def send_file(command_data: DataWeaver):
         # page_handle.dispatch_data(DataWeaver)
 
 
+async def continue_file_transfer(command_data: DataWeaver):
+    transfer_id = command_data.content['transfer_id']
+    continue_files = filemanager.continue_files_to_peer(command_data.peer_id, transfer_id)
+    try:
+        async with continue_files as sender:
+            logger.debug(f"continuing file transfer {transfer_id=} with {sender}")
+    except OSError as e:
+        logger.error(f"failed to continue file transfer {transfer_id=}", exc_info=e)
+
+
 async def send_text(command_data: DataWeaver):
     peer_obj = await peers.get_remote_peer_at_every_cost(command_data.peer_id)
 
     if peer_obj is None:
         return  # send data to page that peer is not reachable
 
-    connection = await Connector.get_connection(peer_obj)
     data = WireData(
         header=HEADERS.CMD_TEXT,
         msg_id=get_this_remote_peer().peer_id,
         message=command_data.content,
     )
     # :todo: wrap around with try except, signal page status update
-    await Wire.send_async(connection, bytes(data))
+    data = bytes(data)
+    bandwidth.interactive_sent(len(data))
+    await Connector.send(peer_obj, data, PRIORITY.INTERACTIVE)
 
 
 async def send_files_to_multiple_peers(command_data: DataWeaver):
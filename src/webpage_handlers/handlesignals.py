@@ -1,5 +1,5 @@
-from src.avails import BaseDispatcher, DataWeaver
-from src.core import Dock, peers
+from src.avails import BaseDispatcher, DataWeaver, const
+from src.core import Dock, bandwidth, peers
 from src.managers.statemanager import State
 from src.webpage_handlers import logger, webpage
 from src.webpage_handlers.handleprofiles import (
@@ -29,6 +29,7 @@ class FrontEndSignalDispatcher(BaseDispatcher):
             HANDLE.SET_PROFILE: set_selected_profile,
             HANDLE.SEARCH_FOR_NAME: search_for_user,
             HANDLE.SEND_PEER_LIST: send_list,
+            HANDLE.SET_BANDWIDTH_LIMIT: set_bandwidth_limit,
         })
 
 
@@ -47,7 +48,9 @@ async def close_app():
 async def search_for_user(data: DataWeaver):
     search_string = data["searchPeerInNetwork"]
     print("got a search request", search_string)
-    peer_list = await peers.search_for_nodes_with_name(search_string)
+    peer_list = [
+        peer async for peer in peers.search_for_nodes_with_name(search_string, const.MAX_SEARCH_RESULTS)
+    ]
     print("sending list", peer_list)
     await webpage.search_response(data.msg_id, peer_list)
 
@@ -59,6 +62,13 @@ async def send_list(data: DataWeaver):
     await webpage.search_response(data.msg_id, peer_list)
 
 
+async def set_bandwidth_limit(data: DataWeaver):
+    """Content is ``{"limit": KB/s, "peerId": <optional>}``, limit of 0 removes the limit,
+    whole node is limited if peerId is not given
+    """
+    bandwidth.set_limit(float(data.content['limit']), data.content.get('peerId'))
+
+
 async def connect_peer(handle_data: DataWeaver): ...
 
 
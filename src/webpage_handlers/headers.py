@@ -25,6 +25,7 @@ class HANDLE(enum.StrEnum):
     SET_PROFILE = "1set selected profile"
     TRANSFER_UPDATE = "1transfer update"
     FAILED_TO_REACH = "1failed to reach"
+    SET_BANDWIDTH_LIMIT = "1set bandwidth limit"
 
     REQ_PEER_NAME_FOR_DISCOVERY = '1get a peer name for discovery'
     SEND_DIR = "0send_a_directory"
@@ -32,6 +33,7 @@ class HANDLE(enum.StrEnum):
     SEND_TEXT = "0send_text"
     SEND_FILE_TO_MULTIPLE_PEERS = "0send_file_to_multiple_peers"
     SEND_DIR_TO_MULTIPLE_PEERS = "0send_dir_to_multiple_peers"
+    CONTINUE_FILE_TRANSFER = "0continue_file_transfer"
     REQ_FOR_FILE_TRANSFER = "0a file recv request has been arrived"
 
 
@@ -62,5 +64,7 @@ if TYPE_CHECKING:
     SEND_TEXT = "0send_text"
     SEND_FILE_TO_MULTIPLE_PEERS = "0send_file_to_multiple_peers"
     SEND_DIR_TO_MULTIPLE_PEERS = "0send_dir_to_multiple_peers"
+    CONTINUE_FILE_TRANSFER = "0continue_file_transfer"
     REQ_FOR_FILE_TRANSFER = "0a file recv request has been arrived"
     FAILED_TO_REACH = "1failed to reach"
+    SET_BANDWIDTH_LIMIT = "1set bandwidth limit"
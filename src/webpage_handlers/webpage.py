@@ -52,14 +52,19 @@ async def transfer_confirmation(peer_id, transfer_id, confirmation):
     )
 
 
-async def transfer_update(peer_id, transfer_id, file_item):
+async def transfer_update(peer_id, transfer_id, file_item, total=None):
+    content = {
+        'item_path': str(file_item.path),
+        'received': file_item.seeked,
+        'transfer_id': transfer_id,
+    }
+    if total is not None:
+        # progress of whole transfer, (bytes received so far, bytes expected)
+        content['total_received'], content['total_size'] = total
+
     status_update = DataWeaver(
         header=headers.TRANSFER_UPDATE,
-        content={
-            'item_path': str(file_item.path),
-            'received': file_item.seeked,
-            'transfer_id': transfer_id,
-        },
+        content=content,
         peer_id=peer_id,
     )
     front_end_data_dispatcher(status_update)
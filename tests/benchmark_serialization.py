@@ -0,0 +1,168 @@
+"""
+Micro-benchmarks serialization of wire formats
+
+Round trips (dump and load) ``WireData`` (msgpack and compact framing), ``RemotePeer.serialized``,
+``FileItem.__bytes__`` and ``GossipMessage`` with every serializer backend (``src.avails.serializer``),
+each backend runs in a fresh interpreter because the backend is picked at import time
+(``umsgpack`` is forced by hiding ``msgpack``), prints a json report to stdout (or ``--output``)
+
+Reported per case and backend:
+    dumps_us        microseconds per serialization
+    loads_us        microseconds per de-serialization
+    round_trip_us   sum of both
+    size            bytes on the wire, same for every backend
+
+Usage:
+    python benchmark_serialization.py [--number N] [--repeat N] [--output report.json]
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+_RESULT_MARKER = "BENCHMARK RESULT "
+BACKENDS = ('msgpack', 'umsgpack')
+
+
+def make_cases():
+    """
+    Returns:
+        dict of name: (dump callable, load callable taking dumped bytes)
+    """
+    import _path  # noqa
+    from src.avails import GossipMessage, RemotePeer, WireData, unpack_datagram
+    from src.transfers import GOSSIP
+    from src.transfers.files._fileobject import FileItem
+    import src.transfers.transports  # noqa, registers compact headers
+
+    peer = RemotePeer(bytes(range(20)), 'benchmark-user', '192.168.1.10', 3485, 3486, RemotePeer.ONLINE)
+
+    def peer_serialized():
+        peer._byte_cache = None, None  # serialized caches, measure serialization itself
+        return peer.serialized
+
+    kademlia_packet = WireData(data=bytes(320))
+    gossip = GossipMessage()
+    gossip.header = GOSSIP.MESSAGE
+    gossip.id = '5f0c3e0e-8d4b-4f7e-9a57-0c2f3d7a9b11'  # same in every child, dumped bytes are compared
+    gossip.message = 'hello from benchmark ' * 4
+    gossip.ttl = 4
+    gossip.created = 1700000000.123
+
+    file_item = FileItem(Path('some directory', 'a file with a long enough name.tar.gz'), 1024, size=2 ** 33)
+
+    return {
+        'wiredata_kademlia': (
+            lambda: bytes(kademlia_packet),
+            WireData.load_from,
+        ),
+        'wiredata_kademlia_compact': (
+            kademlia_packet.compact,
+            unpack_datagram,
+        ),
+        'remotepeer_serialized': (
+            peer_serialized,
+            RemotePeer.load_from,
+        ),
+        'fileitem_bytes': (
+            lambda: bytes(file_item),
+            lambda data: FileItem.load_from(data, 'downloads'),
+        ),
+        'gossipmessage': (
+            lambda: bytes(gossip),
+            lambda data: GossipMessage(WireData.load_from(data)),
+        ),
+        'gossipmessage_compact': (
+            gossip.actual_data.compact,
+            lambda data: GossipMessage(unpack_datagram(data)),
+        ),
+    }
+
+
+def run_backend(backend, number, repeat):
+    """Runs in child process"""
+    if backend == 'umsgpack':
+        sys.modules['msgpack'] = None  # makes ``import msgpack`` fail, serializer falls back
+
+    import _path  # noqa
+    from src.avails import serializer
+    if serializer.BACKEND != backend:
+        return {'backend': backend, 'error': f"{backend} is not installed"}
+
+    results = {}
+    for name, (dump, load) in make_cases().items():
+        dumped = dump()
+        dumps_us = min(timeit.repeat(dump, number=number, repeat=repeat)) / number * 1e6
+        loads_us = min(timeit.repeat(lambda: load(dumped), number=number, repeat=repeat)) / number * 1e6
+        results[name] = {
+            'dumps_us': round(dumps_us, 3),
+            'loads_us': round(loads_us, 3),
+            'round_trip_us': round(dumps_us + loads_us, 3),
+            'size': len(dumped),
+            'dumped': dumped.hex(),
+        }
+    return {'backend': backend, 'results': results}
+
+
+def _spawn(backend, number, repeat):
+    completed = subprocess.run(
+        [sys.executable, __file__, '--child', backend, '--number', str(number), '--repeat', str(repeat)],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(_RESULT_MARKER):
+            return json.loads(line.removeprefix(_RESULT_MARKER))
+    return {'backend': backend, 'error': completed.stderr.strip().splitlines()[-1:] or completed.returncode}
+
+
+def _check_same_bytes(reports):
+    """Every backend has to put the same bytes on the wire, ``dumped`` is dropped from report after checking"""
+    finished = [report for report in reports if 'results' in report]
+    for report in finished:
+        for name, result in report['results'].items():
+            dumped = result.pop('dumped')
+            for other in finished:
+                other_dumped = other['results'][name].get('dumped')
+                if other_dumped is not None and other_dumped != dumped:
+                    raise AssertionError(f"{name} differs in between {report['backend']} and {other['backend']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=20000, help="calls per timing")
+    parser.add_argument('--repeat', type=int, default=5, help="timings per case, fastest is reported")
+    parser.add_argument('--output', type=Path, help="write report here instead of stdout")
+    parser.add_argument('--child', choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(_RESULT_MARKER + json.dumps(run_backend(args.child, args.number, args.repeat)))
+        return
+
+    reports = [_spawn(backend, args.number, args.repeat) for backend in BACKENDS]
+    _check_same_bytes(reports)
+    for report in reports:
+        for name, result in report.get('results', {}).items():
+            print(f"{report['backend']:<10} {name:<28} {result['round_trip_us']:>9.2f} us", file=sys.stderr)
+
+    dumped = json.dumps({
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'number': args.number,
+        'repeat': args.repeat,
+        'backends': reports,
+    }, indent=2)
+    if args.output:
+        args.output.write_text(dumped)
+    else:
+        print(dumped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+Benchmarks the file transfer hot path over loopback
+
+Runs ``files.Sender`` against ``files.Receiver`` and ``DirSender`` against ``DirReceiver`` over a loopback TCP
+connection for a matrix of file counts, file sizes and chunk sizes (``calculate_chunk_size`` overridden),
+every run happens in a fresh interpreter so that peak RSS belongs to that run alone,
+prints a json report to stdout (or ``--output``), so that it can be diffed against a previous version
+
+Reported per run:
+    throughput_mbps         MB (2**20 bytes) moved per second of wall time
+    cpu_seconds             process CPU time (sender, receiver and disk io threads together)
+    peak_rss_kb             peak resident set size of the process, null where ``resource`` is unavailable
+    gc_gen0_per_mb          generation 0 garbage collections per MB, each one happens after roughly
+                            ``gc.get_threshold()[0]`` container allocations (net), a cheap proxy of allocation churn
+    tracemalloc_peak_kb     peak of memory allocated by python while transferring, measured in a second transfer
+                            with ``tracemalloc`` on (python does not count allocations cumulatively, this and
+                            ``gc_gen0_per_mb`` are what can be measured)
+    tracemalloc_peak_per_mb tracemalloc_peak_kb per MB transferred
+
+Transfer status is not rendered (a no-op status updater is used), so that progress bars do not add up to the numbers
+
+OTM ``FilesSender`` is not benchmarked here, it needs a palm tree formed over gossip between live peers,
+use otmfiles.py for that
+
+Usage:
+    python benchmark_transfers.py [--quick] [--repeat N] [--verify] [--only NAME ...] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import aclosing
+from pathlib import Path
+from types import SimpleNamespace
+
+import _path  # noqa
+from src.avails import connect, const
+from src.transfers import files
+from src.transfers.files import receiver as receiver_module, sender as sender_module
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+MB = 2 ** 20
+KB = 2 ** 10
+
+# (kind, file count, file size)
+SHAPES = (
+    ('files', 1, 256 * MB),
+    ('files', 16, 16 * MB),
+    ('files', 256, 256 * KB),
+    ('dir', 2000, 4 * KB),
+    ('dir', 32, 8 * MB),
+)
+# None keeps chunk sizing as it is (adaptive), others fix the chunk size to that
+CHUNK_SIZES = (None, 64 * KB, MB, 4 * MB)
+QUICK_DIVISOR = 16
+
+_RESULT_MARKER = "BENCHMARK RESULT "
+
+
+class _NoStatus:
+    def status_setup(self, *args, **kwargs): ...
+
+    def update_status(self, *args): ...
+
+
+def _case_name(kind, count, size, chunk_size):
+    chunk = 'default' if chunk_size is None else f"{chunk_size // KB}KB"
+    return f"{kind}-{count}x{size // KB}KB-chunk_{chunk}"
+
+
+def make_cases(quick=False):
+    cases = []
+    for kind, count, size in SHAPES:
+        if quick:
+            size = max(KB, size // QUICK_DIVISOR)
+        for chunk_size in CHUNK_SIZES:
+            cases.append({
+                'name': _case_name(kind, count, size, chunk_size),
+                'kind': kind,
+                'count': count,
+                'size': size,
+                'chunk_size': chunk_size,
+            })
+    return cases
+
+
+def make_dataset(root, kind, count, size):
+    """Writes ``count`` files of ``size`` random bytes, spread into a few directories for ``dir`` kind
+
+    Returns:
+        list of file paths for ``files`` kind, directory to send for ``dir`` kind
+    """
+    source = Path(root, f"{kind}-{count}x{size}")
+    if source.exists():
+        return _dataset_of(source, kind)
+
+    source.mkdir(parents=True)
+    for index in range(count):
+        parent = source / f"d{index % 8}" / f"s{index % 3}" if kind == 'dir' else source
+        parent.mkdir(parents=True, exist_ok=True)
+        (parent / f"f{index}.bin").write_bytes(os.urandom(size))
+    return _dataset_of(source, kind)
+
+
+def _dataset_of(source, kind):
+    if kind == 'dir':
+        return source
+    return sorted(source.iterdir())
+
+
+def _loopback_pair(loop):
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        one = socket.create_connection(server.getsockname())
+        other, _ = server.accept()
+
+    pair = []
+    for sock in (one, other):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        wrapped = connect.Socket(fileno=sock.detach())
+        wrapped.setblocking(False)
+        wrapped.set_loop(loop)
+        pair.append(wrapped)
+    return pair
+
+
+async def _transfer(kind, source, destination):
+    loop = asyncio.get_running_loop()
+    sending_end, receiving_end = _loopback_pair(loop)
+    peer = SimpleNamespace(peer_id='benchmark')
+
+    if kind == 'dir':
+        destination = destination / source.name
+        destination.mkdir()
+        sender = files.DirSender(peer, '0', source, _NoStatus())
+        receiver = files.DirReceiver(peer, '0', destination, _NoStatus())
+    else:
+        sender = files.Sender(peer, '0', source, _NoStatus())
+        receiver = files.Receiver(peer, '0', destination, _NoStatus())
+
+    sender.connection_made(connect.Sender(sending_end), connect.Receiver(sending_end))
+    receiver.connection_made(connect.Sender(receiving_end), connect.Receiver(receiving_end))
+
+    async def drain(transfer):
+        async with aclosing(transfer) as loop_:
+            async for _ in loop_:
+                pass
+
+    with sending_end, receiving_end:
+        await asyncio.gather(drain(sender.send_files()), drain(receiver.recv_files()))
+
+
+def _verify(kind, source, destination, content):
+    sources = sorted(source.rglob('*')) if kind == 'dir' else source
+    root = source if kind == 'dir' else source[0].parent
+    destination = destination / source.name if kind == 'dir' else destination
+    for path in sources:
+        if path.is_dir():
+            continue
+        received = destination / path.relative_to(root)
+        if received.stat().st_size != path.stat().st_size:
+            raise AssertionError(f"size mismatch for {received}")
+        if content and received.read_bytes() != path.read_bytes():
+            raise AssertionError(f"content mismatch for {received}")
+
+
+def _override_chunk_size(chunk_size):
+    if chunk_size is None:
+        return
+
+    def fixed_chunk_size(*_, **__):
+        return chunk_size
+
+    sender_module.calculate_chunk_size = fixed_chunk_size
+    receiver_module.calculate_chunk_size = fixed_chunk_size
+    files.Sender.adaptive_chunk_size = False
+    files.Receiver.adaptive_chunk_size = False
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // KB if sys.platform == 'darwin' else peak  # darwin reports bytes
+
+
+def run_case(case, source, verify):
+    """Runs in child process, transfers ``source`` twice: timed and with ``tracemalloc`` on"""
+    _override_chunk_size(case['chunk_size'])
+    kind = case['kind']
+    total_mb = case['count'] * case['size'] / MB
+
+    with tempfile.TemporaryDirectory(prefix='pc-bench-') as scratch:
+        timed_destination = Path(scratch, 'timed')
+        traced_destination = Path(scratch, 'traced')
+        timed_destination.mkdir()
+        traced_destination.mkdir()
+
+        # transfer code has debug prints
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            gc.collect()
+            gen0_before = gc.get_stats()[0]['collections']
+            cpu_before = time.process_time()
+            wall_before = time.perf_counter()
+            asyncio.run(_transfer(kind, source, timed_destination))
+            wall = time.perf_counter() - wall_before
+            cpu = time.process_time() - cpu_before
+            gen0 = gc.get_stats()[0]['collections'] - gen0_before
+            peak_rss_kb = _peak_rss_kb()
+
+            tracemalloc.start()
+            asyncio.run(_transfer(kind, source, traced_destination))
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        _verify(kind, source, timed_destination, content=verify)
+
+    return {
+        **case,
+        'bytes': case['count'] * case['size'],
+        'wall_seconds': round(wall, 4),
+        'throughput_mbps': round(total_mb / wall, 2),
+        'cpu_seconds': round(cpu, 4),
+        'peak_rss_kb': peak_rss_kb,
+        'gc_gen0_per_mb': round(gen0 / total_mb, 4),
+        'gc_gen0_threshold': gc.get_threshold()[0],
+        'tracemalloc_peak_kb': round(traced_peak / KB, 1),
+        'tracemalloc_peak_per_mb': round(traced_peak / KB / total_mb, 3),
+    }
+
+
+def _spawn(case, source, verify):
+    command = [sys.executable, __file__, '--child', json.dumps({'case': case, 'source': str(source)})]
+    if verify:
+        command.append('--verify')
+    completed = subprocess.run(
+        command,
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(_RESULT_MARKER):
+            return json.loads(line.removeprefix(_RESULT_MARKER))
+    return {**case, 'error': completed.stderr.strip().splitlines()[-1:] or f"exit code {completed.returncode}"}
+
+
+def _summary(runs):
+    ok = [run for run in runs if 'error' not in run]
+    if not ok:
+        return runs[0]
+
+    summary = dict(ok[0])
+    for key in ('wall_seconds', 'throughput_mbps', 'cpu_seconds', 'gc_gen0_per_mb', 'tracemalloc_peak_kb',
+                'tracemalloc_peak_per_mb'):
+        summary[key] = statistics.median(run[key] for run in ok)
+    if all(run['peak_rss_kb'] is not None for run in ok):
+        summary['peak_rss_kb'] = max(run['peak_rss_kb'] for run in ok)
+    summary['runs'] = len(ok)
+    summary['failed_runs'] = len(runs) - len(ok)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--quick', action='store_true', help=f"divide file sizes by {QUICK_DIVISOR}")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, medians are reported")
+    parser.add_argument('--verify', action='store_true', help="compare contents of received files too")
+    parser.add_argument('--only', nargs='*', default=(), help="run cases whose name contains any of these")
+    parser.add_argument('--output', type=Path, help="write report here instead of stdout")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child = json.loads(args.child)
+        source = Path(child['source'])
+        if child['case']['kind'] == 'files':
+            source = _dataset_of(source, 'files')
+        print(_RESULT_MARKER + json.dumps(run_case(child['case'], source, args.verify)))
+        return
+
+    cases = [
+        case for case in make_cases(args.quick)
+        if not args.only or any(part in case['name'] for part in args.only)
+    ]
+    data_root = Path(tempfile.mkdtemp(prefix='pc-bench-data-'))
+    results = []
+    try:
+        for case in cases:
+            dataset = make_dataset(data_root, case['kind'], case['count'], case['size'])
+            source = dataset if case['kind'] == 'dir' else dataset[0].parent
+            runs = [_spawn(case, source, args.verify) for _ in range(args.repeat)]
+            results.append(_summary(runs))
+            print(f"{case['name']:<40} {results[-1].get('throughput_mbps', 'failed')} MB/s", file=sys.stderr)
+    finally:
+        shutil.rmtree(data_root, ignore_errors=True)
+
+    report = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'versions': const.VERSIONS,
+        'quick': args.quick,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    dumped = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(dumped)
+    else:
+        print(dumped)
+
+
+if __name__ == '__main__':
+    main()